@@ -0,0 +1,189 @@
+import argparse
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.util import Finalize
+
+import pvgis
+import pvgis_cache
+from proposal_graph import HORIZON_MONTHS, ProposalGraph
+
+
+IN_FLIGHT_PER_WORKER = 4
+""" records submitted ahead per worker, enough to keep every worker busy while results are written """
+
+
+class Checkpoint:
+    """
+    Journal of the records a batch has finished, one record number per line, so a stopped run can pick up where it was.
+
+    Records finish out of order, but never more than the in flight limit apart, so only a watermark (every record up to
+    it is done) and the few finished records past it are kept in memory, however long the input.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermark = 0
+        """ every record up to and including this one is done """
+        self._ahead = set()
+
+        if os.path.exists(path):
+            with open(path, "r") as journal:
+                for line in journal:
+                    if line.strip():
+                        self._add(int(line))
+
+        self._journal = open(path, "a")
+
+    def _add(self, record: int):
+        if record > self.watermark:
+            self._ahead.add(record)
+        while self.watermark + 1 in self._ahead:
+            self.watermark += 1
+            self._ahead.remove(self.watermark)
+
+    def __contains__(self, record: int) -> bool:
+        return record <= self.watermark or record in self._ahead
+
+    def mark(self, record: int):
+        """Record as done, written through so a crash right after loses nothing."""
+        self._journal.write(f"{record}\n")
+        self._journal.flush()
+        self._add(record)
+
+    def close(self):
+        self._journal.close()
+
+
+def _init_worker(workers: int):
+    # every process gets its own token bucket, together they have to stay under the PVGIS rate limit
+    pvgis.RATE_LIMITER = pvgis.TokenBucket(pvgis.RATE_LIMIT / workers, max(1, pvgis.RATE_BURST // workers))
+
+    # and its own connection to the cache file (a forked one would share the parent's), plus a fresh client on it
+    pvgis_cache._default_cache = pvgis_cache.PVGISCache()
+    pvgis._default_client = None
+    pvgis._clients = {}
+    # pool workers leave through os._exit, which skips atexit, this still writes back their last hits
+    Finalize(pvgis_cache._default_cache, pvgis_cache._default_cache.close, exitpriority=10)
+
+
+def _compute(record: int, line: str, hourly_self_consumption: bool, horizon_months: int) -> tuple:
+    """(record, project_id, output_data, error) of one JSONL line, runs in a worker process."""
+    project_id = None
+    try:
+        data = json.loads(line)
+        project_id = data.get("project_id")
+        output_data = ProposalGraph(data, hourly_self_consumption, horizon_months=horizon_months).get("output_data")
+        return record, project_id, output_data, None
+    except Exception as e:
+        return record, project_id, None, f"{type(e).__name__}: {e}"
+
+
+def _open_for_append(path: str):
+    """Open a JSONL file to append to, dropping a last line a killed run left half written."""
+    if os.path.exists(path):
+        with open(path, "rb+") as file:
+            size = file.seek(0, os.SEEK_END)
+            tail = b""
+            while size and b"\n" not in tail:
+                start = max(0, size - len(tail) - 65536)
+                file.seek(start)
+                tail = file.read(size - start)
+                if start == 0:
+                    break
+            if tail and not tail.endswith(b"\n"):
+                file.truncate(size - len(tail) + tail.rfind(b"\n") + 1)
+    return open(path, "a", encoding="utf-8")
+
+
+def _records(path: str):
+    """(record, line) of every input line, blank ones included, record numbers are line numbers counting from 1."""
+    with open(path, "r", encoding="utf-8") as file:
+        yield from enumerate(file, start=1)
+
+
+def run_batch(input_path: str, output_path: str, errors_path: str = None, journal_path: str = None, workers: int = None,
+              max_in_flight: int = None, hourly_self_consumption: bool = False, horizon_months: int = HORIZON_MONTHS) -> dict:
+    """
+    Compute a proposal for every input_json record of a JSONL file, on a pool of processes.
+
+    Records are read as they're needed and results written as they finish, so memory doesn't depend on the input size.
+    A record that fails goes to the errors file and the batch carries on. Running the same batch again skips
+    every record the journal has, finished or failed, and appends to the same output files.
+
+    Args:
+        input_path (str): one input_json (see main.py) per line
+        output_path (str): one {"record", "project_id", "output_data"} per line, in the order records finish
+        errors_path (str): one {"record", "project_id", "error"} per line, defaults to output_path + '.errors'
+        journal_path (str): checkpoint journal, defaults to output_path + '.journal'
+        workers (int): processes, defaults to the number of CPUs
+        max_in_flight (int): records submitted and not yet written, defaults to IN_FLIGHT_PER_WORKER per worker
+        hourly_self_consumption (bool): see main()
+        horizon_months (int): see ProposalGraph
+
+    Returns:
+        dict: how many records were 'done', 'failed' and 'skipped' (already in the journal)
+    """
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers * IN_FLIGHT_PER_WORKER
+    errors_path = errors_path or output_path + ".errors"
+    journal_path = journal_path or output_path + ".journal"
+
+    checkpoint = Checkpoint(journal_path)
+    counts = {"done": 0, "failed": 0, "skipped": 0}
+
+    with _open_for_append(output_path) as output, _open_for_append(errors_path) as errors, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,)) as pool:
+
+        def write(future):
+            record, project_id, output_data, error = future.result()
+            if error is None:
+                output.write(json.dumps({"record": record, "project_id": project_id, "output_data": output_data}) + "\n")
+                output.flush()
+                counts["done"] += 1
+            else:
+                errors.write(json.dumps({"record": record, "project_id": project_id, "error": error}) + "\n")
+                errors.flush()
+                counts["failed"] += 1
+            # journaled only once the result is on disk, a crash in between computes the record again
+            checkpoint.mark(record)
+
+        pending = set()
+        try:
+            for record, line in _records(input_path):
+                if record in checkpoint:
+                    counts["skipped"] += bool(line.strip())
+                    continue
+                if not line.strip():
+                    # nothing to compute, but journaled all the same so the watermark moves past it
+                    checkpoint.mark(record)
+                    continue
+                if len(pending) >= max_in_flight:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        write(future)
+                pending.add(pool.submit(_compute, record, line, hourly_self_consumption, horizon_months))
+
+            for future in wait(pending).done:
+                write(future)
+        finally:
+            checkpoint.close()
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute proposals for a JSONL file of input_json records")
+    parser.add_argument("input", help="JSONL file, one input_json per line")
+    parser.add_argument("output", help="JSONL file the output_data records are appended to")
+    parser.add_argument("--errors", default=None, help="defaults to OUTPUT.errors")
+    parser.add_argument("--journal", default=None, help="checkpoint journal, defaults to OUTPUT.journal")
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to the CPU count")
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--hourly-self-consumption", action="store_true")
+    parser.add_argument("--horizon-months", type=int, default=HORIZON_MONTHS)
+    args = parser.parse_args()
+
+    counts = run_batch(args.input, args.output, args.errors, args.journal, args.workers, args.max_in_flight,
+                       args.hourly_self_consumption, args.horizon_months)
+    print(f"{counts['done']} done, {counts['failed']} failed, {counts['skipped']} skipped (already in the journal)")
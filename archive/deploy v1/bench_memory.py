@@ -0,0 +1,99 @@
+import argparse
+import functools
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from bill_table import solar_bill_table, ubill_table
+from production import MonthlyValues
+from tariff import load_tariff
+from ubill import SolarBill, Ubill
+
+
+def _customer(n: int) -> tuple:
+    """Made up but plausible monthly usage and production of customer n."""
+    rng = np.random.default_rng(n)
+    usage = rng.integers(300, 1800, 12)
+    production = np.array([393, 543, 843, 1009, 1162, 1209, 1301, 1223, 930, 693, 418, 328]) * rng.uniform(0.3, 1.5)
+    return usage, production
+
+
+def _with_dict(cls) -> type:
+    """
+    The same class with a per object __dict__ instead of __slots__, the bills as they were before they got slots.
+
+    A subclass would still keep every slotted attribute in its slots, so the class is rebuilt from its methods.
+    """
+    namespace = {name: value for name, value in vars(cls).items() if name not in cls.__slots__ and name != "__slots__"}
+    return type(cls.__name__, (), namespace)
+
+
+DictUbill = _with_dict(Ubill)
+DictSolarBill = _with_dict(SolarBill)
+
+
+def as_objects(usage, production, months: int, tariff, ubill=Ubill, solar_bill=SolarBill) -> tuple:
+    """
+    What main() used to keep per proposal: the month dict of Production and a bill object per month.
+
+    Args:
+        ubill, solar_bill: the bill classes, DictUbill and DictSolarBill for the bills as they were before __slots__
+    """
+    month_values = {month: float(production[month - 1]) for month in range(1, 13)}
+    monthly_ubills = {}
+    monthly_solar_bills = {}
+    excess = 0
+    for i in range(1, months + 1):
+        month = i % 12 if i % 12 != 0 else 12
+        year = (i - 1) // 12
+        monthly_ubills[i] = ubill(month, year, usage[month - 1], 0.9, tariff=tariff)
+        monthly_solar_bills[i] = solar_bill(month, year, usage[month - 1], month_values[month], excess, 0.9, tariff=tariff)
+        excess = monthly_solar_bills[i].excessForNextMonth
+    return month_values, monthly_ubills, monthly_solar_bills
+
+
+def as_tables(usage, production, months: int, tariff) -> tuple:
+    month_values = MonthlyValues(production)
+    return month_values, ubill_table(usage, 0.9, months=months, tariff=tariff), solar_bill_table(usage, month_values.array, 0.9, months=months, tariff=tariff)
+
+
+def measure(build, proposals: int, months: int) -> tuple:
+    """(bytes per proposal, seconds per proposal) of keeping what build() returns for every proposal."""
+    tariff = load_tariff()
+    customers = [_customer(n) for n in range(proposals)]
+    gc.collect()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [build(usage, production, months, tariff) for usage, production in customers]
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del kept
+    return size / proposals, elapsed / proposals
+
+
+def run(proposals: int, months: int):
+    """Memory of holding many proposals' bills and production: dict-backed objects, slotted objects and columnar tables."""
+    dict_size, dict_time = measure(functools.partial(as_objects, ubill=DictUbill, solar_bill=DictSolarBill), proposals, months)
+    objects_size, objects_time = measure(as_objects, proposals, months)
+    tables_size, tables_time = measure(as_tables, proposals, months)
+
+    print(f"{proposals} proposals, {months} months each")
+    print(f"dict objects:    {dict_size / 1024:8.1f} KiB per proposal, built in {dict_time * 1000:6.2f} ms")
+    print(f"slotted objects: {objects_size / 1024:8.1f} KiB per proposal, built in {objects_time * 1000:6.2f} ms")
+    print(f"tables:          {tables_size / 1024:8.1f} KiB per proposal, built in {tables_time * 1000:6.2f} ms")
+    print(f"slotted objects take {objects_size / dict_size:.1%} of the memory of dict objects, "
+          f"tables {tables_size / dict_size:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory of dict-backed and slotted bill objects against columnar bill tables")
+    parser.add_argument("--proposals", type=int, default=500)
+    parser.add_argument("--months", type=int, default=300)
+    args = parser.parse_args()
+
+    run(args.proposals, args.months)
@@ -0,0 +1,41 @@
+import argparse
+import time
+
+from bench_service import proposal
+from pdf_client import PDFClient
+from pdf_stub import PDFStub
+
+
+def output_data(n: int) -> dict:
+    """Enough of an output_data for the template, rendering doesn't look at the numbers."""
+    data = proposal(n)
+    return {key: data[key] for key in ("customer_name", "project_address", "system", "sales_rep", "sales_company")}
+
+
+def run(proposals: int, connections: int, latency: float, error_rate: float):
+    """Render many proposals against a local PDF API stub, one at a time and then pooled, and report the throughput."""
+    outputs = [output_data(n) for n in range(proposals)]
+
+    with PDFStub(latency=latency, error_rate=error_rate, seed=0) as stub:
+        for name, max_connections in (("one at a time", 1), (f"{connections} connections", connections)):
+            client = PDFClient(api_key="stub", base_url=stub.base_url, max_connections=max_connections)
+
+            start = time.perf_counter()
+            results = client.create_many(outputs, return_exceptions=True)
+            elapsed = time.perf_counter() - start
+            client.close()
+
+            failed = sum(1 for result in results if isinstance(result, Exception))
+            print(f"{name}: {proposals} renders in {elapsed:.2f}s -> {proposals / elapsed:.1f} renders/s, "
+                  f"{failed} failed, {client.retries} retries")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PDF render throughput against a local PDF API stub")
+    parser.add_argument("--proposals", type=int, default=100)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds every render takes")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    run(args.proposals, args.connections, args.latency, args.error_rate)
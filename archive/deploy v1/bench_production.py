@@ -0,0 +1,52 @@
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from production import Production
+from pvgis import PVGISClient, TokenBucket
+from pvgis_stub import PVGISStub
+
+
+LAYOUT = [
+    {"number_of_panels": 13, "orientation": 0, "slope": 35, "shading": 0.0},
+    {"number_of_panels": 7, "orientation": 90, "slope": 35, "shading": 0.1}
+]
+
+
+def run(proposals: int, workers: int, latency: float, error_rate: float, rate_limit: float):
+    """Compute many proposals against a local PVGIS stub, without cache, and report the throughput."""
+    with PVGISStub(latency=latency, error_rate=error_rate, seed=0) as stub:
+        client = PVGISClient(cache=False, base_url=stub.base_url, max_connections=workers,
+                             rate_limiter=TokenBucket(rate_limit, burst=workers) if rate_limit else False)
+
+        def one(n):
+            # spread over ~100 locations like a real lead list
+            coordinates = {"lat": 43.0 + (n % 10) * 0.2, "lon": 19.5 + (n // 10 % 10) * 0.2}
+            try:
+                Production(LAYOUT, 400, coordinates, client=client)
+                return True
+            except Exception:
+                return False
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(one, range(proposals)))
+        elapsed = time.perf_counter() - start
+
+        client.close()
+
+    print(f"{proposals} proposals in {elapsed:.2f}s -> {proposals / elapsed:.1f} proposals/s, "
+          f"{results.count(False)} failed, {stub.requests_served} PVcalc requests served, "
+          f"{client.retries} retries, {client.coalesced} coalesced")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Production throughput against a local PVGIS stub")
+    parser.add_argument("--proposals", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0, help="requests per second, 0 for no limit")
+    args = parser.parse_args()
+
+    run(args.proposals, args.workers, args.latency, args.error_rate, args.rate_limit)
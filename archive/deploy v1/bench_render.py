@@ -0,0 +1,53 @@
+import argparse
+import time
+
+import pdf_render
+from bench_service import proposal
+from proposal_graph import ProposalGraph
+from pvgis import PVGISClient
+from pvgis_stub import PVGISStub
+
+
+def outputs(proposals: int, companies: int) -> list:
+    """output_data of many customers, computed against a local PVGIS stub, spread over a few sales companies."""
+    with PVGISStub() as stub:
+        client = PVGISClient(cache=False, base_url=stub.base_url, rate_limiter=False)
+        result = []
+        for n in range(proposals):
+            data = proposal(n)
+            data["sales_company"] = dict(data["sales_company"], name=f"{data['sales_company']['name']} {n % companies}")
+            result.append(ProposalGraph(data, client=client).get("output_data"))
+        client.close()
+    return result
+
+
+def run(proposals: int, companies: int, rounds: int):
+    """Render a batch of proposals locally, cold (templates and charts compiled) and then warm, and report the throughput."""
+    batch = outputs(proposals, companies)
+    pages = proposals * len(pdf_render.template(batch[0]["sales_company"]).pages)
+
+    for n in range(rounds):
+        if n == 0:
+            pdf_render._compiled.cache_clear()
+            pdf_render.cost_chart.cache_clear()
+            pdf_render.coverage_chart.cache_clear()
+
+        start = time.perf_counter()
+        size = sum(len(pdf_render.render_proposal(output_data)) for output_data in batch)
+        elapsed = time.perf_counter() - start
+
+        print(f"{'cold' if n == 0 else 'warm'}: {proposals} proposals ({pages} pages) in {elapsed * 1000:.1f} ms -> "
+              f"{pages / elapsed:.0f} pages/s, {size / proposals / 1024:.1f} KiB per proposal")
+
+    print(f"templates {pdf_render._compiled.cache_info()}")
+    print(f"cost charts {pdf_render.cost_chart.cache_info()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local PDF rendering throughput")
+    parser.add_argument("--proposals", type=int, default=25)
+    parser.add_argument("--companies", type=int, default=3, help="sales companies the proposals are spread over")
+    parser.add_argument("--rounds", type=int, default=3, help="the first round starts with empty caches")
+    args = parser.parse_args()
+
+    run(args.proposals, args.companies, args.rounds)
@@ -0,0 +1,82 @@
+import argparse
+import copy
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from main import input_json
+from proposal_service import ProposalService
+from pvgis import PVGISClient
+from pvgis_stub import PVGISStub
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def proposal(n: int) -> dict:
+    """input_json of customer n, spread over ~100 locations and a few system sizes like a real lead list."""
+    data = copy.deepcopy(input_json)
+    data["coordinates"] = {"lat": 43.0 + (n % 10) * 0.2, "lon": 19.5 + (n // 10 % 10) * 0.2}
+    data["system"]["cost"] = 600000 + (n % 7) * 50000
+    data["layout"][0]["number_of_panels"] = 8 + n % 10
+    return data
+
+
+def script_seconds(runs: int, base_url: str) -> float:
+    """Seconds per proposal of running main.py as a script, interpreter start-up and imports included."""
+    env = dict(os.environ, PVGIS_BASE_URL=base_url)
+    start = time.perf_counter()
+    for _ in range(runs):
+        subprocess.run([sys.executable, "main.py"], cwd=HERE, env=env, stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) / runs
+
+
+def run(proposals: int, concurrency: int, workers: int, latency: float, script_runs: int):
+    """Post many proposals to a local ProposalService backed by a PVGIS stub, without cache, and report the throughput."""
+    with PVGISStub(latency=latency, seed=0) as stub:
+        client = PVGISClient(cache=False, base_url=stub.base_url, max_connections=concurrency, rate_limiter=False)
+
+        with ProposalService(workers=workers, client=client) as service:
+            sessions = threading.local()
+
+            def one(n):
+                if not hasattr(sessions, "session"):
+                    sessions.session = requests.Session()
+                start = time.perf_counter()
+                response = sessions.session.post(f"{service.base_url}/proposal", json=proposal(n))
+                return response.status_code == 200, time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(one, range(proposals)))
+            elapsed = time.perf_counter() - start
+
+        client.close()
+
+        latencies = sorted(seconds for _, seconds in results)
+        failed = sum(1 for ok, _ in results if not ok)
+        print(f"{proposals} proposals in {elapsed:.2f}s -> {proposals / elapsed:.1f} requests/s, {failed} failed, "
+              f"latency p50 {statistics.median(latencies) * 1000:.0f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms, {stub.requests_served} PVcalc requests served")
+
+        if script_runs:
+            seconds = script_seconds(script_runs, stub.base_url)
+            print(f"main.py as a script: {seconds:.2f}s per proposal -> {1 / seconds:.1f} proposals/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proposal service throughput against a local PVGIS stub")
+    parser.add_argument("--proposals", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight at once")
+    parser.add_argument("--workers", type=int, default=None, help="service worker processes, defaults to the CPU count")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--script-runs", type=int, default=5, help="runs of main.py as a script to compare with, 0 to skip")
+    args = parser.parse_args()
+
+    run(args.proposals, args.concurrency, args.workers, args.latency, args.script_runs)
@@ -0,0 +1,133 @@
+from collections import namedtuple
+
+import numpy as np
+
+from breakeven import NO_PAYBACK
+from tariff import load_tariff
+from ubill import (PERCENT_COST_INCREASE, _excess_cycle, _kwh, _para_costs, _solar_charges, _solar_costs, _solar_energy,
+                   _ubill_charges, _ubill_costs)
+
+
+CHUNK_YEARS = 5
+""" years billed per numpy pass, enough to hide the per call overhead while memory stays a few hundred numbers """
+
+BillRecord = namedtuple("BillRecord", ["index", "month", "year", "ubill", "solar"])
+""" one month of the horizon, index counts from 1 like the loop in main() did, year from 0 """
+
+
+class BillStream:
+    """
+    The Ubill and SolarBill costs of a customer, month after month, for as long as they're asked for.
+
+    Only the per calendar month energy split is kept (for the first year and for every year after it,
+    see _excess_cycle()), every bill is priced when it's reached. Memory doesn't grow with the horizon
+    and costs are bill for bill the same as bill_horizon().
+    """
+
+    def __init__(self, usage, production, higherTariffPercent=0.85, permittedPower=11.4, usedOnSpot=None, tariff=None):
+        """
+        Args:
+            usage: 12 monthly kWh values, January first
+            production: 12 monthly kWh values
+            usedOnSpot: optional 12 monthly kWh values of solar used on the spot, as in SolarBill
+            tariff (TariffSchedule): defaults to load_tariff()
+        """
+        self.usage = _kwh(usage)
+        self.production = _kwh(production)
+        self.higherTariffPercent = np.asarray(higherTariffPercent, dtype=np.float64)
+        self.permittedPower = np.asarray(permittedPower, dtype=np.float64)
+        self.tariff = tariff or load_tariff()
+        if usedOnSpot is not None:
+            usedOnSpot = np.asarray(usedOnSpot, dtype=np.float64)
+
+        first, following = _excess_cycle(self.usage, self.production)
+        self._first_year = _solar_energy(self.usage, self.production, first, self.higherTariffPercent, usedOnSpot, self.tariff)
+        self._later_years = _solar_energy(self.usage, self.production, following, self.higherTariffPercent, usedOnSpot, self.tariff)
+
+    def costs(self, start_year: int, years: int, para: bool = False) -> tuple:
+        """
+        (ubill_costs, solar_costs) int64 arrays of shape (years, 12), starting with year start_year.
+
+        para=True gives the exact costs in para, as bill_horizon(para=True) does, instead of truncated float RSD.
+        """
+        t = self.tariff
+        ubill_total = _para_costs if para else _ubill_costs
+        solar_total = _para_costs if para else _solar_costs
+        # python floats, like _escalation() and the classes
+        escalation = np.array([(1 + PERCENT_COST_INCREASE) ** year for year in range(start_year, start_year + years)])
+
+        ubill_costs = ubill_total(_ubill_charges(self.usage, self.higherTariffPercent, self.permittedPower, escalation, t), t)
+
+        energy = self._first_year if start_year == 0 else self._later_years
+        solar_costs = solar_total(_solar_charges({key: value[None, :] for key, value in energy.items()},
+                                                  self.permittedPower, escalation[:, None], t), t)
+        if start_year == 0 and years > 1:
+            later = _solar_charges({key: value[None, :] for key, value in self._later_years.items()},
+                                   self.permittedPower, escalation[1:, None], t)
+            solar_costs[1:] = solar_total(later, t)
+
+        return ubill_costs, solar_costs
+
+    def records(self, months: int = None, chunk_years: int = CHUNK_YEARS):
+        """
+        Yield a BillRecord for every month, January of year 0 first.
+
+        Args:
+            months (int): length of the horizon, None never stops (the caller breaks out)
+            chunk_years (int): years priced at once
+        """
+        index = 0
+        year = 0
+        while months is None or index < months:
+            ubill_costs, solar_costs = self.costs(year, chunk_years)
+            for row in range(chunk_years):
+                for month in range(12):
+                    index += 1
+                    if months is not None and index > months:
+                        return
+                    yield BillRecord(index, month + 1, year + row, int(ubill_costs[row, month]), int(solar_costs[row, month]))
+            year += chunk_years
+
+    def __iter__(self):
+        return self.records()
+
+    def summarize(self, system_cost, months: int = 300, summary_months: int = 12) -> dict:
+        """
+        Breakeven and the first summary_months bills, reading the stream only as far as it takes to know them.
+
+        Args:
+            system_cost: cost of the system
+            months (int): horizon breakeven is searched in, as long as needed (40 or 50 years work the same)
+            summary_months (int): how many of the first bills to return
+
+        Returns:
+            dict: 'ubill_costs' and 'solar_costs' lists of the first bills, 'breakeven_months' (fractional, as in
+                breakeven_months(), NO_PAYBACK if the horizon ends first) and 'months_read'
+        """
+        ubill_costs = []
+        solar_costs = []
+        savings = 0
+        breakeven = 0.0 if system_cost <= 0 else None
+        index = 0
+
+        for record in self.records(months):
+            index = record.index
+            if index <= summary_months:
+                ubill_costs.append(record.ubill)
+                solar_costs.append(record.solar)
+
+            if breakeven is None:
+                before = savings
+                savings += record.ubill - record.solar
+                if savings >= system_cost:
+                    breakeven = index - 1 + min(max((system_cost - before) / (savings - before), 0), 1)
+
+            if breakeven is not None and index >= summary_months:
+                break
+
+        return {
+            "ubill_costs": ubill_costs,
+            "solar_costs": solar_costs,
+            "breakeven_months": NO_PAYBACK if breakeven is None else breakeven,
+            "months_read": index,
+        }
@@ -0,0 +1,118 @@
+import numpy as np
+
+from tariff import load_tariff
+from ubill import _kwh, _solar_energy, excess_chain, solar_horizon, ubill_horizon
+
+
+class BillRow:
+    """One month of a BillTable, reads like the Ubill or SolarBill object it stands in for (table[i].cost)."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index: int):
+        self._table = table
+        self._index = index
+
+    def __getattr__(self, name):
+        column = self._table.columns.get(name)
+        if column is None:
+            raise AttributeError(f"Bill has no column '{name}', expected one of {list(self._table.columns)}")
+        return column[self._index].item()
+
+    def __repr__(self):
+        return f"BillRow({', '.join(f'{name}={column[self._index]}' for name, column in self._table.columns.items())})"
+
+
+class BillTable:
+    """
+    Bills of a horizon as a struct of arrays, one numpy column per attribute instead of an object per month.
+
+    table[i] is month i of the horizon, counting from 1 like the monthly_ubills / monthly_solar_bills dicts did,
+    table.columns['cost'] is every cost at once.
+    """
+
+    __slots__ = ("columns", "length")
+
+    def __init__(self, columns: dict):
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) != 1:
+            raise ValueError(f"All columns must be the same length, got {sorted(lengths)}")
+
+        self.columns = columns
+        self.length = lengths.pop()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> BillRow:
+        if not 1 <= index <= self.length:
+            raise IndexError(f"Bill {index} is outside the horizon 1-{self.length}")
+        return BillRow(self, index - 1)
+
+    def __iter__(self):
+        return (BillRow(self, index) for index in range(self.length))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+
+def _calendar(months: int) -> tuple:
+    index = np.arange(months)
+    return (index % 12 + 1).astype(np.int8), (index // 12).astype(np.int16)
+
+
+def ubill_table(usage, higherTariffPercent=0.85, permittedPower=11.4, months=300, tariff=None) -> BillTable:
+    """
+    Ubills of the horizon as a BillTable, with the same costs as the objects main() used to build.
+
+    Args:
+        usage: 12 monthly kWh values, January first
+    """
+    month, year = _calendar(months)
+    usage12 = _kwh(usage)
+    usage = usage12[month - 1]
+
+    return BillTable({
+        "month": month,
+        "year": year,
+        "usage": usage.astype(np.int32),
+        "usageHigherTariff": usage * higherTariffPercent,
+        "usageLowerTariff": usage * (1 - higherTariffPercent),
+        "cost": ubill_horizon(usage12, higherTariffPercent, permittedPower, months, tariff),
+    })
+
+
+def solar_bill_table(usage, production, higherTariffPercent=0.85, permittedPower=11.4, months=300, usedOnSpot=None,
+                     tariff=None) -> BillTable:
+    """
+    SolarBills of the horizon as a BillTable, the excess chain included.
+
+    Args:
+        usage: 12 monthly kWh values, January first
+        production: 12 monthly kWh values, e.g. Production.month.array
+        usedOnSpot: optional 12 monthly kWh values of solar used on the spot, as in SolarBill
+    """
+    t = tariff or load_tariff()
+    month, year = _calendar(months)
+    usage12, production12 = _kwh(usage), _kwh(production)
+    usage, production = usage12[month - 1], production12[month - 1]
+
+    # one month further, so the last bill knows what it leaves for the next one
+    excess = excess_chain(np.append(usage, usage12[months % 12]), np.append(production, production12[months % 12]))
+    usedOnSpotByMonth = None if usedOnSpot is None else np.asarray(usedOnSpot, dtype=np.float64)[month - 1]
+    energy = _solar_energy(usage, production, excess[:-1], np.asarray(higherTariffPercent, dtype=np.float64), usedOnSpotByMonth, t)
+
+    return BillTable({
+        "month": month,
+        "year": year,
+        "usage": usage.astype(np.int32),
+        "production": production.astype(np.int32),
+        "excessFromPreviousMonth": excess[:-1].astype(np.int32),
+        "excessForNextMonth": excess[1:].astype(np.int32),
+        "kwhOfSolarUsedOnSpot": energy["kwhOfSolarUsedOnSpot"],
+        "kwhExported": energy["kwhExported"],
+        "kwhImported": energy["kwhImported"],
+        "netHigherUsage": energy["netHigherUsage"],
+        "cost": solar_horizon(usage12, production12, higherTariffPercent, permittedPower, months, usedOnSpot, t),
+    })
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+NO_PAYBACK = np.inf
+""" breakeven of a scenario whose savings never cover the system cost within the horizon """
+
+
+def cumulative_savings(ubill_costs, solar_costs) -> np.ndarray:
+    """
+    What the customer has saved after every month of the horizon.
+
+    Args:
+        ubill_costs: monthly costs without solar, shape (..., months), e.g. from bill_horizon() or bill_batch()
+        solar_costs: monthly costs with solar, same shape
+
+    Returns:
+        np.ndarray: float64 cumulative savings, same shape
+    """
+    return np.cumsum(np.asarray(ubill_costs, dtype=np.float64) - np.asarray(solar_costs, dtype=np.float64), axis=-1)
+
+
+def _first_reached(reached: np.ndarray) -> np.ndarray:
+    """
+    Index of the first True of every row of a (rows, months) mask that never goes back to False, months if there is none.
+
+    Every row becomes keys row * 2 + reached, which are sorted over the whole flattened matrix,
+    so one searchsorted finds the first crossing of all rows.
+    """
+    rows, months = reached.shape
+    row = np.arange(rows)
+    keys = (row[:, None] * 2 + reached).ravel()
+    return np.searchsorted(keys, row * 2 + 1) - row * months
+
+
+def breakeven_months(system_cost, ubill_costs, solar_costs) -> np.ndarray:
+    """
+    When the savings pay for the system, in fractional months, for any number of scenarios at once.
+
+    The savings are interpolated linearly within the month they catch up with the system cost, so 27.4 means
+    early in month 28. The whole month is the first i where system cost + solar bills <= ubills, what the old
+    loop in main() returned, and is always ceil() of the result.
+
+    Args:
+        system_cost: cost of the system, a single value or one per scenario
+        ubill_costs: monthly costs without solar, shape (months,) or (scenarios, months)
+        solar_costs: monthly costs with solar, broadcastable to ubill_costs
+
+    Returns:
+        np.ndarray: months until breakeven, NO_PAYBACK where the horizon is too short,
+            one per scenario (a 0-d array for a single one)
+    """
+    savings = cumulative_savings(ubill_costs, solar_costs)
+    system_cost = np.asarray(system_cost, dtype=np.float64)
+    shape = np.broadcast_shapes(system_cost.shape, savings.shape[:-1])
+    months = savings.shape[-1]
+
+    savings = np.broadcast_to(savings, shape + (months,)).reshape(-1, months)
+    cost = np.broadcast_to(system_cost, shape).reshape(-1)
+    row = np.arange(len(cost))
+
+    # savings can dip after a crossing, the running maximum keeps every row sorted and the first crossing where it is
+    reached = np.maximum.accumulate(savings, axis=-1) >= cost[:, None]
+    first = _first_reached(reached)
+
+    month = np.minimum(first, months - 1)
+    after = savings[row, month]
+    before = np.where(month > 0, savings[row, month - 1], 0.0)
+    fraction = np.divide(cost - before, after - before, out=np.zeros_like(cost), where=after > before)
+
+    result = np.where(first < months, month + np.clip(fraction, 0, 1), NO_PAYBACK)
+    # nothing to pay back
+    result = np.where(cost <= 0, 0.0, result)
+
+    return result.reshape(shape)
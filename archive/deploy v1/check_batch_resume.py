@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import tempfile
+
+# before pvgis_cache is imported, so neither this process nor the batch workers touch the real cache
+os.environ["PVGIS_CACHE_PATH"] = os.path.join(tempfile.gettempdir(), "check_batch_resume.sqlite3")
+
+import pvgis
+from batch_proposals import Checkpoint, run_batch
+from bench_service import proposal
+from pvgis_stub import PVGISStub
+
+
+def write_input(path: str, records: int, blank_every: int) -> int:
+    """JSONL of records proposals with a blank line after every blank_every of them and one bad line, returns the line count."""
+    lines = []
+    for n in range(records):
+        lines.append(json.dumps(dict(proposal(n), project_id=n)) + "\n")
+        if n % blank_every == blank_every - 1:
+            lines.append("\n")
+    lines[len(lines) // 3] = '{"project_id": "broken"\n'
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.writelines(lines)
+    return len(lines)
+
+
+def run(records: int, blank_every: int, stop_after: int, workers: int):
+    """
+    Stop a batch part way, resume it over the whole input and check every record was written exactly once.
+
+    The first run gets the first stop_after lines of the input, as if it had been killed there, and leaves a half
+    written line at the end of the output. The journal has to move its watermark over the blank lines both times,
+    or every finished record past the first blank one would stay in memory.
+    """
+    with tempfile.TemporaryDirectory() as directory, PVGISStub() as stub:
+        os.environ["PVGIS_BASE_URL"] = pvgis.PVGIS_BASE_URL = stub.base_url
+
+        input_path = os.path.join(directory, "input.jsonl")
+        output_path = os.path.join(directory, "output.jsonl")
+        lines = write_input(input_path, records, blank_every)
+
+        with open(input_path, "r", encoding="utf-8") as file:
+            head = [next(file) for _ in range(stop_after)]
+        with open(os.path.join(directory, "head.jsonl"), "w", encoding="utf-8") as file:
+            file.writelines(head)
+
+        first = run_batch(os.path.join(directory, "head.jsonl"), output_path, workers=workers)
+        with open(output_path, "a", encoding="utf-8") as output:
+            output.write('{"record": ')
+
+        checkpoint = Checkpoint(output_path + ".journal")
+        checkpoint.close()
+        assert checkpoint.watermark == stop_after and not checkpoint._ahead, (checkpoint.watermark, checkpoint._ahead)
+
+        second = run_batch(input_path, output_path, workers=workers)
+
+        checkpoint = Checkpoint(output_path + ".journal")
+        checkpoint.close()
+        assert checkpoint.watermark == lines and not checkpoint._ahead, (checkpoint.watermark, checkpoint._ahead)
+
+        written = []
+        for path in (output_path, output_path + ".errors"):
+            with open(path, "r", encoding="utf-8") as file:
+                written += [json.loads(line)["record"] for line in file]
+        with open(input_path, "r", encoding="utf-8") as file:
+            expected = [record for record, line in enumerate(file, start=1) if line.strip()]
+        assert sorted(written) == expected, "records missing or written twice"
+
+    print(f"first run {first}, resumed {second}: {len(expected)} records written once each, "
+          f"journal watermark at line {lines} of {lines}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stop and resume a batch over input with blank lines, check the output")
+    parser.add_argument("--records", type=int, default=60)
+    parser.add_argument("--blank-every", type=int, default=7, help="a blank line after every this many records")
+    parser.add_argument("--stop-after", type=int, default=25, help="input lines the first run gets")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    run(args.records, args.blank_every, args.stop_after, args.workers)
@@ -0,0 +1,64 @@
+import random
+import time
+
+import requests
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+""" throttling and server errors, worth another attempt, anything else that's not a 200 won't get better """
+
+
+def request_json(send, error, service: str, max_retries: int, backoff_base: float, backoff_max: float,
+                 on_retry=None) -> dict:
+    """
+    Decoded JSON of an HTTP call, retrying throttling, server and connection errors with jittered exponential backoff.
+
+    Shared by the PVGIS and PDF API clients, so both retry and give up the same way.
+
+    Args:
+        send: function making one attempt and returning its requests.Response, rate limits and call counting are up to it
+        error: exception class raised on failure, called with (message, status)
+        service (str): what's being called, for the error messages, e.g. 'PVGIS'
+        max_retries (int): retries before giving up
+        backoff_base (float): seconds, the longest first delay, doubled on every retry
+        backoff_max (float): seconds the delay is capped at, a longer Retry-After still wins
+        on_retry: called before every retry, e.g. to count them
+
+    Raises:
+        error: right away for a status that isn't retried or a response that isn't JSON,
+            with the last failure once the retries run out
+    """
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        try:
+            response = send()
+
+            if response.status_code in RETRY_STATUSES:
+                failure = error(f"{service} answered {response.status_code}", response.status_code)
+                retry_after = response.headers.get("Retry-After")
+            else:
+                try:
+                    response.raise_for_status()
+                except requests.exceptions.HTTPError as e:
+                    raise error(f"{service} rejected the request: {e}", response.status_code)
+
+                try:
+                    return response.json()
+                except ValueError:
+                    raise error(f"{service} answered with something that isn't JSON: {response.text[:200]}", None)
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            failure = error(f"{service} unreachable: {e}", None)
+
+        if attempt == max_retries:
+            break
+
+        if on_retry is not None:
+            on_retry()
+        # full jitter, so clients throttled together don't come back together
+        delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        time.sleep(delay)
+
+    raise error(f"{failure} (gave up after {max_retries + 1} attempts)", failure.status)
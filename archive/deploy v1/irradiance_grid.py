@@ -0,0 +1,205 @@
+import bisect
+import json
+import os
+import random
+
+import numpy as np
+
+
+GRID_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serbia_grid.npy")
+
+# Serbia bounding box, with a bit of margin on every side
+GRID_LATS = [round(42.0 + 0.5 * i, 2) for i in range(10)] # 42.0 - 46.5
+GRID_LONS = [round(18.5 + 0.5 * i, 2) for i in range(11)] # 18.5 - 23.5
+GRID_SLOPES = [0, 10, 20, 30, 40, 50, 60, 90]
+GRID_ASPECTS = [-180, -135, -90, -45, 0, 45, 90, 135, 180]
+GRID_LOSS = 14
+
+HOURLY_UNSUPPORTED = "An IrradianceGrid only has monthly yields, hourly series need a PVGISClient"
+
+
+def _metadata_path(path: str) -> str:
+    return path[:-len(".npy")] + ".json" if path.endswith(".npy") else path + ".json"
+
+
+def _progress_path(path: str) -> str:
+    return path + ".progress"
+
+
+def _finished_cells(path: str, axes: dict, shape: tuple) -> set:
+    """(lat, lon) index pairs an interrupted build of the same axes already wrote, empty when there's nothing to resume."""
+    if not os.path.exists(path) or not os.path.exists(_progress_path(path)):
+        return set()
+
+    with open(_progress_path(path), "r") as progress:
+        if json.loads(progress.readline() or "null") != axes:
+            return set()
+        cells = {tuple(int(index) for index in line.split()) for line in progress if line.strip()}
+
+    if np.load(path, mmap_mode="r").shape != shape:
+        return set()
+    return cells
+
+
+def build_grid(client, path: str = GRID_PATH, lats: list = GRID_LATS, lons: list = GRID_LONS,
+               slopes: list = GRID_SLOPES, aspects: list = GRID_ASPECTS, loss: float = GRID_LOSS, validation_samples: int = 50):
+    """
+    Sample PVGIS once over a lat/lon x slope x aspect grid and store 1 kWp monthly yields in a .npy file.
+
+    The array has shape (lats, lons, slopes, aspects, 12) and is written straight into a memory mapped file,
+    axes and the measured interpolation error go into a .json file next to it.
+
+    Every lat/lon cell is flushed and noted in a .progress file once it's sampled, so running an interrupted
+    build again only calls PVGIS for the cells it hadn't finished. The client's cache can't be relied on for
+    that, the default grid is 7920 calls and the default cache keeps 5000.
+
+    Args:
+        client (PVGISClient): used for the live calls
+        path (str): where the .npy file is written
+        validation_samples (int): number of random off-grid points compared against live PVGIS afterwards
+
+    Returns:
+        IrradianceGrid: the freshly built grid
+    """
+    shape = (len(lats), len(lons), len(slopes), len(aspects), 12)
+    axes = {"lats": lats, "lons": lons, "slopes": slopes, "aspects": aspects, "loss": loss}
+
+    finished = _finished_cells(path, axes, shape)
+    if finished:
+        data = np.lib.format.open_memmap(path, mode="r+")
+    else:
+        # a grid being rebuilt isn't a grid IrradianceGrid can open until it's done
+        if os.path.exists(_metadata_path(path)):
+            os.remove(_metadata_path(path))
+        data = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+        with open(_progress_path(path), "w") as progress:
+            progress.write(json.dumps(axes) + "\n")
+
+    with open(_progress_path(path), "a") as progress:
+        for i, lat in enumerate(lats):
+            for j, lon in enumerate(lons):
+                if (i, j) in finished:
+                    continue
+
+                requests_params = [{"lat": lat, "lon": lon, "angle": slope, "aspect": aspect, "loss": loss}
+                                   for slope in slopes for aspect in aspects]
+                results = client.fetch_many(requests_params)
+
+                for n, monthly in enumerate(results):
+                    k, l = divmod(n, len(aspects))
+                    data[i, j, k, l] = [monthly[month] for month in range(1, 13)]
+
+                # on disk before it's noted as done
+                data.flush()
+                progress.write(f"{i} {j}\n")
+                progress.flush()
+
+    del data
+    os.remove(_progress_path(path))
+
+    metadata = dict(axes, interpolation_error=None)
+    with open(_metadata_path(path), "w") as file:
+        json.dump(metadata, file, indent=4)
+
+    grid = IrradianceGrid(path)
+
+    if validation_samples:
+        grid.interpolation_error = grid.validate(client, validation_samples)
+        metadata["interpolation_error"] = grid.interpolation_error
+        with open(_metadata_path(path), "w") as file:
+            json.dump(metadata, file, indent=4)
+
+    return grid
+
+
+class IrradianceGrid:
+    """
+    Offline stand-in for PVGISClient which interpolates 1 kWp yields out of a grid built by build_grid().
+
+    It exposes the same fetch_monthly / fetch_many methods, so it can be handed to Production as its client.
+    """
+
+    def __init__(self, path: str = GRID_PATH):
+        """
+        Args:
+            path (str): the .npy file written by build_grid(), it's memory mapped rather than read in
+        """
+        with open(_metadata_path(path), "r") as file:
+            metadata = json.load(file)
+
+        self.lats = metadata["lats"]
+        self.lons = metadata["lons"]
+        self.slopes = metadata["slopes"]
+        self.aspects = metadata["aspects"]
+        self.loss = metadata["loss"]
+        self.interpolation_error = metadata["interpolation_error"]
+        """ error of the interpolated annual yield against live PVGIS samples, measured when the grid was built """
+
+        self.data = np.load(path, mmap_mode="r")
+
+    @staticmethod
+    def _bracket(axis: list, value: float):
+        """Index of the lower grid point and the 0-1 position of value between it and the next one."""
+        value = min(max(value, axis[0]), axis[-1])
+        i = min(bisect.bisect_right(axis, value) - 1, len(axis) - 2)
+        return i, (value - axis[i]) / (axis[i + 1] - axis[i])
+
+    def yield_per_kwp(self, lat: float, lon: float, angle: float, aspect: float, loss: float = GRID_LOSS):
+        """Monthly yield of 1 kWp as a 12 value array, quadrilinear interpolation between the 16 surrounding grid points."""
+        aspect = (aspect + 180) % 360 - 180
+
+        i, t_lat = self._bracket(self.lats, lat)
+        j, t_lon = self._bracket(self.lons, lon)
+        k, t_slope = self._bracket(self.slopes, angle)
+        l, t_aspect = self._bracket(self.aspects, aspect)
+
+        block = np.asarray(self.data[i:i + 2, j:j + 2, k:k + 2, l:l + 2], dtype=np.float64)
+        for t in (t_lat, t_lon, t_slope, t_aspect):
+            block = block[0] * (1 - t) + block[1] * t
+
+        # system loss is applied linearly by PVcalc
+        return block * (100 - loss) / (100 - self.loss)
+
+    def fetch_monthly(self, lat: float, lon: float, angle: float, aspect: float, loss: float) -> dict:
+        yields = self.yield_per_kwp(lat, lon, angle, aspect, loss)
+        return {month: float(yields[month - 1]) for month in range(1, 13)}
+
+    def fetch_many(self, requests_params: list, hourly: bool = False) -> list:
+        if hourly:
+            raise ValueError(HOURLY_UNSUPPORTED)
+        return [self.fetch_monthly(**params) for params in requests_params]
+
+    def validate(self, client, samples: int = 50, seed: int = 0) -> dict:
+        """
+        Compare interpolated annual yields against live PVGIS at random points inside the grid.
+
+        Returns:
+            dict: mean and max absolute error in percent, plus the number of samples
+        """
+        rng = random.Random(seed)
+        requests_params = [{
+            "lat": round(rng.uniform(self.lats[0], self.lats[-1]), 3),
+            "lon": round(rng.uniform(self.lons[0], self.lons[-1]), 3),
+            "angle": rng.randint(self.slopes[0], self.slopes[-1]),
+            "aspect": rng.randint(self.aspects[0], self.aspects[-1]),
+            "loss": self.loss
+        } for _ in range(samples)]
+
+        errors = []
+        for params, live in zip(requests_params, client.fetch_many(requests_params)):
+            live_annual = sum(live.values())
+            if live_annual > 0:
+                errors.append(abs(sum(self.fetch_monthly(**params).values()) - live_annual) / live_annual * 100)
+
+        return {
+            "mean_abs_percent": sum(errors) / len(errors) if errors else None,
+            "max_abs_percent": max(errors) if errors else None,
+            "samples": len(errors)
+        }
+
+
+if __name__ == "__main__":
+    from pvgis import default_client
+
+    grid = build_grid(default_client())
+    print(f"grid written to {GRID_PATH}, interpolation error: {grid.interpolation_error}")
@@ -1,15 +1,9 @@
 from ubill import *
 from production import *
 from co2 import *
-import decimal
+from proposal_graph import ProposalGraph
 import json
-import requests
 import os
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from google.oauth2.credentials import Credentials
-
-decimal.getcontext().prec = 2
 
 input_json = {
     "project_id" : "",
@@ -80,228 +74,87 @@ input_json = {
         }
 }
 
-def main(data):
-        
+def main(data, hourly_self_consumption=False, horizon_months=300):
+    
+    # with a load profile, self consumption comes from the precomputed table instead of the flat 40% rule,
+    # or from a full hour by hour simulation when asked for (batch runs).
+    # the wizard keeps the graph around and calls update() on edits, see proposal_graph.py
+    proposal = ProposalGraph(data, hourly_self_consumption, horizon_months=horizon_months)
+    
     try:
-        production = Production(layout=data['layout'], panel_power=data['system']['panel_power'], coordinates=data['coordinates'])
-        co2 = CO2(data['ubill']['annual_usage'], production.annual)
-        
-        monthly_ubills = {}
-        monthly_solar_bills = {}
-        excess_helper = 0
-        
-        for i in range(1, 301):
-            month = i % 12 if i % 12 != 0 else 12
-            year = (i-1)//12
-            
-            monthly_ubills[i] = Ubill(month, year, usage= data['ubill']['monthly_usage'][str(month)], higherTariffPercent= data['ubill']['higher_tariff_percentage'])
-            
-            monthly_solar_bills[i] = SolarBill(month, year, usage = data['ubill']['monthly_usage'][str(month)], production = production.month[month],
-                                            excessFromPreviousMonth = excess_helper, higherTariffPercent = data['ubill']['higher_tariff_percentage'])
-            excess_helper = monthly_solar_bills[i].excessForNextMonth
-        
-        
-            
+        output_data = proposal.get("output_data")
     except Exception as exception:
         print(f"An exception was raised: {exception}")
         return
     
-    
-    cummulative_ubill_cost = 0
-    cummulative_solar_cost = int(data['system']['cost'])
-    
-    for i in range(1, 301):
-        cummulative_solar_cost += monthly_solar_bills[i].cost
-        cummulative_ubill_cost += monthly_ubills[i].cost
-        
-        if cummulative_solar_cost <= cummulative_ubill_cost:
-            months_until_breakeven = i
-            break
-        
-    
-    
-    # prepare variables here
-    
-    solar_percentage_of_usage = decimal.Decimal(production.annual) /decimal.Decimal(data['ubill']['annual_usage']) * 100
-    if solar_percentage_of_usage >= 100:
-        import_percentage_of_usage = 0
-    if solar_percentage_of_usage < 100 and solar_percentage_of_usage >= 0:
-        import_percentage_of_usage = 100 - solar_percentage_of_usage
-    
-    monthly_costs_pre_solar = {
-        "1" : monthly_ubills[1].cost,
-        "2" : monthly_ubills[2].cost,
-        "3" : monthly_ubills[3].cost,
-        "4" : monthly_ubills[4].cost,
-        "5" : monthly_ubills[5].cost,
-        "6" : monthly_ubills[6].cost,
-        "7" : monthly_ubills[7].cost,
-        "8" : monthly_ubills[8].cost,
-        "9" : monthly_ubills[9].cost,
-        "10" : monthly_ubills[10].cost,
-        "11" : monthly_ubills[11].cost,
-        "12" : monthly_ubills[12].cost
-        }
-    
-    monthly_costs_post_solar = {
-        "1" : monthly_solar_bills[1].cost,
-        "2" : monthly_solar_bills[2].cost,
-        "3" : monthly_solar_bills[3].cost,
-        "4" : monthly_solar_bills[4].cost,
-        "5" : monthly_solar_bills[5].cost,
-        "6" : monthly_solar_bills[6].cost,
-        "7" : monthly_solar_bills[7].cost,
-        "8" : monthly_solar_bills[8].cost,
-        "9" : monthly_solar_bills[9].cost,
-        "10" : monthly_solar_bills[10].cost,
-        "11" : monthly_solar_bills[11].cost,
-        "12" : monthly_solar_bills[12].cost
-        }
-    
-    higher_tariff_percentage = decimal.Decimal(data['ubill']['higher_tariff_percentage']) * 100
-
-    annual_costs_pre_solar = 0
-    annual_costs_post_solar = 0
-    for i in range(1,13):
-        annual_costs_pre_solar += monthly_ubills[i].cost
-        annual_costs_post_solar += monthly_solar_bills[i].cost
-        
-    annual_cost_difference = annual_costs_pre_solar - annual_costs_post_solar
-    
-    whole_years_until_breakeven = months_until_breakeven // 12
-    extra_months_until_breakeven = months_until_breakeven % 12 if months_until_breakeven % 12 != 0 else 0
-    
-    if extra_months_until_breakeven == 1:
-        breakeven_time_string = f"{whole_years_until_breakeven} godina i {extra_months_until_breakeven} mesec"
-    if extra_months_until_breakeven > 1 and extra_months_until_breakeven < 5:
-        breakeven_time_string = f"{whole_years_until_breakeven} godina i {extra_months_until_breakeven} meseca"
-    if extra_months_until_breakeven > 4:
-        breakeven_time_string = f"{whole_years_until_breakeven} godina i {extra_months_until_breakeven} meseci"
-    if extra_months_until_breakeven == 0:
-        breakeven_time_string = f"{whole_years_until_breakeven} godina"
-        years_in_profit = 25 - whole_years_until_breakeven
-    years_in_profit = 25 - whole_years_until_breakeven - 1
-
-    
-    
-    output_data = {
-        "customer_name": data['customer_name'],
-        "project_address": data['project_address'],
-        
-        "system": {
-            "cost" : data['system']['cost'],
-            "panel_power": data['system']['panel_power'],
-            "inverter_brand" : data['system']['inverter_brand'],
-            "inverter_model" : data['system']['inverter_model'],
-            "panel_brand" : data['system']['panel_brand'],
-            "panel_model" : data['system']['panel_model'],
-            "panel_count": data['system']['panel_count'],
-            "total_DC_power": data['system']['total_DC_power']
-        },
-            
-        "production" : {
-            "annual": production.annual
-        },
-      
-        "solar_percentage_of_usage": str(solar_percentage_of_usage),
-        "import_percentage_of_usage": str(import_percentage_of_usage),
-      
-        "monthly_costs_pre_solar": monthly_costs_pre_solar,
-        "monthly_costs_post_solar": monthly_costs_post_solar,
-      
-        "higher_tariff_percentage": str(int(100*data['ubill']['higher_tariff_percentage'])),
-        "annual_costs_pre_solar": annual_costs_pre_solar,
-        "annual_costs_post_solar": annual_costs_post_solar,
-        "annual_cost_difference": annual_cost_difference,
-        "breakeven_time_string": breakeven_time_string,
-        "years_in_profit": years_in_profit,
-        "co2" : {
-          "reduction_kg" : co2.reduction_kg,
-            "number_of_trees_equivalent" : co2.number_of_trees_equivalent,
-            "car_kilometres_equivalent": co2.car_kilometres_equivalent
-        },
-            
-        "sales_rep" : data['sales_rep'],
-        
-        "sales_company": data['sales_company']
-    }
-    
     print(output_data)
     
     return
 
-    api_key = '5d1aODQyNTo4NDYxOlhjVExtSHVjNWhsUVVDb1U'
-    template_id = 'cb377b23816e949c'
-    
-    output_data_json = json.dumps(output_data)
-    
-    json_payload = {
-      "data": output_data_json,
-      "output_file": "output.pdf",
-      "export_type": "json",
-      "expiration": 10,
-      "template_id": template_id
-    }
-    
-    response = requests.post(F"https://api.craftmypdf.com/v1/create",
-        headers = {"X-API-KEY": F"{api_key}"},
-        json = json_payload
-    )
-    
-    response_string = response.content.decode('utf-8')
 
-    # Parse the JSON content
-    response_json = json.loads(response_string)
+def create_pdf(output_data, renderer=None):
+    """
+    Render output_data into the proposal PDF.
 
-    # Extract the file URL
-    file_url = response_json['file']
+    Args:
+        renderer: a pdf_render.LocalPDFRenderer renders on this machine, by default it's done on craftmypdf
 
-    # Print the file URL
-    print(file_url)
+    Returns:
+        str: URL of the rendered file (it expires after 10 minutes), or its path when rendered locally
+    """
+    if renderer is None:
+        # imported here so computing a proposal (the service, batch runs) doesn't pay for the PDF side
+        from pdf_client import default_pdf_client
+        renderer = default_pdf_client()
+
+    # the PDF API client has a timeout and retries, and raises a PDFRenderError when no file comes back
+    file_url = renderer.create(output_data)
     
     return file_url
-    
-#     
-#     try:
-#         # Set up OAuth2 service account credentials
-#         # Define the file to upload and the folder in Google Drive where you want to store it
-#         file_path = 'output.pdf'
-#         drive_folder_id = '1vqlwzvfvUS3TiyUxc2VDi-LfP6k_7JP5'  # Replace with the actual folder ID in Google Drive
-# 
-#         # Load OAuth credentials from 'oauth.json' and 'token.json'
-#         creds = None 
-#         if os.path.exists('token.json'):
-#             creds = Credentials.from_authorized_user_file('token.json')
-# 
-#         # If credentials are missing or expired, authenticate again
-#         if not creds or not creds.valid:
-#             # Authenticate and authorize the application
-#             # You'll need to implement the authentication flow here if it's not already done
-#             # For example, using the google-auth library to get credentials
-# 
-#             # Save the credentials for future runs
-#             with open('token.json', 'w') as token_file:
-#                 token_file.write(creds.to_json())
-# 
-#         # Build the Google Drive API service
-#         service = build('drive', 'v3', credentials=creds)
-# 
-#         # Create a media upload request
-#         media = MediaFileUpload(file_path, mimetype='application/pdf')
-# 
-#         # Create the file metadata
-#         file_metadata = {
-#             'name': 'output.pdf',
-#             'parents': [drive_folder_id]
-#         }
-# 
-#         # Upload the file
-#         file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-# 
-#         # Print the file ID of the uploaded file
-#         print(f'File ID: {file.get("id")}')
-# 
-#     except Exception as e:
-#         print(e)
 
-main(input_json)
\ No newline at end of file
+
+def upload_to_drive(file_url, name='output.pdf', drive_folder_id='1vqlwzvfvUS3TiyUxc2VDi-LfP6k_7JP5', token_path='token.json'):
+    """
+    Download a rendered proposal PDF and store it in the proposals folder on Google Drive.
+
+    Args:
+        file_url (str): what create_pdf() returned, a URL or a local path
+        name (str): file name on Drive
+        token_path (str): OAuth token of an already authorized user
+
+    Returns:
+        str: Drive file ID
+    """
+    # imported here, the Google client libraries are only needed by whoever uploads
+    import io
+    import requests
+    from googleapiclient.discovery import build
+    from googleapiclient.http import MediaIoBaseUpload
+    from google.oauth2.credentials import Credentials
+
+    if not os.path.exists(token_path):
+        raise FileNotFoundError(f"No Google OAuth token at {token_path}, authorize the Drive upload first")
+    creds = Credentials.from_authorized_user_file(token_path)
+
+    if os.path.exists(file_url):
+        with open(file_url, 'rb') as pdf_file:
+            pdf = pdf_file.read()
+    else:
+        response = requests.get(file_url, timeout=60)
+        response.raise_for_status()
+        pdf = response.content
+
+    # a service object per upload, they aren't safe to share between threads
+    service = build('drive', 'v3', credentials=creds, cache_discovery=False)
+    media = MediaIoBaseUpload(io.BytesIO(pdf), mimetype='application/pdf')
+    file_metadata = {
+        'name': name,
+        'parents': [drive_folder_id]
+    }
+    file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+
+    return file.get('id')
+
+
+if __name__ == "__main__":
+    main(input_json)
@@ -0,0 +1,140 @@
+from decimal import Decimal
+from fractions import Fraction
+
+import numpy as np
+
+
+PARA_PER_DINAR = 100
+
+
+def _ratio(rate) -> Fraction:
+    """A rate such as 0.075 as the exact decimal it was written as, not its binary float approximation."""
+    return Fraction(str(rate)) if isinstance(rate, float) else Fraction(rate)
+
+
+def _round_half_even(numerator: int, denominator: int) -> int:
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2 == 1):
+        quotient += 1
+    return quotient
+
+
+class Money:
+    """
+    Exact amount of money in para (1/100 RSD), backed by a python int.
+
+    Adding and subtracting is exact, multiplying by a rate rounds half to even once, to the para.
+    Nothing here touches the decimal module's global context, so concurrent proposals can't affect each other.
+    """
+
+    __slots__ = ("para",)
+
+    def __init__(self, para: int = 0):
+        self.para = int(para)
+
+    @classmethod
+    def from_dinars(cls, amount):
+        """From an exact amount in dinars: int, Decimal or a string such as '1234.56'."""
+        if isinstance(amount, float):
+            raise TypeError("use Money.from_float for floats, they're not exact amounts")
+        value = _ratio(amount) * PARA_PER_DINAR
+        return cls(_round_half_even(value.numerator, value.denominator))
+
+    @classmethod
+    def from_float(cls, amount: float):
+        """
+        From a float amount in dinars, rounded half to even to the para, the same way to_para() does it.
+
+        The float is read as the shortest decimal that prints as it (2.675 is 2.675, not 2.67499999...),
+        so amount * 100 never goes through binary floating point and a half para can't round the wrong way.
+        """
+        value = _ratio(float(amount)) * PARA_PER_DINAR
+        return cls(_round_half_even(value.numerator, value.denominator))
+
+    def scale(self, rate):
+        """This amount times a rate (e.g. a tax percent), rounded half to even to the para."""
+        rate = _ratio(rate)
+        return Money(_round_half_even(self.para * rate.numerator, rate.denominator))
+
+    @property
+    def dinars(self) -> Decimal:
+        return Decimal(self.para).scaleb(-2)
+
+    def __int__(self):
+        """Whole dinars, truncated like the float bills are."""
+        return self.para // PARA_PER_DINAR if self.para >= 0 else -(-self.para // PARA_PER_DINAR)
+
+    def __add__(self, other):
+        return Money(self.para + other.para) if isinstance(other, Money) else NotImplemented
+
+    def __radd__(self, other):
+        # so sum() works
+        return Money(self.para + other) if other == 0 else NotImplemented
+
+    def __sub__(self, other):
+        return Money(self.para - other.para) if isinstance(other, Money) else NotImplemented
+
+    def __neg__(self):
+        return Money(-self.para)
+
+    def __mul__(self, other):
+        if isinstance(other, int):
+            return Money(self.para * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and self.para == other.para
+
+    def __lt__(self, other):
+        return self.para < other.para
+
+    def __le__(self, other):
+        return self.para <= other.para
+
+    def __hash__(self):
+        return hash(self.para)
+
+    def __str__(self):
+        return f"{self.dinars:.2f}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+
+# vectorized counterparts, int64 arrays of para
+
+TIE_TOLERANCE = 64 * np.finfo(np.float64).eps
+""" relative distance from a half para under which to_para() can't trust amounts * 100 in floating point """
+
+
+def to_para(amounts) -> np.ndarray:
+    """
+    Float dinar amounts to int64 para, rounded half to even exactly like Money.from_float.
+
+    amounts * 100 is off by a few ulp at most, which only matters for the amounts that land next to a half para.
+    Those few are rounded one by one through Money.from_float, everything else is np.rint().
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    scaled = amounts * PARA_PER_DINAR
+    para = np.array(np.rint(scaled), dtype=np.int64)
+    near_tie = np.abs(np.abs(scaled - para) - 0.5) <= TIE_TOLERANCE * np.maximum(np.abs(scaled), 1)
+    if near_tie.any():
+        para[near_tie] = [Money.from_float(amount).para for amount in amounts[near_tie]]
+    return para
+
+
+def scale_para(para, rate) -> np.ndarray:
+    """Vectorized Money.scale: int64 para times an exact rate, rounded half to even."""
+    rate = _ratio(rate)
+    scaled = np.asarray(para, dtype=np.int64) * rate.numerator
+    quotient, remainder = np.divmod(scaled, rate.denominator)
+    round_up = (2 * remainder > rate.denominator) | ((2 * remainder == rate.denominator) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+def para_to_dinars(para) -> np.ndarray:
+    """Whole dinars, truncated towards zero like int() on the float bills."""
+    para = np.asarray(para, dtype=np.int64)
+    return np.where(para >= 0, para // PARA_PER_DINAR, -(-para // PARA_PER_DINAR))
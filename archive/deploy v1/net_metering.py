@@ -0,0 +1,137 @@
+import numpy as np
+
+from tariff import load_tariff
+from ubill import (excess_chain, _escalation, _para_costs, _solar_charges, _solar_costs, _solar_energy,
+                   _ubill_charges, _ubill_costs)
+
+
+class NetMetering:
+    """
+    Prosumer net metering: exported kWh offset imported ones, what's left over carries into the next month
+    and is zeroed after reset_month. NetMetering(3) is what SolarBill does.
+
+    A policy is anything with netExports, excess() and charges(), bill_policies() needs nothing else.
+    """
+
+    netExports = True
+
+    def __init__(self, reset_month: int = 3):
+        if not 1 <= reset_month <= 12:
+            raise ValueError(f"reset_month must be 1-12, got {reset_month}")
+        self.reset_month = reset_month
+
+    def excess(self, usage, production) -> np.ndarray:
+        """kWh carried into every month of a horizon starting in January, shape (..., months)."""
+        return excess_chain(usage, production, reset_month=self.reset_month)
+
+    def charges(self, energy: dict, f, t) -> dict:
+        """Extra bill lines before excise, in float RSD, on top of the ones SolarBill has."""
+        return {}
+
+
+class NetBilling:
+    """
+    Net billing: every imported kWh is paid in full and nothing carries over,
+    exported kWh are bought by the supplier and credited on the same bill.
+    """
+
+    netExports = False
+
+    def __init__(self, export_price: float = None):
+        """
+        Args:
+            export_price (float): RSD per exported kWh, the tariff's solar_higher_kwh_cost by default
+        """
+        self.export_price = export_price
+
+    def excess(self, usage, production) -> np.ndarray:
+        return np.zeros(np.shape(usage), dtype=np.int64)
+
+    def charges(self, energy: dict, f, t) -> dict:
+        price = t.solar_higher_kwh_cost if self.export_price is None else self.export_price
+        # a credit, it can take a sunny month's bill below zero
+        return {"izvozKredit": -(energy["kwhExported"] * price * f)}
+
+
+POLICIES = {
+    "march_reset": NetMetering(3),
+    "december_reset": NetMetering(12),
+    "net_billing": NetBilling(),
+}
+""" policies known by name, see register_policy() """
+
+
+def register_policy(name: str, policy):
+    """Make a policy available by name to bill_policies(), replacing any policy registered under it before."""
+    POLICIES[name] = policy
+
+
+def get_policy(name: str):
+    if name not in POLICIES:
+        raise ValueError(f"Unknown net metering policy '{name}', expected one of {list(POLICIES)}")
+    return POLICIES[name]
+
+
+def bill_policies(usage, production, policies=None, higherTariffPercent=0.85, permittedPower=11.4, months=300,
+                  usedOnSpot=None, tariff=None, para=False):
+    """
+    bill_batch() under several net metering policies in one pass.
+
+    Ubills don't depend on the policy, they are computed once and shared by all of them.
+    Per policy only the solar side is redone: the excess chain, the netting and the policy's own lines.
+
+    Args:
+        usage: (customers, 12) monthly kWh
+        production: (customers, 12) monthly kWh
+        policies: list of names in POLICIES, or a {name: policy} dict, all registered policies by default
+        higherTariffPercent: one value per customer, or a single value for all of them
+        permittedPower: one value per customer, or a single value for all of them
+        months (int): length of the horizon, starting with a January
+        usedOnSpot: optional (customers, 12) kWh of solar used on the spot
+        tariff (TariffSchedule): defaults to load_tariff()
+        para (bool): exact costs in para, see bill_horizon()
+
+    Returns:
+        tuple: (ubill_costs, {policy: solar_costs}), int64 matrices of shape (customers, months)
+    """
+    usage = np.trunc(np.atleast_2d(np.asarray(usage, dtype=np.float64))).astype(np.int64)
+    production = np.trunc(np.atleast_2d(np.asarray(production, dtype=np.float64))).astype(np.int64)
+    customers = usage.shape[0]
+
+    if usage.shape != (customers, 12) or production.shape != (customers, 12):
+        raise ValueError(f"usage and production must both be (customers, 12), got {usage.shape} and {production.shape}")
+
+    if policies is None:
+        policies = dict(POLICIES)
+    if not isinstance(policies, dict):
+        policies = {name: get_policy(name) for name in policies}
+
+    higherTariffPercent = np.broadcast_to(np.asarray(higherTariffPercent, dtype=np.float64), (customers,))
+    permittedPower = np.broadcast_to(np.asarray(permittedPower, dtype=np.float64), (customers,))
+    if usedOnSpot is not None:
+        usedOnSpot = np.broadcast_to(np.asarray(usedOnSpot, dtype=np.float64), (customers, 12))[:, None, :]
+
+    t = tariff or load_tariff()
+    years = -(-months // 12)
+    escalation = _escalation(years)
+    ubill_total = _para_costs if para else _ubill_costs
+    solar_total = _para_costs if para else _solar_costs
+
+    ubill_costs = ubill_total(_ubill_charges(usage, higherTariffPercent, permittedPower, escalation, t), t)
+
+    # every bill of the horizon as (customers, years, 12)
+    horizon = (customers, years, 12)
+    usage_by_year = np.broadcast_to(usage[:, None, :], horizon)
+    production_by_year = np.broadcast_to(production[:, None, :], horizon)
+    f = escalation[:, None]
+
+    solar_costs = {}
+    for name, policy in policies.items():
+        excess = policy.excess(usage_by_year.reshape(customers, -1), production_by_year.reshape(customers, -1)).reshape(horizon)
+        energy = _solar_energy(usage_by_year, production_by_year, excess, higherTariffPercent[:, None], usedOnSpot, t,
+                               netExports=policy.netExports)
+        charges = _solar_charges(energy, permittedPower, f, t)
+        charges.update(policy.charges(energy, f, t))
+        solar_costs[name] = solar_total(charges, t).reshape(customers, -1)[:, :months]
+
+    return ubill_costs.reshape(customers, -1)[:, :months], solar_costs
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from http_retry import request_json
+
+
+# point this at a local pdf_stub.py server to render without the real API
+PDF_API_BASE_URL = os.environ.get("PDF_API_BASE_URL", "https://api.craftmypdf.com/v1")
+PDF_API_KEY = os.environ.get("PDF_API_KEY")
+""" only ever from the environment, never committed """
+PROPOSAL_TEMPLATE_ID = "cb377b23816e949c"
+MAX_CONNECTIONS = 8
+REQUEST_TIMEOUT = 60 # seconds, rendering a proposal takes a few
+MAX_RETRIES = 3
+BACKOFF_BASE = 1 # seconds, doubled on every retry
+BACKOFF_MAX = 20 # seconds
+EXPIRATION = 10 # minutes the rendered file stays downloadable
+
+
+class PDFRenderError(Exception):
+    """The PDF API could not be reached, kept failing after all retries, or didn't return a file."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+        """ HTTP status of the last failed attempt, None for connection errors and malformed responses """
+
+
+class PDFClient:
+    """
+    Shared client for the craftmypdf create API.
+
+    Keeps one keep-alive session with up to max_connections connections, and renders on a thread pool
+    of the same size, so many proposals can be submitted at once and come back as futures.
+    Every request has a timeout, throttling, server and connection errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, api_key: str = None, template_id: str = PROPOSAL_TEMPLATE_ID, base_url: str = None,
+                 max_connections: int = MAX_CONNECTIONS, timeout: float = REQUEST_TIMEOUT, max_retries: int = MAX_RETRIES):
+        """
+        Args:
+            api_key (str): defaults to PDF_API_KEY, a PDFRenderError is raised when neither is set
+            template_id (str): template rendered when create() isn't given one
+            base_url (str): API root the create endpoint lives under, defaults to PDF_API_BASE_URL
+            max_connections (int): renders in flight at once, also the size of the connection pool
+            timeout (float): seconds to wait for a single response
+            max_retries (int): retries on 429/5xx and connection errors before giving up with a PDFRenderError
+        """
+        self.api_key = api_key or PDF_API_KEY
+        if not self.api_key:
+            raise PDFRenderError("No PDF API key, set the PDF_API_KEY environment variable or pass api_key")
+        self.template_id = template_id
+        self.base_url = (base_url or PDF_API_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.calls = 0
+        """ requests actually sent, retries included """
+        self.retries = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["X-API-KEY"] = self.api_key
+
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="pdf")
+
+    def create(self, output_data: dict, template_id: str = None, expiration: int = EXPIRATION,
+               output_file: str = "output.pdf") -> str:
+        """
+        Render output_data into a PDF.
+
+        Args:
+            output_data (dict): the template's data, e.g. what main() computes
+            template_id (str): defaults to the client's template
+            expiration (int): minutes the file stays downloadable
+
+        Returns:
+            str: URL of the rendered file
+        """
+        payload = {
+            "data": json.dumps(output_data),
+            "output_file": output_file,
+            "export_type": "json",
+            "expiration": expiration,
+            "template_id": template_id or self.template_id
+        }
+        response = self._request(f"{self.base_url}/create", payload)
+
+        if response.get("status") not in (None, "success") or "file" not in response:
+            raise PDFRenderError(f"PDF API didn't return a file: {response.get('message', response)}")
+        return response["file"]
+
+    def submit(self, output_data: dict, **kwargs) -> Future:
+        """Start rendering in the background, the future's result is what create() returns."""
+        return self._executor.submit(self.create, output_data, **kwargs)
+
+    async def create_async(self, output_data: dict, **kwargs) -> str:
+        """create() for coroutines, the event loop keeps running while the PDF renders."""
+        return await asyncio.wrap_future(self.submit(output_data, **kwargs))
+
+    def create_many(self, outputs: list, return_exceptions: bool = False, **kwargs) -> list:
+        """
+        Render several proposals concurrently.
+
+        Args:
+            outputs (list): output_data dictionaries
+            return_exceptions (bool): put the PDFRenderError of a failed render in its place instead of raising it
+
+        Returns:
+            list: file URLs in the same order as outputs
+        """
+        futures = [self.submit(output_data, **kwargs) for output_data in outputs]
+        if not return_exceptions:
+            return [future.result() for future in futures]
+        return [future.exception() or future.result() for future in futures]
+
+    def _request(self, url: str, payload: dict) -> dict:
+        """POST to the API, retrying throttling and server errors, and return the decoded JSON."""
+        def send():
+            self.calls += 1
+            return self.session.post(url, json=payload, timeout=self.timeout)
+
+        return request_json(send, PDFRenderError, "PDF API", self.max_retries, BACKOFF_BASE, BACKOFF_MAX, self._count_retry)
+
+    def _count_retry(self):
+        self.retries += 1
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def default_pdf_client() -> PDFClient:
+    """Shared client for the proposal template, created on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = PDFClient()
+    return _default_client
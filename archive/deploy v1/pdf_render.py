@@ -0,0 +1,437 @@
+import asyncio
+import functools
+import hashlib
+import json
+import math
+import os
+import re
+import unicodedata
+import zlib
+from decimal import Decimal
+
+
+RENDER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rendered")
+PAGE_WIDTH = 595 # A4, in points
+PAGE_HEIGHT = 842
+MARGIN = 50
+
+# proposal design colours, the same as the pygal charts used
+YELLOW = (0.973, 0.824, 0.416) # f8d26a
+BLUE = (0.063, 0.18, 0.365) # 102e5d
+DARK = (0.15, 0.15, 0.15)
+GREY = (0.45, 0.45, 0.45)
+LIGHT_GREY = (0.85, 0.85, 0.85)
+WHITE = (1, 1, 1)
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'Maj', 'Jun', 'Jul', 'Avg', 'Sep', 'Okt', 'Nov', 'Dec']
+
+# Helvetica and Helvetica-Bold are among the 14 fonts every PDF viewer has, so nothing needs embedding, only their
+# widths (for alignment) and an encoding. WinAnsi covers Š š Ž ž, the other Serbian letters take over unused codes.
+SERBIAN_CODES = {"Č": 128, "č": 129, "Ć": 130, "ć": 131, "Đ": 132, "đ": 133, "Š": 138, "Ž": 142, "š": 154, "ž": 158}
+SERBIAN_GLYPHS = "[128 /Ccaron /ccaron /Cacute /cacute /Dcroat /dcroat]"
+# file names keep the letters, Đ has no decomposition so NFKD alone would drop it
+SERBIAN_ASCII = str.maketrans({"Č": "C", "č": "c", "Ć": "C", "ć": "c", "Đ": "Dj", "đ": "dj", "Š": "S", "š": "s", "Ž": "Z", "ž": "z"})
+
+# widths of the printable ASCII characters (32-126) in 1/1000 of the font size, from the Adobe metrics
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278, *[556] * 10, 278, 278, 584, 584, 584,
+    556, 1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778, 667, 778, 722, 667, 611, 722,
+    667, 944, 667, 667, 611, 278, 278, 278, 469, 556, 333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222,
+    833, 556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584]
+HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278, *[556] * 10, 333, 333, 584, 584, 584,
+    611, 975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778, 667, 778, 722, 667, 611, 722,
+    667, 944, 667, 667, 611, 333, 278, 333, 584, 556, 333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278,
+    889, 611, 611, 611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584]
+SERBIAN_WIDTHS = {
+    "F1": {"Č": 722, "č": 500, "Ć": 722, "ć": 500, "Đ": 722, "đ": 556, "Š": 667, "Ž": 611, "š": 500, "ž": 500},
+    "F2": {"Č": 722, "č": 556, "Ć": 722, "ć": 556, "Đ": 722, "đ": 611, "Š": 667, "Ž": 611, "š": 556, "ž": 500},
+}
+
+FONT_OBJECTS = {"F1": 3, "F2": 4}
+""" fonts are always objects 3 and 4 of a document, so cached charts can point at them """
+
+
+# --- fonts ---------------------------------------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=None)
+def _widths(font: str) -> tuple:
+    """Width of every code 0-255 of the font."""
+    widths = [556] * 256
+    widths[32:127] = HELVETICA_WIDTHS if font == "F1" else HELVETICA_BOLD_WIDTHS
+    for letter, code in SERBIAN_CODES.items():
+        widths[code] = SERBIAN_WIDTHS[font][letter]
+    return tuple(widths)
+
+
+@functools.lru_cache(maxsize=None)
+def _font_object(font: str) -> bytes:
+    """Font dictionary, the same bytes in every document."""
+    base_font = "Helvetica" if font == "F1" else "Helvetica-Bold"
+    widths = " ".join(str(width) for width in _widths(font)[32:256])
+    return (f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} /FirstChar 32 /LastChar 255 /Widths [{widths}] "
+            f"/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding /Differences {SERBIAN_GLYPHS} >> >>").encode("latin-1")
+
+
+def _encode(text: str) -> bytes:
+    """Text in the fonts' encoding, anything they can't show becomes '?'."""
+    encoded = bytearray()
+    for char in text:
+        code = SERBIAN_CODES.get(char)
+        if code is None:
+            code = ord(char) if 32 <= ord(char) < 127 or 160 <= ord(char) < 256 else ord("?")
+        encoded.append(code)
+    return bytes(encoded)
+
+
+def text_width(text: str, font: str, size: float) -> float:
+    widths = _widths(font)
+    return sum(widths[code] for code in _encode(text)) * size / 1000
+
+
+def _string(encoded: bytes) -> bytes:
+    return b"(" + encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+# --- drawing -------------------------------------------------------------------------------------------------------
+
+def _rgb(color: tuple) -> str:
+    return " ".join(f"{c:g}" for c in color)
+
+
+def _rect(x: float, y: float, width: float, height: float, color: tuple) -> bytes:
+    return f"{_rgb(color)} rg {x:.2f} {y:.2f} {width:.2f} {height:.2f} re f\n".encode("latin-1")
+
+
+def _line(x1: float, y1: float, x2: float, y2: float, color: tuple, width: float = 0.5) -> bytes:
+    return f"{_rgb(color)} RG {width:g} w {x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S\n".encode("latin-1")
+
+
+def _text(x: float, y: float, text: str, font: str = "F1", size: float = 11, color: tuple = DARK, align: str = "left") -> bytes:
+    if align == "right":
+        x -= text_width(text, font, size)
+    elif align == "center":
+        x -= text_width(text, font, size) / 2
+    return (f"BT /{font} {size:g} Tf {_rgb(color)} rg {x:.2f} {y:.2f} Td ".encode("latin-1")
+            + _string(_encode(text)) + b" Tj ET\n")
+
+
+def _stream(content: bytes, dictionary: str = "") -> bytes:
+    compressed = zlib.compress(content, 6)
+    return (f"<< {dictionary}/Filter /FlateDecode /Length {len(compressed)} >>\nstream\n".encode("latin-1")
+            + compressed + b"\nendstream")
+
+
+def _form(content: bytes, width: float, height: float) -> bytes:
+    """A chart as a Form XObject, drawn in its own width x height box."""
+    fonts = " ".join(f"/{name} {number} 0 R" for name, number in FONT_OBJECTS.items())
+    return _stream(content, f"/Type /XObject /Subtype /Form /BBox [0 0 {width:g} {height:g}] "
+                            f"/Resources << /Font << {fonts} >> >> ")
+
+
+def number(value) -> str:
+    """1234567 -> '1.234.567', the way amounts are written in Serbian."""
+    return f"{int(round(float(value))):,}".replace(",", ".")
+
+
+def _percentage(value) -> float:
+    # output_data percentages are Decimal strings with 2 significant digits, '1.2E+2' included
+    return float(Decimal(str(value)))
+
+
+# --- charts --------------------------------------------------------------------------------------------------------
+
+def _axis_step(largest: float, ticks: int = 4) -> float:
+    """Round step (1, 2, 2.5 or 5 times a power of 10) that covers largest in about ticks steps."""
+    if largest <= 0:
+        return 1
+    rough = largest / ticks
+    magnitude = 10 ** math.floor(math.log10(rough))
+    for factor in (1, 2, 2.5, 5, 10):
+        if factor * magnitude >= rough:
+            return factor * magnitude
+
+
+@functools.lru_cache(maxsize=4096)
+def cost_chart(pre_solar: tuple, post_solar: tuple, width: float = 495, height: float = 270) -> bytes:
+    """
+    Monthly costs without and with solar side by side, as a Form XObject.
+
+    Cached by the costs, so re-rendering a proposal (a new price, another sales rep) reuses the chart.
+    """
+    left, bottom, right, top = 55, 42, 5, 10
+    plot_width, plot_height = width - left - right, height - bottom - top
+
+    step = _axis_step(max(max(pre_solar), max(post_solar), 0))
+    axis_top = step * max(1, math.ceil(max(max(pre_solar), max(post_solar), 0) / step))
+
+    content = bytearray()
+    for tick in range(int(round(axis_top / step)) + 1):
+        y = bottom + plot_height * tick * step / axis_top
+        content += _line(left, y, width - right, y, LIGHT_GREY)
+        content += _text(left - 6, y - 3, number(tick * step), size=8, color=GREY, align="right")
+
+    group = plot_width / 12
+    bar = group * 0.36
+    for month in range(12):
+        x = left + month * group + group * 0.14
+        for offset, value, color in ((0, pre_solar[month], YELLOW), (bar, post_solar[month], BLUE)):
+            if value > 0:
+                content += _rect(x + offset, bottom, bar, plot_height * value / axis_top, color)
+        content += _text(x + bar, bottom - 14, MONTHS[month], size=8, color=GREY, align="center")
+
+    for x, label, color in ((left, "Bez solara", YELLOW), (left + 110, "Sa solarom", BLUE)):
+        content += _rect(x, 4, 10, 10, color)
+        content += _text(x + 15, 5, label, size=10)
+
+    return _form(bytes(content), width, height)
+
+
+@functools.lru_cache(maxsize=1024)
+def coverage_chart(solar_percentage: str, import_percentage: str, width: float = 495, height: float = 50) -> bytes:
+    """How much of the usage solar covers, one bar split between solar and the grid, as a Form XObject."""
+    solar = min(max(_percentage(solar_percentage), 0), 100)
+
+    content = bytearray()
+    content += _rect(0, 22, width * solar / 100, 24, YELLOW)
+    content += _rect(width * solar / 100, 22, width * (100 - solar) / 100, 24, BLUE)
+    content += _text(0, 6, f"Solar {_percentage(solar_percentage):g}%", "F2", 10)
+    content += _text(width, 6, f"EPS {_percentage(import_percentage):g}%", "F2", 10, align="right")
+
+    return _form(bytes(content), width, height)
+
+
+# --- template ------------------------------------------------------------------------------------------------------
+
+class CompiledTemplate:
+    """
+    A proposal template bound to one sales company.
+
+    Everything that's the same on every proposal of the company (header, footer, labels, rules) is turned into
+    compressed content streams once. Rendering a proposal only writes its own values and looks its charts up.
+    """
+
+    def __init__(self, pages: list):
+        """
+        Args:
+            pages (list): per page, drawing operations: static ones are bytes, dynamic ones functions of output_data
+                returning bytes, and ('chart', x, y, function of output_data returning a Form XObject)
+        """
+        self.pages = []
+        for operations in pages:
+            static = b"".join(operation for operation in operations if isinstance(operation, bytes))
+            dynamic = [operation for operation in operations if callable(operation)]
+            charts = [operation[1:] for operation in operations if isinstance(operation, tuple)]
+            self.pages.append((_stream(static), dynamic, charts))
+
+    def render(self, output_data: dict) -> bytes:
+        """The proposal PDF of output_data."""
+        objects = [None, None, _font_object("F1"), _font_object("F2")]
+        page_numbers = []
+
+        for static, dynamic, charts in self.pages:
+            page_number = len(objects) + 1
+            static_number = page_number + 1
+            content = b"".join(operation(output_data) for operation in dynamic)
+            xobjects = []
+            for index, (x, y, chart) in enumerate(charts):
+                content += f"q 1 0 0 1 {x:g} {y:g} cm /X{index} Do Q\n".encode("latin-1")
+                xobjects.append(chart(output_data))
+
+            fonts = " ".join(f"/{name} {number} 0 R" for name, number in FONT_OBJECTS.items())
+            xobject_refs = " ".join(f"/X{index} {static_number + 2 + index} 0 R" for index in range(len(xobjects)))
+            page = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                    f"/Contents [{static_number} 0 R {static_number + 1} 0 R] "
+                    f"/Resources << /Font << {fonts} >> /XObject << {xobject_refs} >> >> >>").encode("latin-1")
+
+            objects += [page, static, _stream(content), *xobjects]
+            page_numbers.append(page_number)
+
+        kids = " ".join(f"{number} 0 R" for number in page_numbers)
+        objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+        objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_numbers)} >>".encode("latin-1")
+        return _document(objects)
+
+
+def _document(objects: list) -> bytes:
+    pdf = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def _value(path: str, suffix: str = "", formatter=str):
+    """Dynamic text: the output_data value at the dotted path, formatted."""
+    keys = path.split(".")
+
+    def get(output_data):
+        value = output_data
+        for key in keys:
+            value = value[key]
+        return formatter(value) + suffix
+
+    return get
+
+
+def _frame(sales_company: dict) -> list:
+    """Header and footer of every page."""
+    top = PAGE_HEIGHT - 70
+    return [
+        _rect(0, top, PAGE_WIDTH, 70, BLUE),
+        _text(MARGIN, top + 28, sales_company.get("name", ""), "F2", 22, WHITE),
+        _text(PAGE_WIDTH - MARGIN, top + 40, sales_company.get("website", ""), size=10, color=WHITE, align="right"),
+        _text(PAGE_WIDTH - MARGIN, top + 24, sales_company.get("phone", ""), size=10, color=WHITE, align="right"),
+        _rect(0, 0, PAGE_WIDTH, 55, BLUE),
+        _text(MARGIN, 30, "Vaš savetnik", size=9, color=YELLOW),
+        lambda output_data: _text(MARGIN, 15, output_data["sales_rep"]["name"], "F2", 11, WHITE),
+        lambda output_data: _text(PAGE_WIDTH - MARGIN, 15, f"{output_data['sales_rep']['phone']}   {output_data['sales_rep']['email']}",
+                                  size=10, color=WHITE, align="right"),
+    ]
+
+
+def _section(y: float, title: str) -> list:
+    return [_text(MARGIN, y, title, "F2", 14, BLUE), _rect(MARGIN, y - 8, PAGE_WIDTH - 2 * MARGIN, 1.5, YELLOW)]
+
+
+def _rows(y: float, rows: list, spacing: float = 22) -> list:
+    """
+    Label on the left, value right aligned, a thin rule under each row.
+
+    Args:
+        rows (list): (label, function of output_data returning the value) or (label, function, bold)
+    """
+    operations = []
+    for index, (label, value, *bold) in enumerate(rows):
+        row_y = y - index * spacing
+        bold = bool(bold and bold[0])
+        operations.append(_text(MARGIN, row_y, label, "F2" if bold else "F1", 11, DARK))
+        operations.append(lambda output_data, value=value, row_y=row_y, bold=bold:
+                          _text(PAGE_WIDTH - MARGIN, row_y, value(output_data), "F2" if bold else "F1", 11, DARK, "right"))
+        operations.append(_line(MARGIN, row_y - 7, PAGE_WIDTH - MARGIN, row_y - 7, LIGHT_GREY))
+    return operations
+
+
+def _proposal_pages(sales_company: dict) -> list:
+    """The proposal template: system and environment on the first page, costs and payback on the second."""
+    system = [
+        ("Cena sistema", _value("system.cost", " din", number)),
+        ("Paneli", lambda d: f"{d['system']['panel_count']} x {d['system']['panel_brand']} {d['system']['panel_model']}"),
+        ("Snaga panela", _value("system.panel_power", " W")),
+        ("Ukupna snaga", _value("system.total_DC_power", " W", number)),
+        ("Invertor", lambda d: f"{d['system']['inverter_brand']} {d['system']['inverter_model']}"),
+        ("Godišnja proizvodnja", _value("production.annual", " kWh", number)),
+    ]
+    environment = [
+        ("Smanjenje emisije CO2", _value("co2.reduction_kg", " kg godišnje", number)),
+        ("Kao da ste posadili", _value("co2.number_of_trees_equivalent", " stabala", number)),
+        ("Kao da ste prešli manje automobilom", _value("co2.car_kilometres_equivalent", " km", number)),
+    ]
+    costs = [
+        ("Godišnji račun bez solara", _value("annual_costs_pre_solar", " din", number)),
+        ("Godišnji račun sa solarom", _value("annual_costs_post_solar", " din", number)),
+        ("Udeo više tarife", _value("higher_tariff_percentage", "%")),
+        ("Povraćaj investicije", _value("breakeven_time_string")),
+        ("Godina u profitu", _value("years_in_profit")),
+        ("Godišnja ušteda", _value("annual_cost_difference", " din", number), True),
+    ]
+
+    first = [
+        *_frame(sales_company),
+        _text(MARGIN, 725, "Ponuda za solarnu elektranu", "F2", 22, BLUE),
+        lambda d: _text(MARGIN, 698, d["customer_name"], "F2", 13, DARK),
+        lambda d: _text(MARGIN, 681, d["project_address"], "F1", 11, GREY),
+        *_section(640, "Sistem"),
+        *_rows(612, system),
+        *_section(455, "Pokrivenost potrošnje"),
+        ("chart", MARGIN, 380, lambda d: coverage_chart(str(d["solar_percentage_of_usage"]), str(d["import_percentage_of_usage"]))),
+        *_section(330, "Zaštita životne sredine"),
+        *_rows(302, environment),
+    ]
+    second = [
+        *_frame(sales_company),
+        *_section(735, "Mesečni troškovi struje"),
+        ("chart", MARGIN, 445, lambda d: cost_chart(tuple(d["monthly_costs_pre_solar"][str(month)] for month in range(1, 13)),
+                                                  tuple(d["monthly_costs_post_solar"][str(month)] for month in range(1, 13)))),
+        *_section(410, "Isplativost"),
+        *_rows(382, costs),
+    ]
+    return [first, second]
+
+
+@functools.lru_cache(maxsize=64)
+def _compiled(sales_company_json: str) -> CompiledTemplate:
+    return CompiledTemplate(_proposal_pages(json.loads(sales_company_json)))
+
+
+def template(sales_company: dict) -> CompiledTemplate:
+    """The proposal template of a sales company, compiled on first use and kept in memory."""
+    return _compiled(json.dumps(sales_company, sort_keys=True))
+
+
+def _slug(name: str) -> str:
+    """File name friendly form of a customer's name, 'Đorđe Čolić' -> 'djordje-colic'."""
+    ascii_name = unicodedata.normalize("NFKD", name.translate(SERBIAN_ASCII)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", ascii_name.lower()).strip("-") or "proposal"
+
+
+def render_proposal(output_data: dict) -> bytes:
+    """The proposal PDF of output_data, see main()."""
+    return template(output_data["sales_company"]).render(output_data)
+
+
+class LocalPDFRenderer:
+    """
+    Renders proposals on this machine instead of the PDF API, same create() / create_async() / create_many() as PDFClient.
+
+    Files are written to output_dir and don't expire, create() returns the path.
+    """
+
+    def __init__(self, output_dir: str = RENDER_DIR):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def create(self, output_data: dict, output_file: str = None, **kwargs) -> str:
+        """
+        Render output_data and save it.
+
+        Args:
+            output_file (str): file name in output_dir, defaults to the customer's name and a hash of the content
+            kwargs: PDFClient.create() arguments (template_id, expiration), they don't apply here
+
+        Returns:
+            str: path of the PDF
+        """
+        pdf = render_proposal(output_data)
+        if output_file is None:
+            output_file = f"{_slug(output_data.get('customer_name', ''))}-{hashlib.sha1(pdf).hexdigest()[:10]}.pdf"
+
+        path = os.path.join(self.output_dir, output_file)
+        with open(path, "wb") as file:
+            file.write(pdf)
+        return path
+
+    async def create_async(self, output_data: dict, **kwargs) -> str:
+        """create() for coroutines, rendered on a thread so the event loop keeps going."""
+        return await asyncio.to_thread(self.create, output_data, **kwargs)
+
+    def create_many(self, outputs: list, return_exceptions: bool = False, **kwargs) -> list:
+        """Paths of the rendered outputs, in order. Rendering takes milliseconds, so they're simply done one by one."""
+        results = []
+        for output_data in outputs:
+            try:
+                results.append(self.create(output_data, **kwargs))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def close(self):
+        pass
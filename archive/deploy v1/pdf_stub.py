@@ -0,0 +1,180 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+def minimal_pdf(text: str) -> bytes:
+    """A one page PDF saying text, enough for anything downstream that only checks it got a PDF."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1", "replace")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
+
+class PDFStub:
+    """
+    Local stand-in for the craftmypdf /v1/create endpoint.
+
+    Answers like the real API with the URL of a file it serves itself (a one page PDF naming the customer), after
+    a configurable render time. Latency and errors can be injected to see how callers behave under load.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_statuses: tuple = (429, 500, 503), seed: int = None):
+        """
+        Args:
+            port (int): 0 picks a free port, see base_url once started
+            latency (float): seconds every render takes
+            jitter (float): up to this many seconds of random extra latency
+            error_rate (float): share of renders answered with one of error_statuses
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+
+        self.renders = 0
+        self.errors_injected = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._files = {}
+        self._thread = None
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                stub._handle_create(self)
+
+            def do_GET(self):
+                stub._handle_file(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _handle_create(self, handler: BaseHTTPRequestHandler):
+        body = handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+
+        if urlsplit(handler.path).path.rstrip("/") != "/v1/create":
+            return self._respond(handler, 404, {"status": "error", "message": f"unknown endpoint {handler.path}"})
+        if not handler.headers.get("X-API-KEY"):
+            return self._respond(handler, 401, {"status": "error", "message": "missing X-API-KEY"})
+
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors_injected += 1
+                status = self._random.choice(self.error_statuses)
+
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            return self._respond(handler, status, {"status": "error", "message": "injected error"})
+
+        try:
+            payload = json.loads(body)
+            data = json.loads(payload["data"])
+            payload["template_id"]
+        except (KeyError, TypeError, ValueError) as e:
+            return self._respond(handler, 400, {"status": "error", "message": f"bad or missing parameter: {e}"})
+
+        name = f"{uuid.uuid4().hex}.pdf"
+        with self._lock:
+            self.renders += 1
+            # only the text of the page is kept, files are tiny even after many thousands of renders
+            self._files[name] = f"{data.get('customer_name', '')} - {data.get('project_address', '')}"
+
+        host, port = self.server.server_address[:2]
+        self._respond(handler, 200, {"status": "success", "file": f"http://{host}:{port}/files/{name}",
+                                     "transactionRef": name[:-4]})
+
+    def _handle_file(self, handler: BaseHTTPRequestHandler):
+        name = urlsplit(handler.path).path.rsplit("/", 1)[-1]
+        with self._lock:
+            text = self._files.get(name)
+        if text is None:
+            return self._respond(handler, 404, {"status": "error", "message": f"no file {name}"})
+
+        pdf = minimal_pdf(text)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/pdf")
+        handler.send_header("Content-Length", str(len(pdf)))
+        handler.end_headers()
+        handler.wfile.write(pdf)
+
+    def _respond(self, handler: BaseHTTPRequestHandler, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(payload)))
+        if status == 429:
+            handler.send_header("Retry-After", "1")
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def start(self):
+        """Serve from a background thread, returns self so it can be chained."""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="pdf-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the craftmypdf create API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every render takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds of extra random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of renders answered with an error")
+    args = parser.parse_args()
+
+    stub = PDFStub(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    print(f"PDF API stub listening on {stub.base_url}, set PDF_API_BASE_URL to use it")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
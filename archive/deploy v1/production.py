@@ -1,12 +1,65 @@
+import numpy as np
 import requests
+from irradiance_grid import HOURLY_UNSUPPORTED, IrradianceGrid
+from pvgis import PVGISError, client_for, default_client
 
       
 LOSS = 14 # 10%
 
+
+class MonthlyValues:
+    """
+    Twelve monthly values in a float64 array, that still reads like the {1: ..., 12: ...} dict it replaces.
+
+    production.month[7], .values(), .items() and sum() work as before, .array hands the vector to numpy code.
+    """
+
+    __slots__ = ("array",)
+
+    def __init__(self, values=None):
+        self.array = np.zeros(12) if values is None else np.array(values, dtype=np.float64)
+
+    def __getitem__(self, month: int) -> float:
+        if not 1 <= month <= 12:
+            raise KeyError(month)
+        return float(self.array[month - 1])
+
+    def __setitem__(self, month: int, value: float):
+        if not 1 <= month <= 12:
+            raise KeyError(month)
+        self.array[month - 1] = value
+
+    def __contains__(self, month) -> bool:
+        return month in range(1, 13)
+
+    def __iter__(self):
+        return iter(range(1, 13))
+
+    def __len__(self) -> int:
+        return 12
+
+    def keys(self):
+        return range(1, 13)
+
+    def values(self) -> list:
+        return self.array.tolist()
+
+    def items(self):
+        return zip(range(1, 13), self.array.tolist())
+
+    def __eq__(self, other) -> bool:
+        return dict(self.items()) == (dict(other.items()) if isinstance(other, MonthlyValues) else other)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 class Production:
     """Object that calculates annual and monthly productions of a certain solar system."""
 
-    def __init__(self, layout: list, panel_power: int, coordinates: dict):
+    __slots__ = ("month", "annual", "hourly", "interpolation_error")
+
+    def __init__(self, layout: list, panel_power: int, coordinates: dict, client=None, base_url: str = None, hourly: bool = False):
         """
         Initialize a Production object by calling an re.jrc.ec.eu PVCalc API.
 
@@ -18,47 +71,74 @@ class Production:
                 - 'shading' (float)
             panel_power (int)
             coordinates (dict): A dictionary with 'lat' (float) and 'lon' (float) values
+            client (PVGISClient): used for the API calls, defaults to the shared cached client.
+                All planes are requested at once over its pooled session, as 1 kWp yields
+                which are then scaled locally, so changing the panel count never needs a new call.
+                An IrradianceGrid can be passed instead to interpolate yields offline, but not with hourly=True.
+            base_url (str): PVGIS API root, e.g. a local pvgis_stub.py server. When no client is given, the shared
+                client of that root is used (see pvgis.client_for), otherwise the PVGIS_BASE_URL environment variable applies.
+            hourly (bool): also fetch the hourly series of every plane into self.hourly, for the self consumption engine
         """
 
-        self.month = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0, 6: 0, 7: 0, 8: 0, 9: 0, 10: 0, 11: 0, 12: 0}
-        """dictionary of monthly production values. keys are integers 1-12"""
+        self.month = MonthlyValues()
+        """monthly production values, indexed by month 1-12 like a dict, .array is the numpy vector"""
         self.annual = 0
         """ total annual production """
+        self.hourly = None
+        """ numpy array of 8760 hourly production values, only filled when hourly=True """
+        
+        if client is None:
+            client = client_for(base_url) if base_url else default_client()
+        if hourly and isinstance(client, IrradianceGrid):
+            raise ValueError(HOURLY_UNSUPPORTED)
+        
+        self.interpolation_error = getattr(client, 'interpolation_error', None)
+        """ error against live PVGIS when the yields come from an offline IrradianceGrid, None otherwise """
         
         try:
-            # construct the api call
-            api_base_url = f"https://re.jrc.ec.europa.eu/api/PVcalc?loss={LOSS}&outputformat=json&lat={coordinates['lat']}&lon={coordinates['lon']}"
-            
+            # PVcalc output is linear in peakpower, so surfaces sharing slope and orientation are merged
+            # into one effective kWp and a single 1 kWp yield is fetched for them
+            effective_kwp = {}
             for surface in layout:
-
-                #prepare API URL
-                peakpower = panel_power * int(surface['number_of_panels']) / 1000
-                angle = surface['slope']
-                aspect = surface['orientation']
-                url = api_base_url + f"&peakpower={peakpower}&angle={angle}&aspect={aspect}"
-                
-                # API call
-                response = requests.get(url)
-                
-                # if there's an issue, raise an error
-                response.raise_for_status()
-                
-                
-                data = response.json()
+                plane = (surface['slope'], surface['orientation'])
+                kwp = panel_power * int(surface['number_of_panels']) / 1000
+                effective_kwp[plane] = effective_kwp.get(plane, 0) + kwp * (1 - surface['shading'])
+            
+            # prepare one API call per plane
+            requests_params = []
+            for angle, aspect in effective_kwp:
+                requests_params.append({
+                    "lat": coordinates['lat'],
+                    "lon": coordinates['lon'],
+                    "angle": angle,
+                    "aspect": aspect,
+                    "loss": LOSS
+                })
+            
+            # API calls, results come back in the same order as the planes
+            planes_monthly = client.fetch_many(requests_params)
+            
+            # summed in plane order so the result doesn't depend on which call finished first
+            for kwp, monthly in zip(effective_kwp.values(), planes_monthly):
                 
-                for item in data['outputs']['monthly']['fixed']:
+                for this_month, e_m in monthly.items():
                     
-                    this_month = int(item['month'])
-                    
-                    this_month_production = int(item['E_m']) * (1 - surface['shading'])
-                    
-                    self.month[this_month] += this_month_production
+                    self.month[this_month] += e_m * kwp
+
+            if hourly:
+                planes_hourly = client.fetch_many(requests_params, hourly=True)
+                self.hourly = np.zeros(8760)
+                for kwp, series in zip(effective_kwp.values(), planes_hourly):
+                    self.hourly += np.asarray(series) * kwp
 
             self.annual = int(sum(self.month.values()))
             
+        except PVGISError:
+            # already says what went wrong, and callers can tell throttling (status 429) from other failures
+            raise
+
         except requests.exceptions.RequestException as e:
             raise Exception(f"Production API call failed: {e}")
 
         except Exception as e:
             raise Exception(f"An error occurred while instantiating Production object: {e}")
-    
\ No newline at end of file
@@ -0,0 +1,267 @@
+import copy
+import decimal
+import math
+from collections import Counter
+
+import numpy as np
+
+from bill_stream import BillStream
+from breakeven import NO_PAYBACK
+from co2 import CO2
+from money import para_to_dinars
+from production import Production
+from self_consumption import monthly_used_on_spot
+from tariff import load_tariff
+
+
+HORIZON_MONTHS = 300
+PERCENTAGE_CONTEXT = decimal.Context(prec=2)
+""" percentages shown on the proposal have 2 significant digits, used through localcontext() so nothing else in the process is rounded """
+
+
+def _simulate_hourly(load_profile, hourly_self_consumption) -> bool:
+    return load_profile is not None and hourly_self_consumption
+
+
+def _production(layout, panel_power, coordinates, load_profile, hourly_self_consumption, client):
+    return Production(layout=layout, panel_power=panel_power, coordinates=coordinates, client=client,
+                      hourly=_simulate_hourly(load_profile, hourly_self_consumption))
+
+
+def _usage(monthly_usage):
+    return np.array([int(monthly_usage[str(month)]) for month in range(1, 13)])
+
+
+def _used_on_spot(production, monthly_usage, load_profile, hourly_self_consumption):
+    """What SolarBill would use for solar used on the spot, None for the flat 40% rule."""
+    if _simulate_hourly(load_profile, hourly_self_consumption):
+        used_on_spot = monthly_used_on_spot(production, monthly_usage, load_profile)
+        return np.array([used_on_spot[month] for month in range(1, 13)])
+
+    if load_profile is not None:
+        from self_consumption_table import default_table
+        return default_table().used_on_spot_months(production.month.array, _usage(monthly_usage), load_profile)
+
+    return None
+
+
+def _bills(usage, production, higher_tariff_percentage, used_on_spot, tariff):
+    return BillStream(usage, production.month.array, higher_tariff_percentage, usedOnSpot=used_on_spot, tariff=tariff)
+
+
+def _first_year(bills):
+    """(ubill_costs, solar_costs) of the 12 months the proposal shows, exact int64 para."""
+    ubill_costs, solar_costs = bills.costs(0, 1, para=True)
+    return ubill_costs[0], solar_costs[0]
+
+
+def _breakeven(cost, bills, horizon_months):
+    # streams the bills only until they pay for the system, nothing is kept
+    return bills.summarize(int(cost), horizon_months or HORIZON_MONTHS, summary_months=0)["breakeven_months"]
+
+
+def _co2(annual_usage, production):
+    return CO2(annual_usage, production.annual)
+
+
+def _breakeven_text(breakeven, horizon_years: int) -> tuple:
+    """(breakeven_time_string, years_in_profit) as the proposal shows them."""
+    if breakeven == NO_PAYBACK:
+        return f"više od {horizon_years} godina", 0
+
+    months_until_breakeven = math.ceil(breakeven)
+    whole_years_until_breakeven = months_until_breakeven // 12
+    extra_months_until_breakeven = months_until_breakeven % 12
+
+    if extra_months_until_breakeven == 0:
+        breakeven_time_string = f"{whole_years_until_breakeven} godina"
+    elif extra_months_until_breakeven == 1:
+        breakeven_time_string = f"{whole_years_until_breakeven} godina i {extra_months_until_breakeven} mesec"
+    elif extra_months_until_breakeven < 5:
+        breakeven_time_string = f"{whole_years_until_breakeven} godina i {extra_months_until_breakeven} meseca"
+    else:
+        breakeven_time_string = f"{whole_years_until_breakeven} godina i {extra_months_until_breakeven} meseci"
+
+    return breakeven_time_string, horizon_years - whole_years_until_breakeven - 1
+
+
+def _output_data(customer_name, project_address, system, annual_usage, higher_tariff_percentage, sales_rep, sales_company,
+                 horizon_months, production, first_year, breakeven, co2):
+    ubill_costs, solar_costs = first_year
+
+    with decimal.localcontext(PERCENTAGE_CONTEXT):
+        solar_percentage_of_usage = decimal.Decimal(production.annual) / decimal.Decimal(annual_usage) * 100
+        if solar_percentage_of_usage >= 100:
+            import_percentage_of_usage = 0
+        if solar_percentage_of_usage < 100 and solar_percentage_of_usage >= 0:
+            import_percentage_of_usage = 100 - solar_percentage_of_usage
+
+    # whole dinars of every exact monthly bill, and the annual totals are the sum of exactly what the months show
+    ubill_costs = para_to_dinars(ubill_costs)
+    solar_costs = para_to_dinars(solar_costs)
+    annual_costs_pre_solar = int(ubill_costs.sum())
+    annual_costs_post_solar = int(solar_costs.sum())
+    breakeven_time_string, years_in_profit = _breakeven_text(breakeven, (horizon_months or HORIZON_MONTHS) // 12)
+
+    return {
+        "customer_name": customer_name,
+        "project_address": project_address,
+
+        "system": {
+            "cost" : system['cost'],
+            "panel_power": system['panel_power'],
+            "inverter_brand" : system['inverter_brand'],
+            "inverter_model" : system['inverter_model'],
+            "panel_brand" : system['panel_brand'],
+            "panel_model" : system['panel_model'],
+            "panel_count": system['panel_count'],
+            "total_DC_power": system['total_DC_power']
+        },
+
+        "production" : {
+            "annual": production.annual
+        },
+
+        "solar_percentage_of_usage": str(solar_percentage_of_usage),
+        "import_percentage_of_usage": str(import_percentage_of_usage),
+
+        "monthly_costs_pre_solar": {str(month): int(ubill_costs[month - 1]) for month in range(1, 13)},
+        "monthly_costs_post_solar": {str(month): int(solar_costs[month - 1]) for month in range(1, 13)},
+
+        "higher_tariff_percentage": str(int(100*higher_tariff_percentage)),
+        "annual_costs_pre_solar": annual_costs_pre_solar,
+        "annual_costs_post_solar": annual_costs_post_solar,
+        "annual_cost_difference": annual_costs_pre_solar - annual_costs_post_solar,
+        "breakeven_time_string": breakeven_time_string,
+        "years_in_profit": years_in_profit,
+        "co2" : {
+            "reduction_kg" : co2.reduction_kg,
+            "number_of_trees_equivalent" : co2.number_of_trees_equivalent,
+            "car_kilometres_equivalent": co2.car_kilometres_equivalent
+        },
+
+        "sales_rep" : sales_rep,
+
+        "sales_company": sales_company
+    }
+
+
+# node: (dependencies, function), the function gets the dependencies' values in this order.
+# A dependency is another node, or else a dotted path into the proposal data ('options' holds what isn't proposal data).
+NODES = {
+    "tariff": (("ubill.tariff_version",), load_tariff),
+    "production": (("layout", "system.panel_power", "coordinates", "ubill.load_profile",
+                    "options.hourly_self_consumption", "options.client"), _production),
+    "usage": (("ubill.monthly_usage",), _usage),
+    "used_on_spot": (("production", "ubill.monthly_usage", "ubill.load_profile", "options.hourly_self_consumption"), _used_on_spot),
+    "bills": (("usage", "production", "ubill.higher_tariff_percentage", "used_on_spot", "tariff"), _bills),
+    "first_year": (("bills",), _first_year),
+    "breakeven": (("system.cost", "bills", "options.horizon_months"), _breakeven),
+    "co2": (("ubill.annual_usage", "production"), _co2),
+    "output_data": (("customer_name", "project_address", "system", "ubill.annual_usage", "ubill.higher_tariff_percentage",
+                     "sales_rep", "sales_company", "options.horizon_months", "production", "first_year", "breakeven", "co2"), _output_data),
+}
+
+
+def _overlaps(path: str, other: str) -> bool:
+    """Whether changing one of the paths changes the other, 'system' and 'system.cost' overlap."""
+    return path == other or path.startswith(other + ".") or other.startswith(path + ".")
+
+
+class ProposalGraph:
+    """
+    A proposal as a dependency graph: inputs -> production -> bills -> breakeven -> CO2 -> output_data.
+
+    Every node is computed on first use and kept until one of its inputs changes. update() only drops the nodes
+    downstream of what changed, so a new system cost recomputes breakeven and output_data, not production or the bills.
+    The bills node is a BillStream, breakeven reads it only as far as it needs to, whatever the horizon.
+    """
+
+    def __init__(self, data: dict, hourly_self_consumption: bool = False, client=None, horizon_months: int = HORIZON_MONTHS):
+        """
+        Args:
+            data (dict): shaped like input_json in main.py, copied so later edits have to go through update()
+            hourly_self_consumption (bool): see main()
+            client (PVGISClient): for production, the shared default_client() when None
+            horizon_months (int): how long the system has to pay back in, also the years_in_profit horizon
+        """
+        self.data = copy.deepcopy(data)
+        self.data["options"] = {"hourly_self_consumption": hourly_self_consumption, "client": client,
+                                "horizon_months": horizon_months}
+
+        self.computed = Counter()
+        """ how many times each node was computed, to see what an edit cost """
+
+        self._values = {}
+        self._dependents = {name: set() for name in NODES}
+        for name, (dependencies, _) in NODES.items():
+            for dependency in dependencies:
+                if dependency in NODES:
+                    self._dependents[dependency].add(name)
+
+    def input(self, path: str):
+        value = self.data
+        for key in path.split("."):
+            if key not in value:
+                return None
+            value = value[key]
+        return value
+
+    def get(self, name: str):
+        """Value of a node, computed (along with whatever it needs) only if it isn't known yet."""
+        if name not in NODES:
+            raise KeyError(f"Unknown node '{name}', expected one of {list(NODES)}")
+
+        if name not in self._values:
+            dependencies, function = NODES[name]
+            arguments = [self.get(dependency) if dependency in NODES else self.input(dependency) for dependency in dependencies]
+            self._values[name] = function(*arguments)
+            self.computed[name] += 1
+
+        return self._values[name]
+
+    def provide(self, name: str, value):
+        """
+        Use a value computed elsewhere for a node, e.g. production fetched by the service before the bills
+        are handed to a worker process. Whatever was computed downstream of it is dropped.
+        """
+        if name not in NODES:
+            raise KeyError(f"Unknown node '{name}', expected one of {list(NODES)}")
+
+        for dependent in self._downstream(self._dependents[name]):
+            self._values.pop(dependent, None)
+        self._values[name] = value
+
+    def _downstream(self, names) -> set:
+        """The nodes given and every node that depends on them, directly or not."""
+        stale = set(names)
+        pending = list(stale)
+        while pending:
+            for dependent in self._dependents[pending.pop()]:
+                if dependent not in stale:
+                    stale.add(dependent)
+                    pending.append(dependent)
+        return stale
+
+    def update(self, path: str, value):
+        """
+        Change one input, e.g. update('system.cost', 650000), and forget every node downstream of it.
+
+        Returns:
+            set: names of the nodes that were dropped
+        """
+        if self.input(path) == value:
+            return set()
+
+        *parents, key = path.split(".")
+        target = self.data
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = value if parents == ["options"] else copy.deepcopy(value)
+
+        stale = self._downstream(name for name, (dependencies, _) in NODES.items()
+                                 if any(dependency not in NODES and _overlaps(path, dependency) for dependency in dependencies))
+
+        for name in stale:
+            self._values.pop(name, None)
+        return stale
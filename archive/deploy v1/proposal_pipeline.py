@@ -0,0 +1,249 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from proposal_graph import HORIZON_MONTHS, ProposalGraph
+from proposal_service import _compute_output
+
+
+COMPUTE_WORKERS = 2 * (os.cpu_count() or 1)
+""" threads of the compute stage, they wait on PVGIS and then on a worker process for the bills, twice the CPUs so every process stays busy """
+RENDER_WORKERS = 8
+""" renders mostly wait on the PDF API, so more of them than compute workers """
+UPLOAD_WORKERS = 4
+QUEUE_SIZE = 16
+""" proposals waiting in front of each stage, a full queue blocks the stage before it """
+
+_DONE = object()
+""" end of input marker, passed down the stages once every worker of the stage before has finished """
+
+
+class ProposalJob:
+    """One proposal on its way through the pipeline, each stage fills in its result."""
+
+    __slots__ = ("index", "data", "output_data", "pdf_url", "drive_file_id", "error", "failed_stage")
+
+    def __init__(self, index: int, data: dict):
+        self.index = index
+        """ position in the input, counting from 0 """
+        self.data = data
+        self.output_data = None
+        self.pdf_url = None
+        self.drive_file_id = None
+        self.error = None
+        """ what went wrong, the stages after failed_stage leave the job alone """
+        self.failed_stage = None
+
+
+class Stage:
+    """A pool of threads taking jobs from a bounded queue, doing one step to each and passing them on."""
+
+    def __init__(self, name: str, work, workers: int, queue_size: int = QUEUE_SIZE):
+        """
+        Args:
+            work: function of a ProposalJob, fills in its result
+            workers (int): jobs worked on at once
+            queue_size (int): jobs waiting for a worker
+        """
+        self.name = name
+        self.work = work
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=queue_size)
+
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        """ summed over the workers, busy_seconds / elapsed is how many of them were busy on average """
+
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def _run(self, outbox: queue.Queue, downstream_workers: int):
+        while True:
+            job = self.inbox.get()
+            if job is _DONE:
+                break
+
+            if job.error is None:
+                start = time.perf_counter()
+                try:
+                    self.work(job)
+                except Exception as e:
+                    job.error = f"{type(e).__name__}: {e}"
+                    job.failed_stage = self.name
+                with self._lock:
+                    self.busy_seconds += time.perf_counter() - start
+                    self.processed += 1
+                    self.failed += job.failed_stage == self.name
+
+            # blocks while the next stage is behind, which in turn stops this one taking more work
+            outbox.put(job)
+
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            for _ in range(downstream_workers):
+                outbox.put(_DONE)
+
+    def start(self, outbox: queue.Queue, downstream_workers: int) -> list:
+        self._running = self.workers
+        threads = [threading.Thread(target=self._run, args=(outbox, downstream_workers), name=f"pipeline-{self.name}-{n}",
+                                    daemon=True) for n in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+
+class ProposalPipeline:
+    """
+    Proposals through compute -> render -> upload, every stage on its own workers with a bounded queue in front.
+
+    main() does the three steps one after another, so the CPU waits on the PDF API and the other way around.
+    Here a batch keeps every stage busy at once, and a slow stage fills the queue in front of it and holds the
+    stages before it back (down to reading the input) instead of piling up proposals in memory.
+    """
+
+    def __init__(self, compute_workers: int = COMPUTE_WORKERS, render_workers: int = RENDER_WORKERS,
+                 upload_workers: int = UPLOAD_WORKERS, queue_size: int = QUEUE_SIZE, render=None, upload=None,
+                 hourly_self_consumption: bool = False, horizon_months: int = HORIZON_MONTHS, processes: int = None):
+        """
+        Args:
+            compute_workers (int): proposals in the compute stage at once, see COMPUTE_WORKERS
+            render: function of output_data returning the PDF URL, main.create_pdf() when None,
+                e.g. pdf_render.LocalPDFRenderer().create to render locally. False skips rendering (and uploading).
+            upload: function of (pdf_url, name) returning the Drive file ID, main.upload_to_drive() when None.
+                False skips the upload.
+            hourly_self_consumption (bool): see main()
+            horizon_months (int): see ProposalGraph
+            processes (int): worker processes computing bills, defaults to the number of CPUs
+        """
+        self.queue_size = queue_size
+        self.processes = processes or os.cpu_count()
+        self.hourly_self_consumption = hourly_self_consumption
+        self.horizon_months = horizon_months
+
+        if render is None or upload is None:
+            from main import create_pdf, upload_to_drive
+            render = create_pdf if render is None else render
+            upload = upload_to_drive if upload is None else upload
+        self._render = render
+        self._upload = upload
+        self._cpu_pool = None
+
+        self.stages = [Stage("compute", self._compute_job, compute_workers, queue_size)]
+        if render is not False:
+            self.stages.append(Stage("render", self._render_job, render_workers, queue_size))
+            if upload is not False:
+                self.stages.append(Stage("upload", self._upload_job, upload_workers, queue_size))
+
+    def _compute_job(self, job: ProposalJob):
+        if isinstance(job.data, str):
+            job.data = json.loads(job.data)
+        # production waits on PVGIS, fine on a thread, the bills are CPU work that would hold the GIL,
+        # so they're computed in a worker process as the service does it
+        proposal = ProposalGraph(job.data, self.hourly_self_consumption, horizon_months=self.horizon_months)
+        production = proposal.get("production")
+        job.output_data = self._cpu_pool.submit(_compute_output, job.data, production, self.hourly_self_consumption,
+                                                self.horizon_months).result()
+        # input isn't needed past this point, don't keep it around while the job waits for the PDF
+        job.data = None
+
+    def _render_job(self, job: ProposalJob):
+        job.pdf_url = self._render(job.output_data)
+
+    def _upload_job(self, job: ProposalJob):
+        name = f"{job.output_data['customer_name']} - {job.output_data['project_address']}.pdf"
+        job.drive_file_id = self._upload(job.pdf_url, name)
+
+    def run(self, records):
+        """
+        Yield a ProposalJob for every input_json in records, in the order they get through the last stage.
+
+        Args:
+            records: iterable of input_json dicts (or JSONL lines, parsed by the compute stage so a bad one only
+                fails its own job), read only as fast as the pipeline takes them
+        """
+        # spawned, not forked, the stages are threads a fork would copy mid flight
+        self._cpu_pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            yield from self._run(records)
+        finally:
+            self._cpu_pool.shutdown(wait=True)
+
+    def _run(self, records):
+        results = queue.Queue(maxsize=self.queue_size)
+        for stage, following in zip(self.stages, self.stages[1:] + [None]):
+            if following is None:
+                stage.start(results, 1)
+            else:
+                stage.start(following.inbox, following.workers)
+
+        first = self.stages[0]
+        failure = []
+
+        def feed():
+            try:
+                for index, data in enumerate(records):
+                    first.inbox.put(ProposalJob(index, data))
+            except Exception as e:
+                # reading the input failed, what's already in the pipeline still comes out before it's raised
+                failure.append(e)
+            finally:
+                for _ in range(first.workers):
+                    first.inbox.put(_DONE)
+
+        threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+
+        while True:
+            job = results.get()
+            if job is _DONE:
+                break
+            yield job
+
+        if failure:
+            raise failure[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute, render and upload proposals for a JSONL file of input_json records")
+    parser.add_argument("input", help="JSONL file, one input_json per line")
+    parser.add_argument("output", help="JSONL file with the PDF URL and Drive file ID (or the error) of every record")
+    parser.add_argument("--compute-workers", type=int, default=COMPUTE_WORKERS)
+    parser.add_argument("--processes", type=int, default=None, help="processes computing bills, defaults to the CPU count")
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS)
+    parser.add_argument("--upload-workers", type=int, default=UPLOAD_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    parser.add_argument("--no-upload", action="store_true", help="stop after rendering")
+    parser.add_argument("--local-pdf", action="store_true", help="render PDFs on this machine instead of the PDF API")
+    args = parser.parse_args()
+
+    render = None
+    if args.local_pdf:
+        from pdf_render import LocalPDFRenderer
+        render = LocalPDFRenderer().create
+
+    pipeline = ProposalPipeline(args.compute_workers, args.render_workers, args.upload_workers, args.queue_size,
+                                render=render, upload=False if args.no_upload else None, processes=args.processes)
+
+    def records():
+        with open(args.input, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield line
+
+    start = time.perf_counter()
+    with open(args.output, "w", encoding="utf-8") as output:
+        for job in pipeline.run(records()):
+            output.write(json.dumps({"record": job.index, "pdf_url": job.pdf_url, "drive_file_id": job.drive_file_id,
+                                     "error": job.error, "failed_stage": job.failed_stage}) + "\n")
+    elapsed = time.perf_counter() - start
+
+    for stage in pipeline.stages:
+        print(f"{stage.name}: {stage.processed} processed, {stage.failed} failed, "
+              f"{stage.busy_seconds / elapsed:.1f} of {stage.workers} workers busy on average")
@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from proposal_graph import HORIZON_MONTHS, ProposalGraph
+from pdf_client import PDFRenderError, default_pdf_client
+from pvgis import PVGISError, default_client
+from self_consumption import LOAD_PROFILES
+from self_consumption_table import default_table, table_available
+from tariff import available_tariffs, load_tariff
+
+
+IO_THREADS = 32
+""" threads waiting on PVGIS, they only block on sockets """
+MAX_IN_FLIGHT = 64
+""" proposals computed at once, the rest wait for a slot instead of piling up on the pools """
+MAX_BODY_BYTES = 1024 * 1024
+
+NUMBER = (int, float)
+PROPOSAL_SCHEMA = {
+    "customer_name": str,
+    "project_address": str,
+    "coordinates": {"lat": NUMBER, "lon": NUMBER},
+    "system": {"cost": NUMBER, "panel_power": NUMBER, "inverter_brand": object, "inverter_model": object,
+               "panel_brand": object, "panel_model": object, "panel_count": object, "total_DC_power": object},
+    "layout": [{"number_of_panels": NUMBER, "orientation": NUMBER, "slope": NUMBER, "shading": NUMBER}],
+    "ubill": {"monthly_usage": {str(month): NUMBER for month in range(1, 13)}, "annual_usage": NUMBER,
+              "higher_tariff_percentage": NUMBER},
+    "sales_rep": {"name": object, "phone": object, "email": object},
+    "sales_company": dict,
+}
+""" what a proposal needs, a type (object for anything), a dict of the fields of a nested object or a list of one item schema """
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error", 502: "Bad Gateway"}
+
+
+class ProposalDataError(ValueError):
+    """The proposal data doesn't match PROPOSAL_SCHEMA, or a value in it is out of range."""
+
+
+def _schema_problems(value, schema, path: str) -> list:
+    """What's wrong with value at path, e.g. ['system.cost is str, expected a number'], empty when it fits."""
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return [f"{path} is {type(value).__name__}, expected an object"]
+        problems = []
+        for key, field in schema.items():
+            if key not in value:
+                problems.append(f"{path}.{key} is missing")
+            else:
+                problems += _schema_problems(value[key], field, f"{path}.{key}")
+        return problems
+
+    if isinstance(schema, list):
+        if not isinstance(value, list) or not value:
+            return [f"{path} is {type(value).__name__}, expected a non-empty list"]
+        return [problem for n, item in enumerate(value) for problem in _schema_problems(item, schema[0], f"{path}[{n}]")]
+
+    # bool is an int, but never a kWh or a price
+    if not isinstance(value, schema) or (schema is NUMBER and isinstance(value, bool)):
+        expected = "a number" if schema is NUMBER else schema.__name__
+        return [f"{path} is {type(value).__name__}, expected {expected}"]
+    return []
+
+
+def validate_proposal(data, hourly_self_consumption: bool = False) -> None:
+    """
+    Check input_json before any work is done on it, so a bad proposal is told apart from a bug in the service.
+
+    Args:
+        hourly_self_consumption (bool): see main(), without it a load_profile is looked up in the self consumption
+            table, which has to be built on this machine and cover the profile
+
+    Raises:
+        ProposalDataError: listing every missing field, wrong type and out of range value
+    """
+    if not isinstance(data, dict):
+        raise ProposalDataError("body must be a JSON object shaped like input_json")
+
+    problems = [problem.lstrip(".") for problem in _schema_problems(data, PROPOSAL_SCHEMA, "")]
+    if not problems:
+        ubill = data["ubill"]
+        if ubill["annual_usage"] <= 0:
+            problems.append("ubill.annual_usage must be positive")
+        if not 0 <= ubill["higher_tariff_percentage"] <= 1:
+            problems.append("ubill.higher_tariff_percentage must be between 0 and 1")
+        if any(usage < 0 for usage in ubill["monthly_usage"].values()):
+            problems.append("ubill.monthly_usage can't be negative")
+        if any(not 0 <= surface["shading"] <= 1 for surface in data["layout"]):
+            problems.append("layout shading must be between 0 and 1")
+        if ubill.get("tariff_version") is not None and ubill["tariff_version"] not in available_tariffs():
+            problems.append(f"ubill.tariff_version must be one of {available_tariffs()}")
+        profile = ubill.get("load_profile")
+        if profile is not None and profile not in LOAD_PROFILES:
+            problems.append(f"ubill.load_profile must be one of {list(LOAD_PROFILES)}")
+        elif profile is not None and not hourly_self_consumption:
+            if not table_available():
+                problems.append("ubill.load_profile can't be used, this server has no self consumption table "
+                                "(build it with 'python self_consumption_table.py') and doesn't simulate hourly")
+            elif profile not in default_table().profiles:
+                problems.append(f"ubill.load_profile must be one of {list(default_table().profiles)}, "
+                                f"the profiles in this server's self consumption table")
+
+    if problems:
+        raise ProposalDataError(f"bad proposal data: {'; '.join(problems)}")
+
+
+def _warm_up():
+    """Run once in every worker so the first proposals don't pay for imports and the tariff file."""
+    load_tariff()
+
+
+def _compute_output(data: dict, production, hourly_self_consumption: bool, horizon_months: int) -> dict:
+    """
+    output_data of a proposal whose production is already known, runs in a worker process.
+
+    Everything after production (bills, breakeven, CO2) is CPU work, so it's done away from the event loop.
+    """
+    proposal = ProposalGraph(data, hourly_self_consumption, client=False, horizon_months=horizon_months)
+    proposal.provide("production", production)
+    return proposal.get("output_data")
+
+
+class ProposalService:
+    """
+    Long running local HTTP service that turns input_json (see main.py) into output_data.
+
+    Handlers are async: PVGIS calls and PDF rendering wait on a thread pool without holding up other requests,
+    bills are computed on a pool of worker processes, so the interpreter and its imports are paid once,
+    not per proposal.
+
+        POST /proposal        input_json -> output_data
+        POST /proposal/pdf    input_json -> {"output_data": ..., "pdf_url": ...}
+        GET  /health
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, workers: int = None, client=None, pdf_client=None,
+                 hourly_self_consumption: bool = False, horizon_months: int = HORIZON_MONTHS,
+                 io_threads: int = IO_THREADS, max_in_flight: int = MAX_IN_FLIGHT):
+        """
+        Args:
+            port (int): 0 picks a free port, see base_url once started
+            workers (int): processes computing bills, defaults to the number of CPUs
+            client (PVGISClient): for production, the shared default_client() when None
+            pdf_client (PDFClient): for /proposal/pdf, the shared default_pdf_client() when None, created on the
+                first /proposal/pdf request so a service that only computes doesn't need the PDF API.
+                A pdf_render.LocalPDFRenderer renders on this machine
+            hourly_self_consumption (bool): see main()
+            horizon_months (int): see ProposalGraph
+            io_threads (int): threads waiting on PVGIS
+            max_in_flight (int): proposals computed at once
+        """
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.client = default_client() if client is None else client
+        self._pdf_client = pdf_client
+        self.hourly_self_consumption = hourly_self_consumption
+        self.horizon_months = horizon_months
+        self.max_in_flight = max_in_flight
+
+        self.requests_served = 0
+        self.in_flight = 0
+
+        self._io_pool = ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix="proposal-io")
+        # spawned, not forked, the service process has threads (event loop, PVGIS pool) a fork would copy mid flight
+        self._cpu_pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+        self._loop = None
+        self._stopping = None
+        self._slots = None
+        self._connections = {}
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def pdf_client(self):
+        if self._pdf_client is None:
+            self._pdf_client = default_pdf_client()
+        return self._pdf_client
+
+    async def proposal(self, data: dict) -> dict:
+        """output_data of one proposal, production fetched on the I/O pool and bills computed in a worker process."""
+        validate_proposal(data, self.hourly_self_consumption)
+
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            proposal = ProposalGraph(data, self.hourly_self_consumption, client=self.client, horizon_months=self.horizon_months)
+            production = await loop.run_in_executor(self._io_pool, proposal.get, "production")
+            return await loop.run_in_executor(self._cpu_pool, _compute_output, data, production,
+                                              self.hourly_self_consumption, self.horizon_months)
+
+    async def pdf(self, output_data: dict) -> str:
+        """URL of the rendered proposal PDF, rendered on the PDF client's own pool."""
+        return await self.pdf_client.create_async(output_data)
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> tuple:
+        """(status, response body) of one request."""
+        path = path.rstrip("/")
+        if path == "/health":
+            if method != "GET":
+                return 405, {"error": f"{method} not allowed on {path}"}
+            return 200, {"status": "ok", "workers": self.workers, "in_flight": self.in_flight,
+                         "requests_served": self.requests_served}
+
+        if path not in ("/proposal", "/proposal/pdf"):
+            return 404, {"error": f"unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": f"{method} not allowed on {path}"}
+
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            return 400, {"error": f"body is not JSON: {e}"}
+
+        self.in_flight += 1
+        try:
+            output_data = await self.proposal(data)
+            if path == "/proposal":
+                return 200, output_data
+            return 200, {"output_data": output_data, "pdf_url": await self.pdf(output_data)}
+
+        except ProposalDataError as e:
+            # raised by proposal() before any work is done
+            return 400, {"error": str(e)}
+        except PVGISError as e:
+            return 502, {"error": str(e), "pvgis_status": e.status}
+        except PDFRenderError as e:
+            return 502, {"error": str(e), "pdf_status": e.status}
+        except Exception as e:
+            # the data passed validate_proposal(), whatever else goes wrong is the service's fault
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.in_flight -= 1
+            self.requests_served += 1
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """HTTP/1.1 with keep-alive, one request after another on the same connection."""
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": f"body over {MAX_BODY_BYTES} bytes"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, response = await self._dispatch(method, urlsplit(target).path, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # client went away or sent something that isn't HTTP, nothing to answer
+            pass
+        finally:
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: dict, keep_alive: bool):
+        payload = json.dumps(body).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+
+        try:
+            server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        except OSError as e:
+            self._error = e
+            self._ready.set()
+            return
+
+        self.port = server.sockets[0].getsockname()[1]
+        try:
+            # every worker is started (and has imported the bill code) before the first request comes in
+            await asyncio.gather(*[self._loop.run_in_executor(self._cpu_pool, _warm_up) for _ in range(self.workers)])
+        except Exception as e:
+            server.close()
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+
+        async with server:
+            await self._stopping.wait()
+
+        # idle keep-alive connections see the end of their stream and return instead of being cancelled
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def serve_forever(self):
+        """Serve from this thread until interrupted."""
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._shutdown()
+
+    def start(self):
+        """Serve from a background thread, returns self once it accepts requests so it can be chained."""
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), name="proposal-service", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._shutdown()
+            raise self._error
+        return self
+
+    def stop(self):
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join()
+        self._shutdown()
+
+    def _shutdown(self):
+        self._cpu_pool.shutdown(wait=True)
+        self._io_pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP service computing proposals")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="processes computing bills, defaults to the CPU count")
+    parser.add_argument("--hourly-self-consumption", action="store_true")
+    parser.add_argument("--horizon-months", type=int, default=HORIZON_MONTHS)
+    parser.add_argument("--local-pdf", action="store_true", help="render PDFs on this machine instead of the PDF API")
+    args = parser.parse_args()
+
+    pdf_client = None
+    if args.local_pdf:
+        from pdf_render import LocalPDFRenderer
+        pdf_client = LocalPDFRenderer()
+
+    service = ProposalService(args.host, args.port, args.workers, pdf_client=pdf_client,
+                              hourly_self_consumption=args.hourly_self_consumption, horizon_months=args.horizon_months)
+    print(f"Proposal service listening on http://{args.host}:{args.port}, POST input_json to /proposal")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
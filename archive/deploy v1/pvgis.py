@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from http_retry import request_json
+from pvgis_cache import default_cache, make_key
+
+
+PVGIS_API_URL = "https://re.jrc.ec.europa.eu/api"
+""" the real PVGIS, the only API root whose answers go to the shared cache unless a client is given one """
+# point this at a local pvgis_stub.py server to run without the real API
+PVGIS_BASE_URL = os.environ.get("PVGIS_BASE_URL", PVGIS_API_URL)
+MAX_CONNECTIONS_PER_HOST = 4
+REQUEST_TIMEOUT = 30 # seconds
+RATE_LIMIT = 25 # requests per second, PVGIS starts throttling at 30
+RATE_BURST = 10
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5 # seconds, doubled on every retry
+BACKOFF_MAX = 10 # seconds
+HOURLY_YEAR = 2019 # not a leap year, so hourly series have exactly 8760 values
+
+
+class PVGISError(Exception):
+    """PVGIS could not be reached or kept failing after all retries."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+        """ HTTP status of the last failed attempt, None for connection errors """
+
+
+class TokenBucket:
+    """Thread safe token bucket, acquire() blocks until a request is allowed to go out."""
+
+    def __init__(self, rate: float = RATE_LIMIT, burst: int = RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
+
+
+RATE_LIMITER = TokenBucket()
+""" shared by all clients, so the whole process stays under the PVGIS rate limit """
+
+
+class PVGISClient:
+    """
+    Shared client for the PVGIS PVcalc API.
+
+    Keeps one keep-alive session for all calls and fetches many surfaces at once on a small thread pool,
+    with no more than max_connections requests in flight towards the same host.
+    Identical requests made at the same time are merged into a single call, every call goes through
+    a token bucket, and throttling or server errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(self, cache=None, max_connections: int = MAX_CONNECTIONS_PER_HOST, timeout: float = REQUEST_TIMEOUT,
+                 base_url: str = None, rate_limiter=None, max_retries: int = MAX_RETRIES):
+        """
+        Args:
+            cache (PVGISCache): where responses are looked up before calling the API, defaults to the shared
+                on-disk cache for the real PVGIS (PVGIS_API_URL) and to no cache for any other base_url, so a stub's
+                made up yields never end up in proposals. Pass False to always call the API.
+            max_connections (int): concurrency cap per host, also the size of the connection pool
+            timeout (float): seconds to wait for a single response
+            base_url (str): API root the PVcalc endpoint lives under, defaults to PVGIS_BASE_URL
+            rate_limiter (TokenBucket): defaults to the process wide RATE_LIMITER. Pass False to disable it.
+            max_retries (int): retries on 429/5xx and connection errors before giving up with a PVGISError
+        """
+        self.base_url = (base_url or PVGIS_BASE_URL).rstrip("/")
+        if cache is None:
+            cache = default_cache() if self.base_url == PVGIS_API_URL else False
+        self.cache = cache
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.rate_limiter = RATE_LIMITER if rate_limiter is None else rate_limiter
+        self.max_retries = max_retries
+
+        self.calls = 0
+        """ requests actually sent to PVGIS, retries included """
+        self.coalesced = 0
+        """ fetches that waited for an identical request already in flight instead of sending their own """
+        self.retries = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix="pvgis")
+        self._host_slots = {}
+        self._host_slots_lock = threading.Lock()
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.Semaphore(self.max_connections)
+            return self._host_slots[host]
+
+    def pvcalc_url(self, lat: float, lon: float, peakpower: float, angle: float, aspect: float, loss: float) -> str:
+        return (f"{self.base_url}/PVcalc?loss={loss}&outputformat=json&lat={lat}&lon={lon}"
+                f"&peakpower={peakpower}&angle={angle}&aspect={aspect}")
+
+    def seriescalc_url(self, lat: float, lon: float, peakpower: float, angle: float, aspect: float, loss: float) -> str:
+        return (f"{self.base_url}/seriescalc?loss={loss}&outputformat=json&lat={lat}&lon={lon}"
+                f"&pvcalculation=1&peakpower={peakpower}&angle={angle}&aspect={aspect}"
+                f"&startyear={HOURLY_YEAR}&endyear={HOURLY_YEAR}")
+
+    def _cache_key(self, endpoint: str, lat: float, lon: float, angle: float, aspect: float, loss: float) -> str:
+        """make_key() under the API root and endpoint it's answered by, a cache given to clients of different APIs keeps them apart."""
+        return f"{self.base_url}/{endpoint}?{make_key(lat, lon, angle, aspect, loss)}"
+
+    def fetch_monthly(self, lat: float, lon: float, angle: float, aspect: float, loss: float) -> dict:
+        """
+        Return the monthly {month: E_m} yield of 1 kWp with the given slope and orientation, from cache if possible.
+
+        PVcalc output is linear in peakpower, so callers scale this by their own kWp.
+        """
+        monthly = self._fetch(self._cache_key("PVcalc", lat, lon, angle, aspect, loss), self.pvcalc_url(lat, lon, 1, angle, aspect, loss),
+                              lambda data: {item['month']: item['E_m'] for item in data['outputs']['monthly']['fixed']})
+
+        # JSON turned the month keys into strings on the way through the cache
+        return {int(month): e_m for month, e_m in monthly.items()}
+
+    def fetch_hourly(self, lat: float, lon: float, angle: float, aspect: float, loss: float) -> list:
+        """
+        Return the 8760 hourly kWh yields of 1 kWp over HOURLY_YEAR, from cache if possible.
+
+        Comes from the seriescalc endpoint, whose P output is in W.
+        """
+        return self._fetch(self._cache_key("seriescalc", lat, lon, angle, aspect, loss), self.seriescalc_url(lat, lon, 1, angle, aspect, loss),
+                           lambda data: [round(item['P'] / 1000, 4) for item in data['outputs']['hourly']])
+
+    def _fetch(self, key: str, url: str, parse):
+        """Cache lookup, then a single flight request whose JSON response is turned into the cached value by parse."""
+        value = self.cache.get(key) if self.cache else None
+        if value is not None:
+            return value
+
+        # single flight: the first caller for a key does the request, the others wait for its result
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = parse(self._request(url))
+
+            if self.cache:
+                self.cache.put(key, value)
+
+            future.set_result(value)
+            return value
+
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+    def _request(self, url: str) -> dict:
+        """Call PVGIS under the rate limit, retrying throttling and server errors, and return the decoded JSON."""
+        def send():
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            with self._host_slot(url):
+                self.calls += 1
+                return self.session.get(url, timeout=self.timeout)
+
+        return request_json(send, PVGISError, "PVGIS", self.max_retries, BACKOFF_BASE, BACKOFF_MAX, self._count_retry)
+
+    def _count_retry(self):
+        self.retries += 1
+
+    def fetch_many(self, requests_params: list, hourly: bool = False) -> list:
+        """
+        Fetch several surfaces concurrently.
+
+        Args:
+            requests_params (list): dictionaries of fetch_monthly keyword arguments
+            hourly (bool): fetch hourly series with fetch_hourly instead of monthly yields
+
+        Returns:
+            list: monthly dictionaries (or hourly lists) in the same order as requests_params
+        """
+        fetch = self.fetch_hourly if hourly else self.fetch_monthly
+
+        if len(requests_params) == 1:
+            return [fetch(**requests_params[0])]
+
+        futures = [self._executor.submit(fetch, **params) for params in requests_params]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+_clients = {}
+""" shared clients of other API roots, by base_url """
+
+def default_client() -> PVGISClient:
+    """Shared client backed by the default cache, created on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = PVGISClient()
+    return _default_client
+
+
+def client_for(base_url: str) -> PVGISClient:
+    """
+    Shared client of an API root, e.g. a local pvgis_stub.py server, created on first use.
+
+    A client owns a session and a thread pool, so one per base_url is kept for the whole process
+    instead of leaving a new one open for every proposal.
+    """
+    base_url = base_url.rstrip("/")
+    with _default_client_lock:
+        if base_url not in _clients:
+            _clients[base_url] = PVGISClient(base_url=base_url)
+        return _clients[base_url]
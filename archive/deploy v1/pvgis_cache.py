@@ -0,0 +1,153 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+CACHE_PATH = os.environ.get("PVGIS_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pvgis_cache.sqlite3"))
+CACHE_MAX_ENTRIES = 5000
+CACHE_TTL = 180 * 24 * 3600 # seconds, PVGIS data is based on a TMY so it rarely changes
+BUSY_TIMEOUT = 30 # seconds a write waits while another process holds the database
+TOUCH_BATCH = 256
+""" hits whose last_used is kept in memory before it's written in one go, so lookups don't take the write lock """
+
+
+def make_key(lat: float, lon: float, angle: float, aspect: float, loss: float) -> str:
+    """
+    Build a normalized cache key out of PVcalc parameters.
+
+    Coordinates are rounded to 4 decimals (~10 m), which is way below the PVGIS grid resolution,
+    so 44.0 and 44.00001 end up in the same entry. Cached outputs are per 1 kWp, so peakpower is not part of the key.
+    PVGISClient puts its API root and endpoint in front, the answers of a stub and of PVGIS never share an entry.
+    """
+    return (f"lat={round(float(lat), 4):.4f}&lon={round(float(lon), 4):.4f}"
+            f"&angle={round(float(angle), 1):.1f}&aspect={round(float(aspect), 1):.1f}"
+            f"&loss={round(float(loss), 1):.1f}")
+
+
+class PVGISCache:
+    """
+    Persistent LRU/TTL cache of PVGIS outputs, stored in a sqlite file.
+
+    The file is in WAL mode, so any number of processes (batch workers, the service) can read it while one writes.
+    Hits only write their last_used back every TOUCH_BATCH lookups (or on the next put and on close), which keeps
+    the LRU order a little coarse but means a warm cache is read without locking out the other processes.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        """
+        Open (or create) the cache file.
+
+        Args:
+            path (str): sqlite file location, ':memory:' gives a non persistent cache
+            max_entries (int): least recently used entries above this count get evicted
+            ttl (float): seconds after which an entry is considered stale
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._touched = {}
+        """ key -> last_used of the hits not written yet """
+        self._db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS pvcalc ("
+                         "key TEXT PRIMARY KEY, monthly TEXT NOT NULL, "
+                         "created REAL NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS pvcalc_last_used ON pvcalc (last_used)")
+        self._db.commit()
+
+    def get(self, key: str):
+        """Return the cached value, or None on a miss (stale entries count as a miss)."""
+        now = time.time()
+
+        with self._lock:
+            row = self._db.execute("SELECT monthly, created FROM pvcalc WHERE key = ?", (key,)).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                # a stale entry is left for the put() that follows the miss to replace
+                self.misses += 1
+                return None
+
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH:
+                self._write_touched()
+                self._db.commit()
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def _write_touched(self):
+        self._db.executemany("UPDATE pvcalc SET last_used = ? WHERE key = ?",
+                             [(last_used, key) for key, last_used in self._touched.items()])
+        self._touched.clear()
+
+    def put(self, key: str, value):
+        """Store a JSON serializable value, e.g. a {month: E_m} dictionary, and evict the least recently used entries over the limit."""
+        now = time.time()
+
+        with self._lock:
+            # eviction goes by last_used, so the hits since the last write count
+            self._write_touched()
+            self._db.execute("INSERT OR REPLACE INTO pvcalc (key, monthly, created, last_used) VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(value), now, now))
+
+            overflow = self._db.execute("SELECT COUNT(*) FROM pvcalc").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._db.execute("DELETE FROM pvcalc WHERE key IN "
+                                 "(SELECT key FROM pvcalc ORDER BY last_used ASC LIMIT ?)", (overflow,))
+                self.evictions += overflow
+
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._db.execute("DELETE FROM pvcalc")
+            self._db.commit()
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process plus the number of stored entries, useful for sizing the cache."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM pvcalc").fetchone()[0]
+
+        lookups = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "max_entries": self.max_entries
+        }
+
+    def close(self):
+        with self._lock:
+            if self._touched:
+                self._write_touched()
+                self._db.commit()
+            self._db.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def default_cache() -> PVGISCache:
+    """Shared cache instance backed by CACHE_PATH, opened on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PVGISCache()
+            # writes back the last hits
+            atexit.register(_default_cache.close)
+    return _default_cache
@@ -0,0 +1,291 @@
+"""
+Local stand-in for PVGIS, for load tests and runs without the network.
+
+PVcalc answers are replayed from recorded fixtures in fixtures/pvgis/, one JSON file per set of parameters.
+No fixtures are committed yet. Until they are, every answer is synthesized by synthesize_monthly(), which is
+fine for load tests but not for proposals, and the stub logs a warning the first time it makes up each location.
+
+Fixtures are recorded from the real PVGIS. That needs outbound HTTPS to re.jrc.ec.europa.eu and nothing else
+(no key, no PDF API or Drive). Run the stub in record mode and put a batch of proposals through it:
+
+    python pvgis_stub.py --record --port 8088
+    PVGIS_BASE_URL=http://127.0.0.1:8088/api python batch_proposals.py leads.jsonl /tmp/recorded.jsonl
+
+Every PVcalc miss is then forwarded upstream and saved, and the files written to fixtures/pvgis/ can be committed.
+Hourly seriescalc series are always synthesized, they're too big to keep as fixtures.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from pvgis_cache import make_key
+
+
+log = logging.getLogger(__name__)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pvgis")
+UPSTREAM_URL = "https://re.jrc.ec.europa.eu/api"
+
+# kWh of 1 kWp lying flat around Belgrade, 14% loss
+HORIZONTAL_YIELD = [38, 56, 95, 124, 150, 160, 170, 154, 109, 74, 41, 31]
+# how much a south facing tilt gains over flat, month by month (low winter sun gains the most)
+TILT_GAIN = [0.55, 0.42, 0.25, 0.10, 0.02, -0.02, 0.0, 0.06, 0.18, 0.35, 0.52, 0.60]
+
+
+def synthesize_monthly(lat: float, angle: float, aspect: float, loss: float, peakpower: float) -> list:
+    """Plausible PVcalc monthly output for Serbia, good enough for load tests but not for proposals."""
+    orientation = math.cos(math.radians(aspect))
+    tilt = math.sin(math.radians(2 * min(angle, 45))) if angle <= 45 else math.cos(math.radians(2 * (angle - 45)))
+    steepness_loss = 0.3 * (1 - math.cos(math.radians(angle)))
+    latitude_factor = 1 - 0.012 * (lat - 44)
+
+    monthly = []
+    for month in range(12):
+        factor = (1 + TILT_GAIN[month] * orientation * tilt - steepness_loss * (1 - orientation) / 2) * latitude_factor
+        monthly.append(round(HORIZONTAL_YIELD[month] * max(factor, 0.1) * peakpower * (100 - loss) / 86, 2))
+
+    return monthly
+
+
+def synthesize_hourly(lat: float, angle: float, aspect: float, loss: float, peakpower: float) -> list:
+    """Hourly W output over a 365 day year, a sine over daylight hours that adds up to synthesize_monthly()."""
+    days_in_month = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    # roughly Belgrade daylight, in hours
+    daylight = [9.2, 10.5, 11.9, 13.4, 14.7, 15.4, 15.1, 13.9, 12.5, 11.0, 9.6, 8.8]
+    # east facing roofs peak in the morning, west facing ones in the afternoon
+    solar_noon = 12.5 + max(-1.5, min(1.5, aspect / 60))
+
+    hourly = []
+    for month, kwh in enumerate(synthesize_monthly(lat, angle, aspect, loss, peakpower)):
+        sunrise = solar_noon - daylight[month] / 2
+        day = [max(0.0, math.sin(math.pi * (hour + 0.5 - sunrise) / daylight[month])) for hour in range(24)]
+        scale = kwh * 1000 / days_in_month[month] / sum(day)
+        hourly.extend([round(p * scale, 2) for p in day] * days_in_month[month])
+
+    return hourly
+
+
+def _inputs(params: dict) -> dict:
+    return {
+        "location": {"latitude": params["lat"], "longitude": params["lon"]},
+        "pv_module": {"peak_power": params["peakpower"], "system_loss": params["loss"]},
+        "mounting_system": {"fixed": {"slope": {"value": params["angle"]}, "azimuth": {"value": params["aspect"]}}}
+    }
+
+
+def seriescalc_response(hourly: list, params: dict) -> dict:
+    """The parts of a seriescalc JSON response we read, hours of a 2019 calendar year."""
+    start = datetime.datetime(2019, 1, 1, 0, 10)
+    return {
+        "inputs": _inputs(params),
+        "outputs": {
+            "hourly": [{"time": (start + datetime.timedelta(hours=hour)).strftime("%Y%m%d:%H%M"), "P": p}
+                       for hour, p in enumerate(hourly)]
+        },
+        "meta": {"stub": True}
+    }
+
+
+def pvcalc_response(monthly: list, params: dict) -> dict:
+    """The parts of a PVcalc JSON response anyone of us actually reads."""
+    return {
+        "inputs": _inputs(params),
+        "outputs": {
+            "monthly": {"fixed": [{"month": month, "E_m": e_m} for month, e_m in enumerate(monthly, start=1)]},
+            "totals": {"fixed": {"E_y": round(sum(monthly), 2)}}
+        },
+        "meta": {"stub": True}
+    }
+
+
+class PVGISStub:
+    """
+    Local stand-in for the PVGIS /api/PVcalc and /api/seriescalc endpoints.
+
+    Replays PVcalc responses recorded in fixtures_dir (scaled to the requested peakpower), and synthesizes plausible
+    ones for everything else, hourly series included. Latency and errors can be injected to see how callers behave under load.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, fixtures_dir: str = FIXTURES_DIR,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_statuses: tuple = (429, 500, 503),
+                 record: bool = False, seed: int = None):
+        """
+        Args:
+            port (int): 0 picks a free port, see base_url once started
+            latency (float): seconds added to every response
+            jitter (float): up to this many seconds of random extra latency
+            error_rate (float): share of requests answered with one of error_statuses
+            record (bool): forward fixture misses to the real PVGIS and save them as new fixtures
+        """
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.record = record
+
+        self.requests_served = 0
+        self.errors_injected = 0
+        self.synthesized = 0
+        """ PVcalc answers made up by synthesize_monthly() because there was no fixture for them """
+        self._synthesized_keys = set()
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def _fixture_path(self, params: dict) -> str:
+        key = make_key(params["lat"], params["lon"], params["angle"], params["aspect"], params["loss"])
+        return os.path.join(self.fixtures_dir, hashlib.sha1(key.encode()).hexdigest()[:16] + ".json")
+
+    def _load_monthly(self, params: dict) -> list:
+        """1 kWp monthly output, from a fixture, the real API (record mode) or synthesized."""
+        path = self._fixture_path(params)
+
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                return json.load(file)["monthly"]
+
+        if self.record:
+            response = requests.get(f"{UPSTREAM_URL}/PVcalc", timeout=30, params={
+                "lat": params["lat"], "lon": params["lon"], "angle": params["angle"], "aspect": params["aspect"],
+                "loss": params["loss"], "peakpower": 1, "outputformat": "json"})
+            response.raise_for_status()
+            monthly = [item["E_m"] for item in response.json()["outputs"]["monthly"]["fixed"]]
+
+            os.makedirs(self.fixtures_dir, exist_ok=True)
+            with open(path, "w") as file:
+                json.dump({"params": {**params, "peakpower": 1}, "monthly": monthly}, file, indent=4)
+            return monthly
+
+        key = make_key(params["lat"], params["lon"], params["angle"], params["aspect"], params["loss"])
+        with self._lock:
+            self.synthesized += 1
+            first = key not in self._synthesized_keys
+            self._synthesized_keys.add(key)
+        if first:
+            log.warning("PVGIS stub has no fixture for %s in %s, answering with synthesized yields "
+                        "(record fixtures with 'python pvgis_stub.py --record')", key, self.fixtures_dir)
+        return synthesize_monthly(params["lat"], params["angle"], params["aspect"], params["loss"], 1)
+
+    def _handle(self, handler: BaseHTTPRequestHandler):
+        url = urlsplit(handler.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        with self._lock:
+            self.requests_served += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors_injected += 1
+                status = self._random.choice(self.error_statuses)
+
+        if delay:
+            time.sleep(delay)
+
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        if endpoint not in ("PVcalc", "seriescalc"):
+            return self._respond(handler, 404, {"message": f"unknown endpoint {url.path}"})
+
+        if fail:
+            return self._respond(handler, status, {"message": "injected error"})
+
+        try:
+            params = {
+                "lat": float(query["lat"]),
+                "lon": float(query["lon"]),
+                "peakpower": float(query["peakpower"]),
+                "loss": float(query["loss"]),
+                "angle": float(query.get("angle", 0)),
+                "aspect": float(query.get("aspect", 0))
+            }
+        except (KeyError, ValueError) as e:
+            return self._respond(handler, 400, {"message": f"bad or missing parameter: {e}"})
+
+        if endpoint == "seriescalc":
+            # hourly series are always synthesized, they're too big to keep as fixtures
+            hourly = synthesize_hourly(params["lat"], params["angle"], params["aspect"], params["loss"], params["peakpower"])
+            return self._respond(handler, 200, seriescalc_response(hourly, params))
+
+        try:
+            monthly = [round(e_m * params["peakpower"], 2) for e_m in self._load_monthly(params)]
+        except requests.exceptions.RequestException as e:
+            return self._respond(handler, 502, {"message": f"recording from upstream failed: {e}"})
+
+        self._respond(handler, 200, pvcalc_response(monthly, params))
+
+    def _respond(self, handler: BaseHTTPRequestHandler, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(payload)))
+        if status == 429:
+            handler.send_header("Retry-After", "1")
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+    def start(self):
+        """Serve from a background thread, returns self so it can be chained."""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="pvgis-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the PVGIS PVcalc API")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds of extra random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--record", action="store_true", help="record fixture misses from the real PVGIS")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    stub = PVGISStub(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, record=args.record)
+    print(f"PVGIS stub listening on {stub.base_url}, set PVGIS_BASE_URL to use it")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()
@@ -0,0 +1,111 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from breakeven import breakeven_months
+from money import para_to_dinars
+from production import Production
+from pvgis import default_client
+from tariff import load_tariff
+from ubill import solar_horizon, ubill_horizon
+
+
+HORIZON_MONTHS = 300
+
+
+@functools.lru_cache(maxsize=1024)
+def baseline_costs(usage: tuple, higherTariffPercent: float, permittedPower: float, months: int, tariff) -> np.ndarray:
+    """
+    Ubill costs of a customer over the horizon, memoized.
+
+    Costs without solar don't depend on the system, so every candidate of a comparison (and every later comparison
+    for the same customer) reuses them. The result is read only, it's shared.
+
+    Args:
+        usage (tuple): 12 monthly kWh, January first
+        tariff (TariffSchedule): part of the key, a reloaded schedule is a new object and misses the cache
+    """
+    costs = ubill_horizon(usage, higherTariffPercent, permittedPower, months, tariff)
+    costs.flags.writeable = False
+    return costs
+
+
+def compare_systems(data: dict, candidates: list, client=None, months: int = HORIZON_MONTHS) -> dict:
+    """
+    Price several alternative systems for one customer, side by side.
+
+    The baseline bills are computed (or found in the cache) once, production is fetched per candidate
+    (planes the candidates share come from the client's cache) and all candidates' solar bills are
+    one vectorized pass, so comparing 10 options costs little more than one.
+
+    Args:
+        data (dict): the customer, shaped like input_json in main.py, 'coordinates' and 'ubill' are used
+        candidates (list): dicts with 'layout', 'panel_power' and 'cost', optionally a 'name'
+        client (PVGISClient): defaults to the shared default_client()
+        months (int): length of the horizon
+
+    Returns:
+        dict: 'baseline' with the costs without solar, and 'candidates', one result per candidate in the order given
+    """
+    if not candidates:
+        raise ValueError("No candidate systems to compare")
+
+    if client is None:
+        client = default_client()
+
+    ubill = data['ubill']
+    monthly_usage = ubill['monthly_usage']
+    usage = tuple(int(monthly_usage[str(month)] if str(month) in monthly_usage else monthly_usage[month]) for month in range(1, 13))
+    higherTariffPercent = float(ubill['higher_tariff_percentage'])
+    permittedPower = float(ubill.get('permitted_power', 11.4))
+    tariff = load_tariff(ubill.get('tariff_version'))
+
+    baseline = baseline_costs(usage, higherTariffPercent, permittedPower, months, tariff)
+
+    # candidates fetch concurrently, the client's connection limit and single flight still apply
+    with ThreadPoolExecutor(max_workers=min(len(candidates), 8)) as pool:
+        productions = list(pool.map(lambda candidate: Production(candidate['layout'], candidate['panel_power'],
+                                                                 data['coordinates'], client=client), candidates))
+    production = np.array([p.month.array for p in productions])
+
+    usedOnSpot = None
+    if ubill.get('load_profile') is not None:
+        from self_consumption_table import default_table
+        usedOnSpot = default_table().used_on_spot_months(production, usage, ubill['load_profile'])
+
+    # (candidates, months)
+    solar = solar_horizon(np.array(usage), production, higherTariffPercent, permittedPower, months, usedOnSpot, tariff)
+
+    costs = np.array([candidate['cost'] for candidate in candidates], dtype=np.float64)
+    breakeven = breakeven_months(costs, baseline, solar)
+    savings = baseline.sum() - solar.sum(axis=1)
+
+    # the first year as the proposal shows it: exact bills in whole dinars, the annual totals add up the months shown
+    monthly_costs_pre_solar = para_to_dinars(ubill_horizon(usage, higherTariffPercent, permittedPower, 12, tariff, para=True))
+    monthly_costs_post_solar = para_to_dinars(solar_horizon(np.array(usage), production, higherTariffPercent, permittedPower, 12,
+                                                            usedOnSpot, tariff, para=True))
+    annual_costs_pre_solar = int(monthly_costs_pre_solar.sum())
+
+    results = []
+    for i, candidate in enumerate(candidates):
+        annual_costs_post_solar = int(monthly_costs_post_solar[i].sum())
+        results.append({
+            "name": candidate.get('name', f"option {i + 1}"),
+            "cost": candidate['cost'],
+            "production_annual": productions[i].annual,
+            "monthly_costs_post_solar": {str(month): int(monthly_costs_post_solar[i, month - 1]) for month in range(1, 13)},
+            "annual_costs_post_solar": annual_costs_post_solar,
+            "annual_cost_difference": annual_costs_pre_solar - annual_costs_post_solar,
+            # None when the system doesn't pay for itself within the horizon
+            "breakeven_months": float(breakeven[i]) if np.isfinite(breakeven[i]) else None,
+            "savings_over_horizon": int(savings[i] - candidate['cost']),
+        })
+
+    return {
+        "baseline": {
+            "monthly_costs_pre_solar": {str(month): int(monthly_costs_pre_solar[month - 1]) for month in range(1, 13)},
+            "annual_costs_pre_solar": annual_costs_pre_solar,
+        },
+        "candidates": results,
+    }
@@ -0,0 +1,109 @@
+import numpy as np
+
+
+DAYS_IN_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+HOURS_IN_MONTH = DAYS_IN_MONTH * 24
+MONTH_STARTS = np.concatenate(([0], np.cumsum(HOURS_IN_MONTH)[:-1]))
+""" index of the first hour of every month in an 8760 hour year """
+HOUR_MONTH = np.repeat(np.arange(12), HOURS_IN_MONTH)
+""" month index (0-11) of every hour """
+
+# relative household consumption through the day, hour 0 is midnight to 1am
+LOAD_PROFILES = {
+    # working household, small morning peak and a big evening one
+    "standard": np.array([0.50, 0.40, 0.35, 0.35, 0.35, 0.45, 0.80, 1.10, 0.90, 0.70, 0.65, 0.70,
+                          0.75, 0.70, 0.65, 0.70, 0.85, 1.10, 1.40, 1.55, 1.50, 1.30, 1.00, 0.70]),
+    # someone is home during the day (retirees, home office)
+    "daytime": np.array([0.45, 0.35, 0.30, 0.30, 0.30, 0.40, 0.70, 1.00, 1.10, 1.15, 1.15, 1.20,
+                         1.25, 1.15, 1.10, 1.05, 1.05, 1.15, 1.30, 1.35, 1.25, 1.05, 0.85, 0.60]),
+    # empty house all day, everything happens in the evening
+    "evening": np.array([0.55, 0.45, 0.40, 0.40, 0.40, 0.45, 0.70, 0.85, 0.45, 0.35, 0.35, 0.35,
+                         0.35, 0.35, 0.35, 0.40, 0.60, 1.20, 1.70, 1.90, 1.85, 1.60, 1.20, 0.80]),
+}
+
+
+def _monthly_sums(hourly: np.ndarray) -> np.ndarray:
+    """Sum the last (8760 hour) axis into 12 months."""
+    return np.add.reduceat(hourly, MONTH_STARTS, axis=-1)
+
+
+def load_profile(monthly_usage, profile: str = "standard") -> np.ndarray:
+    """
+    Spread monthly usage over 8760 hours following one of the LOAD_PROFILES.
+
+    Args:
+        monthly_usage: 12 monthly kWh values, or an (N, 12) array for N households
+        profile (str): key of LOAD_PROFILES
+
+    Returns:
+        np.ndarray: hourly kWh, shape (8760,) or (N, 8760)
+    """
+    if profile not in LOAD_PROFILES:
+        raise ValueError(f"Unknown load profile '{profile}', expected one of {list(LOAD_PROFILES)}")
+
+    shape = np.tile(LOAD_PROFILES[profile], 365)
+    monthly_usage = np.asarray(monthly_usage, dtype=np.float64)
+
+    return shape * (monthly_usage / _monthly_sums(shape))[..., HOUR_MONTH]
+
+
+def scale_to_monthly(hourly, monthly) -> np.ndarray:
+    """
+    Rescale an hourly series so its monthly sums match the given monthly values.
+
+    seriescalc returns one real year while PVcalc monthly values come from a typical year,
+    this keeps the hourly shape but makes the totals agree with Production.month.
+    """
+    hourly = np.asarray(hourly, dtype=np.float64)
+    sums = _monthly_sums(hourly)
+    factors = np.divide(np.asarray(monthly, dtype=np.float64), sums, out=np.zeros_like(sums), where=sums > 0)
+    return hourly * factors[..., HOUR_MONTH]
+
+
+def simulate(production, load) -> dict:
+    """
+    Hour by hour self consumption, vectorized over the whole year.
+
+    Args:
+        production: hourly kWh produced, shape (8760,) or (N, 8760)
+        load: hourly kWh used, same shape as production (or broadcastable to it)
+
+    Returns:
+        dict: monthly kWh arrays (shape (12,) or (N, 12)) under 'production', 'usage', 'used_on_spot',
+            'exported' and 'imported'
+    """
+    production = np.asarray(production, dtype=np.float64)
+    load = np.asarray(load, dtype=np.float64)
+
+    used_on_spot = np.minimum(production, load)
+
+    return {
+        "production": _monthly_sums(production),
+        "usage": _monthly_sums(load),
+        "used_on_spot": _monthly_sums(used_on_spot),
+        "exported": _monthly_sums(production - used_on_spot),
+        "imported": _monthly_sums(load - used_on_spot),
+    }
+
+
+def monthly_used_on_spot(production, monthly_usage: dict, profile: str = "standard") -> dict:
+    """
+    kWh of solar used on the spot for every month, ready to be passed into SolarBill.
+
+    Args:
+        production (Production): created with hourly=True
+        monthly_usage (dict): usage per month, keys 1-12 (ints or strings, as in input_json)
+        profile (str): key of LOAD_PROFILES
+
+    Returns:
+        dict: {month: kWh}, keys are integers 1-12
+    """
+    if production.hourly is None:
+        raise ValueError("Production has no hourly series, create it with hourly=True")
+
+    usage = [float(monthly_usage[month] if month in monthly_usage else monthly_usage[str(month)]) for month in range(1, 13)]
+    hourly_production = scale_to_monthly(production.hourly, production.month.array)
+
+    result = simulate(hourly_production, load_profile(usage, profile))
+
+    return {month: float(result["used_on_spot"][month - 1]) for month in range(1, 13)}
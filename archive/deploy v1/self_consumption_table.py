@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from self_consumption import LOAD_PROFILES, load_profile, scale_to_monthly, simulate
+
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "self_consumption_table.npy")
+RATIO_STEP = 0.05
+RATIO_MAX = 6.0
+""" production/usage ratios above this are looked up at RATIO_MAX, the share barely moves by then """
+
+# production shape the table is simulated with, a typical Serbian south facing roof
+REFERENCE_LOCATION = {"lat": 44.8, "lon": 20.46, "angle": 35, "aspect": 0, "loss": 14}
+
+
+def _metadata_path(path: str) -> str:
+    return path[:-len(".npy")] + ".json" if path.endswith(".npy") else path + ".json"
+
+
+def build_table(client, path: str = TABLE_PATH, ratio_step: float = RATIO_STEP, ratio_max: float = RATIO_MAX,
+                profiles: list = None):
+    """
+    Simulate self consumption for every (load profile, month, production/usage ratio) and store the results.
+
+    The table holds the share of production used on the spot, shape (profiles, 12, ratios), in a .npy file,
+    with the axes in a .json file next to it.
+
+    Args:
+        client (PVGISClient): used once to fetch the hourly production shape of REFERENCE_LOCATION
+        path (str): where the .npy file is written
+        profiles (list): LOAD_PROFILES keys to include, all of them by default
+
+    Returns:
+        SelfConsumptionTable: the freshly built table
+    """
+    profiles = profiles or list(LOAD_PROFILES)
+    ratios = np.arange(0, ratio_max + ratio_step / 2, ratio_step)
+    # a ratio of 0 has no production to share, take the limit instead
+    simulated_ratios = np.maximum(ratios, 1e-6)
+
+    # production and usage shapes that both add up to 1 kWh every month
+    production_shape = scale_to_monthly(client.fetch_hourly(**REFERENCE_LOCATION), np.ones(12))
+
+    table = np.empty((len(profiles), 12, len(ratios)), dtype=np.float32)
+    for p, profile in enumerate(profiles):
+        usage_shape = load_profile(np.ones(12), profile)
+
+        # every ratio at once, (ratios, 8760)
+        result = simulate(simulated_ratios[:, None] * production_shape, usage_shape)
+        table[p] = (result["used_on_spot"] / simulated_ratios[:, None]).T
+
+    np.save(path, table)
+    with open(_metadata_path(path), "w") as file:
+        json.dump({"profiles": profiles, "ratio_step": ratio_step, "ratio_max": float(ratios[-1]),
+                   "reference_location": REFERENCE_LOCATION}, file, indent=4)
+
+    return SelfConsumptionTable(path)
+
+
+class SelfConsumptionTable:
+    """Share of solar production used on the spot, looked up by load profile, month and production/usage ratio."""
+
+    def __init__(self, path: str = TABLE_PATH):
+        """
+        Args:
+            path (str): the .npy file written by build_table()
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No self consumption table at {path}, build it with 'python self_consumption_table.py'")
+
+        with open(_metadata_path(path), "r") as file:
+            metadata = json.load(file)
+
+        self.profiles = {profile: p for p, profile in enumerate(metadata["profiles"])}
+        self.ratio_step = metadata["ratio_step"]
+        self.ratio_max = metadata["ratio_max"]
+        self.table = np.load(path)
+        self._last = self.table.shape[2] - 1
+
+    def used_on_spot(self, production: float, usage: float, month: int, profile: str = "standard") -> float:
+        """kWh of production used on the spot in a month, linear interpolation between the two nearest ratios."""
+        if production <= 0:
+            return 0.0
+
+        if profile not in self.profiles:
+            raise ValueError(f"Unknown load profile '{profile}', expected one of {list(self.profiles)}")
+
+        ratio = min(production / usage, self.ratio_max) if usage > 0 else self.ratio_max
+        position = ratio / self.ratio_step
+        i = min(int(position), self._last - 1)
+        t = position - i
+
+        shares = self.table[self.profiles[profile], month - 1]
+        return float(production * (shares[i] * (1 - t) + shares[i + 1] * t))
+
+    def used_on_spot_months(self, production, usage, profile: str = "standard") -> np.ndarray:
+        """
+        used_on_spot() of every month, with whole kWh like SolarBill looks it up.
+
+        Args:
+            production: 12 monthly kWh, or (N, 12) for N systems
+            usage: 12 monthly kWh, broadcast against production
+        """
+        production, usage = np.broadcast_arrays(np.asarray(production, dtype=np.float64), np.asarray(usage, dtype=np.float64))
+        result = np.empty(production.shape)
+        for index in np.ndindex(production.shape):
+            result[index] = self.used_on_spot(int(production[index]), int(usage[index]), index[-1] + 1, profile)
+        return result
+
+
+def table_available(path: str = TABLE_PATH) -> bool:
+    """Whether build_table() has written the table (and its axes) at path."""
+    return os.path.exists(path) and os.path.exists(_metadata_path(path))
+
+
+_default_table = None
+_default_table_lock = threading.Lock()
+
+def default_table() -> SelfConsumptionTable:
+    """Table at TABLE_PATH, loaded on first use."""
+    global _default_table
+    with _default_table_lock:
+        if _default_table is None:
+            _default_table = SelfConsumptionTable()
+    return _default_table
+
+
+if __name__ == "__main__":
+    from pvgis import default_client
+
+    build_table(default_client())
+    print(f"self consumption table written to {TABLE_PATH}")
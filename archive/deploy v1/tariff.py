@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+TARIFFS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tariffs")
+DEFAULT_TARIFF_VERSION = os.environ.get("TARIFF_VERSION", "2023")
+TARIFF_RECHECK_SECONDS = 60
+""" how often a loaded schedule looks at its file again, so edits show up in running workers """
+
+
+class TariffSchedule:
+    """
+    EPS tariff prices of one version, compiled from its JSON file.
+
+    Zones (green, blue and red today, but any number of them) are compiled into arrays of lower bounds and widths.
+    split() and zone_charges() are the only places bills look at zones, Ubill and SolarBill with single amounts
+    and the kernels in ubill.py with whole arrays of them.
+    """
+
+    def __init__(self, data: dict):
+        """
+        Args:
+            data (dict): contents of a tariffs/<version>.json file
+        """
+        zones = data["zones"]
+        limits = [zone["up_to"] for zone in zones]
+        bounds = [0] + limits[:-1]
+        if not zones or limits[-1] is not None or None in bounds or any(a >= b for a, b in zip(bounds, bounds[1:])):
+            raise ValueError(f"Tariff {data.get('version')} needs zones with increasing limits, the last one unbounded")
+
+        self.version = data["version"]
+        self.permitted_power_cost_per_unit = data["permitted_power_cost_per_unit"]
+        self.guaranteed_supplier_cost = data["guaranteed_supplier_cost"]
+        self.beneficial_supplier_subsidy_fee = data["beneficial_supplier_subsidy_fee"]
+        self.energy_efficiency_fee = data["energy_efficiency_fee"]
+        self.distributed_system_charge_per_kwh = data["distributed_system_charge_per_kwh"]
+        self.solar_higher_kwh_cost = data["solar_higher_kwh_cost"]
+        self.solar_lower_kwh_cost = data["solar_lower_kwh_cost"]
+        self.excise_tax_percent = data["excise_tax_percent"]
+        self.vat_tax_percent = data["vat_tax_percent"]
+        self.tv_tax = data["tv_tax"]
+
+        self.zone_names = [zone["name"] for zone in zones]
+        self.energy_lines = [f"{name}{tariff}Cost" for name in self.zone_names for tariff in ("Higher", "Lower")]
+        """ bill lines of the energy used, two per zone in the order they're added up """
+        self._zone_lines = list(zip(self.energy_lines[::2], self.energy_lines[1::2]))
+
+        self.high_rates = [zone["high_cost"] for zone in zones]
+        self.low_rates = [zone["low_cost"] for zone in zones]
+
+        # compiled piecewise arrays
+        self.zone_bounds = np.array(bounds, dtype=np.float64)
+        """ lower kWh bound of every zone """
+        self.zone_widths = np.append(np.diff(self.zone_bounds), np.inf)
+
+        # the same as python numbers, so single bills keep int kWh like they always had
+        self._bounds = bounds
+        self._widths = [upper - lower for lower, upper in zip(bounds, bounds[1:])] + [float("inf")]
+
+    def split(self, kwh):
+        """kWh falling into every zone, shape (..., zones), or a list of them for a single amount."""
+        if isinstance(kwh, (int, float)):
+            return [min(max(kwh - lower, 0), width) for lower, width in zip(self._bounds, self._widths)]
+        kwh = np.asarray(kwh, dtype=np.float64)
+        return np.clip(kwh[..., None] - self.zone_bounds, 0, self.zone_widths)
+
+    def in_first_zone(self, kwh):
+        """Whether kWh stays below the end of the first zone."""
+        return kwh < self._bounds[1] if len(self._bounds) > 1 else np.full(np.shape(kwh), True)
+
+    def zone_charges(self, higher, lower, factor=1, low_rates=None) -> dict:
+        """
+        Energy lines of a bill, see energy_lines.
+
+        Args:
+            higher: kWh at the high tariff in every zone, a sequence over the zones of numbers or arrays
+            lower: the same at the low tariff
+            factor: price escalation the charges are multiplied by, last
+            low_rates: low tariff rate of every zone, the schedule's own when None
+
+        Returns:
+            dict: float RSD (or arrays of them) per line
+        """
+        low_rates = self.low_rates if low_rates is None else low_rates
+        charges = {}
+        for zone, (higher_line, lower_line) in enumerate(self._zone_lines):
+            charges[higher_line] = higher[zone] * self.high_rates[zone] * factor
+            charges[lower_line] = lower[zone] * low_rates[zone] * factor
+        return charges
+
+
+_schedules = {}
+_schedules_lock = threading.Lock()
+
+
+def _tariff_path(version: str) -> str:
+    return os.path.join(TARIFFS_DIR, f"{version}.json")
+
+
+def load_tariff(version: str = None) -> TariffSchedule:
+    """
+    Compiled schedule of a version (DEFAULT_TARIFF_VERSION by default), cached per version.
+
+    A cached schedule is recompiled when its file changed, checked at most every TARIFF_RECHECK_SECONDS,
+    so price updates reach running workers without a restart.
+    """
+    version = version or DEFAULT_TARIFF_VERSION
+    now = time.monotonic()
+
+    with _schedules_lock:
+        cached = _schedules.get(version)
+        if cached is not None and now - cached["checked"] < TARIFF_RECHECK_SECONDS:
+            return cached["schedule"]
+
+        path = _tariff_path(version)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            raise ValueError(f"Unknown tariff version '{version}', expected one of {available_tariffs()}")
+
+        if cached is None or cached["mtime"] != mtime:
+            with open(path, "r") as file:
+                cached = {"schedule": TariffSchedule(json.load(file)), "mtime": mtime}
+            _schedules[version] = cached
+
+        cached["checked"] = now
+        return cached["schedule"]
+
+
+def reload_tariffs():
+    """Drop every compiled schedule, the next load_tariff() reads the files again."""
+    with _schedules_lock:
+        _schedules.clear()
+
+
+def available_tariffs() -> list:
+    return sorted(name[:-len(".json")] for name in os.listdir(TARIFFS_DIR) if name.endswith(".json"))
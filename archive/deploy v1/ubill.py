@@ -1,65 +1,100 @@
 # ubill.py
 from decimal import *
 import datetime
+import functools
+import numpy as np
+from money import Money, to_para, scale_para
+from tariff import load_tariff
 
 PERCENT_COST_INCREASE = 0.05
+# tariff prices live in tariffs/<version>.json, see tariff.py
+
+
+def line_items(charges: dict, t) -> dict:
+    """
+    A bill in exact para instead of floats.
+    
+    Every charge is rounded half to even to the para once, like it's printed on the bill. Excise, VAT
+    and the total are then integer math, no float error and no decimal context involved.
+    
+    Args:
+        charges (dict): float RSD per line, from Ubill.calculateCharges() or SolarBill.calculateCharges()
+        t (TariffSchedule): the tariff of the bill
+    
+    Returns:
+        dict: Money per line, plus 'osnovicaZaAkcizu', 'akciza', 'osnovicaZaPDV', 'PDV', 'TVtaksa' and 'ukupno'
+    """
+    items = {name: Money.from_float(amount) for name, amount in charges.items()}
+    items["osnovicaZaAkcizu"] = sum(items.values())
+    items["akciza"] = items["osnovicaZaAkcizu"].scale(t.excise_tax_percent)
+    items["osnovicaZaPDV"] = items["osnovicaZaAkcizu"] + items["akciza"]
+    items["PDV"] = items["osnovicaZaPDV"].scale(t.vat_tax_percent)
+    items["TVtaksa"] = Money.from_float(t.tv_tax)
+    items["ukupno"] = items["osnovicaZaPDV"] + items["PDV"] + items["TVtaksa"]
+    return items
+
+
+@functools.lru_cache(maxsize=16)
+def _ubill_low_rates(t) -> tuple:
+    # Ubill has always charged blue zone low tariff kWh at the high tariff rate, kept so bills don't change
+    return tuple(high if name == "blue" else low for name, high, low in zip(t.zone_names, t.high_rates, t.low_rates))
 
-PERMITTED_POWER_COST_PER_UNIT = 54.258
-GUARANTEED_SUPPLIER_COST = 146.521
-GREEN_KWH_HIGH_COST = 8.336
-GREEN_KWH_LOW_COST = 2.084
-BLUE_KWH_HIGH_COST = 12.504
-BLUE_KWH_LOW_COST = 3.126
-RED_KWH_HIGH_COST = 25.008
-RED_KWH_LOW_COST = 6.252
-BENEFICIAL_SUPPLIER_SUBSIDY_FEE = 0.801
-ENERGY_EFFICIENCY_FEE = 0.015
-EXCISE_TAX_PERCENT = 0.075
-VAT_TAX_PERCENT = 0.2
-TV_TAX = 300
 
 class Ubill:
     
+    # thousands of bills are kept around for reports, no per object __dict__
+    __slots__ = ("month", "year", "usage", "higherTariffPercent", "permittedPower", "tariff",
+                 "usageHigherTariff", "usageLowerTariff", "usageHigherByZone", "usageLowerByZone", "cost")
+    
+    def calculateCharges(self) -> dict:
+        """Every line of the bill before excise and VAT, in float RSD and in the order they're added up."""
+        t = self.tariff
+        escalation = (1 + PERCENT_COST_INCREASE) ** self.year
+        return {
+            #1
+            "obracunskaSnaga": self.permittedPower * t.permitted_power_cost_per_unit,
+            #2
+            "trosakGarantovanogSnabdevaca": t.guaranteed_supplier_cost,
+            #3
+            **t.zone_charges(self.usageHigherByZone, self.usageLowerByZone, escalation, _ubill_low_rates(t)),
+            #8
+            "naknadaZaPodsticajPovlascenihProizvodjaca": self.usage * t.beneficial_supplier_subsidy_fee,
+            #9
+            "naknadaZaEnergetskuEfikasnost": self.usage * t.energy_efficiency_fee,
+        }
+    
     def calculateCost(self):
-        #1
-        obracunskaSnaga = self.permittedPower * PERMITTED_POWER_COST_PER_UNIT
-        #2
-        trosakGarantovanogSnabdevaca = GUARANTEED_SUPPLIER_COST
-        
-        #3
-        greenHigherCost = self.usageGreenHigher * GREEN_KWH_HIGH_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-        greenLowerCost = self.usageGreenLower * GREEN_KWH_LOW_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-        blueHigherCost = self.usageBlueHigher * BLUE_KWH_HIGH_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-        blueLowerCost = self.usageBlueLower * BLUE_KWH_HIGH_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-        redHigherCost = self.usageRedHigher * RED_KWH_HIGH_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-        redLowerCost = self.usageRedLower * RED_KWH_LOW_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
+        t = self.tariff
+        c = self.calculateCharges()
         #4
-        zaduzenjeZaElEnergiju = obracunskaSnaga + trosakGarantovanogSnabdevaca + greenHigherCost + greenLowerCost + blueHigherCost + blueLowerCost + redHigherCost + redLowerCost
-        #8
-        naknadaZaPodsticajPovlascenihProizvodjaca = self.usage * BENEFICIAL_SUPPLIER_SUBSIDY_FEE
-        #9
-        naknadaZaEnergetskuEfikasnost = self.usage * ENERGY_EFFICIENCY_FEE
+        zaduzenjeZaElEnergiju = c["obracunskaSnaga"] + c["trosakGarantovanogSnabdevaca"]
+        for line in t.energy_lines:
+            zaduzenjeZaElEnergiju += c[line]
         #10
-        osnovicaZaAkcizu = zaduzenjeZaElEnergiju + naknadaZaPodsticajPovlascenihProizvodjaca + naknadaZaEnergetskuEfikasnost
+        osnovicaZaAkcizu = zaduzenjeZaElEnergiju + c["naknadaZaPodsticajPovlascenihProizvodjaca"] + c["naknadaZaEnergetskuEfikasnost"]
         #11
-        akciza = osnovicaZaAkcizu * EXCISE_TAX_PERCENT
+        akciza = osnovicaZaAkcizu * t.excise_tax_percent
         #12
         osnovicaZaPDV = osnovicaZaAkcizu + akciza
         #13
-        PDV = osnovicaZaPDV * VAT_TAX_PERCENT
+        PDV = osnovicaZaPDV * t.vat_tax_percent
         #15
         ukupnoZaduzenje = osnovicaZaPDV + PDV
         #16
         
-        total = ukupnoZaduzenje + TV_TAX
+        total = ukupnoZaduzenje + t.tv_tax
         
         return total
+    
+    def calculateLineItems(self) -> dict:
+        """The bill in exact para, see line_items()."""
+        return line_items(self.calculateCharges(), self.tariff)
 
         
 #        return calculatedCost
         
         
-    def __init__(self, month, year, usage, higherTariffPercent=0.85, permittedPower=11.4):
+    def __init__(self, month, year, usage, higherTariffPercent=0.85, permittedPower=11.4, tariff=None):
         
         self.month = int(month)
         self.usage = int(usage)
@@ -71,40 +106,18 @@ class Ubill:
         
         self.higherTariffPercent = higherTariffPercent
         self.permittedPower = permittedPower
+        self.tariff = tariff or load_tariff()
+        t = self.tariff
         
         self.usageHigherTariff = self.usage * self.higherTariffPercent
         self.usageLowerTariff = self.usage * (1 - self.higherTariffPercent)
         
-        self.usageGreenHigher = 0
-        self.usageGreenLower = 0
-        self.usageBlueHigher = 0
-        self.usageBlueLower = 0
-        self.usageRedHigher = 0
-        self.usageRedLower = 0
-        
-        if self.usage <= 350:
-            self.usageGreenHigher = self.usage * self.higherTariffPercent
-            self.usageGreenLower = self.usage * (1 - self.higherTariffPercent)
-            
-        if self.usage > 350 and self.usage <= 1600:
-            #GREEN
-            self.usageGreenHigher = 350 * self.higherTariffPercent
-            self.usageGreenLower = 350 * (1 - self.higherTariffPercent)
-            #BLUE
-            self.usageBlueHigher = (self.usage - 350) * self.higherTariffPercent
-            self.usageBlueLower = (self.usage - 350) * (1 - self.higherTariffPercent)
-        
-        if self.usage > 1600:
-            #GREEN
-            self.usageGreenHigher = 350 * self.higherTariffPercent
-            self.usageGreenLower = 350 * (1 - self.higherTariffPercent)
-            #BLUE
-            self.usageBlueHigher = (1600-350) * self.higherTariffPercent
-            self.usageBlueLower = (1600-350) * (1 - self.higherTariffPercent)
-            #RED
-            self.usageRedHigher = (self.usage - 1600) * self.higherTariffPercent
-            self.usageRedLower = (self.usage - 1600) * (1 - self.higherTariffPercent)
-            
+        # kWh in every tariff zone, green, blue and red in the 2023 schedule. Zones that aren't reached keep
+        # the shared int 0, like the attributes per zone had, instead of a float per bill
+        zones = t.split(self.usage)
+        higher, lower = self.higherTariffPercent, 1 - self.higherTariffPercent
+        self.usageHigherByZone = tuple([kwh * higher if kwh else 0 for kwh in zones])
+        self.usageLowerByZone = tuple([kwh * lower if kwh else 0 for kwh in zones])
         
         self.cost = int(self.calculateCost())
     
@@ -114,42 +127,57 @@ class Ubill:
     
     
     
-SOLAR_HIGHER_KWH_COST = 3.879
-SOLAR_LOWER_KWH_COST = 0.97
-DISTRIBUTED_SYSTEM_CHARGE_PER_KWH = 3.897
 
 class SolarBill:
     
+    __slots__ = ("month", "year", "usage", "production", "higherTariffPercent", "lowerTariffPercent", "permittedPower",
+                 "tariff", "excessFromPreviousMonth", "usedOnSpotFromSimulation", "loadProfile",
+                 "higherTariffUsage", "lowerTariffUsage", "kwhOfSolarUsedOnSpot", "kwhExported", "kwhImported",
+                 "netHigherUsage", "netLowerUsage", "netTotal", "netHigherTariffPercent", "netLowerTariffPercent",
+                 "netHigherTariffByZone", "netLowerTariffByZone", "dsSurchargeKwh", "excessForNextMonth", "cost")
+    
+    def calculateCharges(self) -> dict:
+        """Every line of the bill before excise and VAT, in float RSD and in the order they're added up."""
+        t = self.tariff
+        escalation = (1 + PERCENT_COST_INCREASE) ** self.year
+        return {
+            "obracunskaSnaga": self.permittedPower * t.permitted_power_cost_per_unit, #1
+            "trosakGarantovanogSnabdevaca": t.guaranteed_supplier_cost, #2
+            **t.zone_charges(self.netHigherTariffByZone, self.netLowerTariffByZone, escalation), #3
+            
+            "naknadaZaPovlascene": self.kwhExported * t.beneficial_supplier_subsidy_fee, #5
+            "naknadaZaEfikasnost": self.kwhExported * t.energy_efficiency_fee, #6
+            "naknadaZaDS": (self.kwhImported - self.netHigherUsage) * t.distributed_system_charge_per_kwh * escalation, #7
+        }
+    
     def calculateCost(self):
         # ok fresh and ready to dive into the hard bit!
         # what needs to happen here? all the variables have been set
         # now we simply calculate the cost & output is the cost of bill
         # getting there however is a bit more tricky. So let's dive in!
+        t = self.tariff
+        c = self.calculateCharges()
         
-        obracunskaSnaga = self.permittedPower * PERMITTED_POWER_COST_PER_UNIT #1
-        trosakGarantovanogSnabdevaca = GUARANTEED_SUPPLIER_COST #2
         #3
-        utrosenaEnergijaZbir = (self.netGreenHigherTariff * GREEN_KWH_HIGH_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-                                + self.netGreenLowerTariff * GREEN_KWH_LOW_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-                                + self.netBlueHigherTariff * BLUE_KWH_HIGH_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-                                + self.netBlueLowerTariff * BLUE_KWH_LOW_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-                                + self.netRedHigherTariff * RED_KWH_HIGH_COST * ((1 + PERCENT_COST_INCREASE) ** self.year)
-                                + self.netRedLowerTariff * RED_KWH_LOW_COST * ((1 + PERCENT_COST_INCREASE) ** self.year))
-        
-        naknadaZaPovlascene = self.kwhExported * BENEFICIAL_SUPPLIER_SUBSIDY_FEE #5
-        naknadaZaEfikasnost = self.kwhExported * ENERGY_EFFICIENCY_FEE #6
-        naknadaZaDS = (self.kwhImported - self.netHigherUsage) * DISTRIBUTED_SYSTEM_CHARGE_PER_KWH * ((1 + PERCENT_COST_INCREASE) ** self.year) #7
+        utrosenaEnergijaZbir = 0
+        for line in t.energy_lines:
+            utrosenaEnergijaZbir += c[line]
         #8
-        osnovicaZaAkcizu = obracunskaSnaga + trosakGarantovanogSnabdevaca + utrosenaEnergijaZbir + naknadaZaPovlascene + naknadaZaEfikasnost + naknadaZaDS
-        akcizaIznos = osnovicaZaAkcizu * EXCISE_TAX_PERCENT #9
+        osnovicaZaAkcizu = (c["obracunskaSnaga"] + c["trosakGarantovanogSnabdevaca"] + utrosenaEnergijaZbir
+                            + c["naknadaZaPovlascene"] + c["naknadaZaEfikasnost"] + c["naknadaZaDS"])
+        akcizaIznos = osnovicaZaAkcizu * t.excise_tax_percent #9
         osnovicaZaPDV = osnovicaZaAkcizu + akcizaIznos #10
-        PDVIznos = osnovicaZaPDV * VAT_TAX_PERCENT #11
+        PDVIznos = osnovicaZaPDV * t.vat_tax_percent #11
         
         ukupnoZaduzenje = osnovicaZaPDV + PDVIznos
         
-        totalCost = ukupnoZaduzenje + TV_TAX
+        totalCost = ukupnoZaduzenje + t.tv_tax
         #DONT FORGET LT USAGE 
         return int(totalCost)
+    
+    def calculateLineItems(self) -> dict:
+        """The bill in exact para, see line_items()."""
+        return line_items(self.calculateCharges(), self.tariff)
 
     
     def calculateExcessForNextMonth(self):
@@ -162,6 +190,16 @@ class SolarBill:
             return 0
         
     def calculateKwhOfSolarUsedOnSpot(self):
+        # an hourly simulation (see self_consumption.py) knows better, use it when we got one
+        if self.usedOnSpotFromSimulation is not None:
+            return min(self.usedOnSpotFromSimulation, self.production, self.higherTariffUsage)
+        
+        # otherwise the precomputed table gets close to it, for a known load profile
+        if self.loadProfile is not None:
+            from self_consumption_table import default_table
+            usedOnSpot = default_table().used_on_spot(self.production, self.usage, self.month, self.loadProfile)
+            return min(usedOnSpot, self.higherTariffUsage)
+        
         # need to figure out a linear model here, but for now will say that
         # 40% of solar is used on the spot, regardless of production/usage ratio
         # that is up until 60% of usage is reached, then it caps at 60% of usage
@@ -176,7 +214,7 @@ class SolarBill:
     
         
         
-    def __init__(self,month, year, usage, production, excessFromPreviousMonth=0, higherTariffPercent=0.85, permittedPower=11.4):
+    def __init__(self,month, year, usage, production, excessFromPreviousMonth=0, higherTariffPercent=0.85, permittedPower=11.4, usedOnSpot=None, loadProfile=None, tariff=None):
         
         self.month = int(month)
         self.usage = int(usage)
@@ -193,6 +231,9 @@ class SolarBill:
         
         self.excessFromPreviousMonth = excessFromPreviousMonth
         self.permittedPower = permittedPower
+        self.tariff = tariff or load_tariff()
+        self.usedOnSpotFromSimulation = usedOnSpot
+        self.loadProfile = loadProfile
         
         self.higherTariffUsage = self.higherTariffPercent * self.usage
         self.lowerTariffUsage = self.lowerTariffPercent * self.usage
@@ -232,30 +273,15 @@ class SolarBill:
 #         print(f"higher tariff % = {self.netHigherTariffPercent}")
 #         print(f"lower tariff % = {self.netLowerTariffPercent}")
 #         
-        self.netGreenHigherTariff = 0
-        self.netGreenLowerTariff = 0
-        self.netBlueHigherTariff = 0
-        self.netBlueLowerTariff = 0
-        self.netRedHigherTariff = 0
-        self.netRedLowerTariff = 0
-        
-        if self.netTotal < 350:
-            self.netGreenHigherTariff = self.netHigherUsage
-            self.netGreenLowerTariff = self.netLowerUsage
-
-        if self.netTotal >= 350 and self.netTotal < 1600:
-            self.netGreenHigherTariff = 350 * self.netHigherTariffPercent
-            self.netGreenLowerTariff = 350 * (1 - self.netHigherTariffPercent)
-            self.netBlueHigherTariff = (self.netTotal - 350) * self.netHigherTariffPercent
-            self.netBlueLowerTariff = (self.netTotal - 350) * (1 - self.netHigherTariffPercent)
-        
-        if self.netTotal >= 1600:
-            self.netGreenHigherTariff = 350 * self.netHigherTariffPercent
-            self.netGreenLowerTariff = 350 * (1 - self.netHigherTariffPercent)
-            self.netBlueHigherTariff = (1600 - 350) * self.netHigherTariffPercent
-            self.netBlueLowerTariff = (1600 - 350) * (1 - self.netHigherTariffPercent)
-            self.netRedHigherTariff = (self.netTotal - 1600) * self.netHigherTariffPercent
-            self.netRedLowerTariff = (self.netTotal - 1600) * (1 - self.netHigherTariffPercent)
+        t = self.tariff
+        if t.in_first_zone(self.netTotal):
+            self.netHigherTariffByZone = (self.netHigherUsage,) + (0,) * (len(t.zone_names) - 1)
+            self.netLowerTariffByZone = (self.netLowerUsage,) + (0,) * (len(t.zone_names) - 1)
+        else:
+            zones = t.split(self.netTotal)
+            higher, lower = self.netHigherTariffPercent, 1 - self.netHigherTariffPercent
+            self.netHigherTariffByZone = tuple([kwh * higher if kwh else 0 for kwh in zones])
+            self.netLowerTariffByZone = tuple([kwh * lower if kwh else 0 for kwh in zones])
 
         
         self.cost = int(self.calculateCost())
@@ -271,3 +297,371 @@ class SolarBill:
     
     
     
+    
+    
+    
+# Vectorized kernel: every Ubill and SolarBill cost of a whole horizon in one pass, bill for bill the same
+# as building the objects month by month. Operations are kept in the same order as in the classes above
+# so the floats (and the int() truncation) come out identical.
+
+def _escalation(years):
+    # python floats on purpose, so each factor is exactly what the classes get
+    return np.array([(1 + PERCENT_COST_INCREASE) ** year for year in range(years)])
+
+
+def _ubill_charges(usage, higherTariffPercent, permittedPower, escalation, t):
+    """Ubill.calculateCharges, usage is (..., 12), the charges broadcast to (..., years, 12)."""
+    h = higherTariffPercent[..., None]
+    zones = np.moveaxis(t.split(usage), -1, 0)
+    
+    f = escalation[:, None]
+    return {
+        "obracunskaSnaga": (permittedPower * t.permitted_power_cost_per_unit)[..., None, None],
+        "trosakGarantovanogSnabdevaca": t.guaranteed_supplier_cost,
+        **t.zone_charges([(kwh * h)[..., None, :] for kwh in zones], [(kwh * (1 - h))[..., None, :] for kwh in zones], f,
+                         _ubill_low_rates(t)),
+        "naknadaZaPodsticajPovlascenihProizvodjaca": (usage * t.beneficial_supplier_subsidy_fee)[..., None, :],
+        "naknadaZaEnergetskuEfikasnost": (usage * t.energy_efficiency_fee)[..., None, :],
+    }
+
+
+def _ubill_costs(c, t):
+    """Ubill.calculateCost over the charges of _ubill_charges."""
+    zaduzenjeZaElEnergiju = c["obracunskaSnaga"] + c["trosakGarantovanogSnabdevaca"]
+    for line in t.energy_lines:
+        zaduzenjeZaElEnergiju = zaduzenjeZaElEnergiju + c[line]
+    osnovicaZaAkcizu = zaduzenjeZaElEnergiju + c["naknadaZaPodsticajPovlascenihProizvodjaca"] + c["naknadaZaEnergetskuEfikasnost"]
+    osnovicaZaPDV = osnovicaZaAkcizu + osnovicaZaAkcizu * t.excise_tax_percent
+    total = osnovicaZaPDV + osnovicaZaPDV * t.vat_tax_percent + t.tv_tax
+    
+    return np.trunc(total).astype(np.int64)
+
+
+def _solar_energy(usage, production, excessFromPreviousMonth, higherTariffPercent, usedOnSpot, t, netExports=True):
+    """Everything SolarBill works out before calculateCost, for (..., 12) months. netExports=False bills imports in full, as net billing does."""
+    h = higherTariffPercent[..., None]
+    higherTariffUsage = h * usage
+    lowerTariffUsage = (1 - h) * usage
+    
+    if usedOnSpot is None:
+        fortyPercentOfProduction = 0.4 * production
+        sixtyPercentOfUsage = 0.6 * higherTariffUsage
+        kwhOfSolarUsedOnSpot = np.where(fortyPercentOfProduction < sixtyPercentOfUsage, fortyPercentOfProduction, sixtyPercentOfUsage)
+    else:
+        kwhOfSolarUsedOnSpot = np.minimum(np.minimum(usedOnSpot, production), higherTariffUsage)
+    
+    kwhExported = production - kwhOfSolarUsedOnSpot
+    kwhImported = higherTariffUsage - kwhOfSolarUsedOnSpot
+    
+    net = kwhImported - (kwhExported if netExports else 0) - excessFromPreviousMonth
+    netHigherUsage = np.where(net < 0, 0, net)
+    netLowerUsage = lowerTariffUsage
+    netTotal = netHigherUsage + netLowerUsage
+    
+    both = (netHigherUsage != 0) & (netLowerUsage != 0)
+    netHigherTariffPercent = np.where(both, netHigherUsage / np.where(both, netTotal, 1), np.where(netHigherUsage == 0, 0, 1))
+    
+    # like SolarBill, net usage that stays in the first zone goes there as it is, anything more is split by zone
+    first = t.in_first_zone(netTotal)
+    zones = np.moveaxis(t.split(netTotal), -1, 0)
+    higher, lower = _net_zone_keys(t)
+    
+    energy = {
+        "kwhOfSolarUsedOnSpot": kwhOfSolarUsedOnSpot,
+        "kwhExported": kwhExported,
+        "kwhImported": kwhImported,
+        "netHigherUsage": netHigherUsage,
+    }
+    for zone, kwh in enumerate(zones):
+        energy[higher[zone]] = np.where(first, netHigherUsage if zone == 0 else 0, kwh * netHigherTariffPercent)
+        energy[lower[zone]] = np.where(first, netLowerUsage if zone == 0 else 0, kwh * (1 - netHigherTariffPercent))
+    return energy
+
+
+def _net_zone_keys(t) -> tuple:
+    """Keys of the net kWh at the high and at the low tariff of every zone in _solar_energy(), netGreenHigherTariff and so on."""
+    return ([f"net{name.capitalize()}HigherTariff" for name in t.zone_names],
+            [f"net{name.capitalize()}LowerTariff" for name in t.zone_names])
+
+
+def _solar_charges(energy, permittedPower, f, t):
+    """SolarBill.calculateCharges over broadcast arrays, f being the escalation factor of every bill."""
+    return {
+        "obracunskaSnaga": (permittedPower * t.permitted_power_cost_per_unit)[..., None, None],
+        "trosakGarantovanogSnabdevaca": t.guaranteed_supplier_cost,
+        **_net_zone_charges(energy, t, f),
+        "naknadaZaPovlascene": energy["kwhExported"] * t.beneficial_supplier_subsidy_fee,
+        "naknadaZaEfikasnost": energy["kwhExported"] * t.energy_efficiency_fee,
+        "naknadaZaDS": (energy["kwhImported"] - energy["netHigherUsage"]) * t.distributed_system_charge_per_kwh * f,
+    }
+
+
+def _net_zone_charges(energy, t, f=1) -> dict:
+    higher, lower = _net_zone_keys(t)
+    return t.zone_charges([energy[key] for key in higher], [energy[key] for key in lower], f)
+
+
+_SOLAR_CHARGES = ("obracunskaSnaga", "trosakGarantovanogSnabdevaca", "naknadaZaPovlascene", "naknadaZaEfikasnost", "naknadaZaDS")
+""" the lines of a SolarBill besides the energy lines of its tariff """
+
+
+def _solar_costs(c, t):
+    """SolarBill.calculateCost over the charges of _solar_charges."""
+    utrosenaEnergijaZbir = sum(c[line] for line in t.energy_lines)
+    osnovicaZaAkcizu = (c["obracunskaSnaga"] + c["trosakGarantovanogSnabdevaca"] + utrosenaEnergijaZbir
+                        + c["naknadaZaPovlascene"] + c["naknadaZaEfikasnost"] + c["naknadaZaDS"])
+    # lines a net metering policy adds, e.g. the export credit of net billing
+    for name in c:
+        if name not in _SOLAR_CHARGES and name not in t.energy_lines:
+            osnovicaZaAkcizu = osnovicaZaAkcizu + c[name]
+    osnovicaZaPDV = osnovicaZaAkcizu + osnovicaZaAkcizu * t.excise_tax_percent
+    totalCost = osnovicaZaPDV + osnovicaZaPDV * t.vat_tax_percent + t.tv_tax
+    
+    return np.trunc(totalCost).astype(np.int64)
+
+
+def _para_costs(c, t):
+    """line_items() totals over broadcast charges, int64 para, same rounding as Money."""
+    osnovicaZaAkcizu = sum(to_para(amount) for amount in c.values())
+    osnovicaZaPDV = osnovicaZaAkcizu + scale_para(osnovicaZaAkcizu, t.excise_tax_percent)
+    return osnovicaZaPDV + scale_para(osnovicaZaPDV, t.vat_tax_percent) + Money.from_float(t.tv_tax).para
+
+
+def excess_chain(usage, production, start_month=1, reset_month=3):
+    """
+    excessFromPreviousMonth of every bill of a horizon, for many customers at once and without a loop over months.
+    
+    calculateExcessForNextMonth() is excess = max(excess + production - usage, 0), zeroed after every March.
+    Between two resets that's a clamped running sum, which has the closed form
+    excess_k = S_k - min(0, min(S_1 .. S_k)) with S the cumulative production - usage since the last reset.
+    The horizon is padded to whole segments (April to March by default), so the scan is a cumsum and
+    a running minimum along the last axis of a (..., segments, 12) array.
+    
+    Args:
+        usage: monthly kWh, shape (..., months), truncated to whole kWh like SolarBill does
+        production: monthly kWh, same shape
+        start_month (int): calendar month of the first bill, 1 is January
+        reset_month (int): calendar month after which the excess is zeroed, March as in SolarBill
+    
+    Returns:
+        np.ndarray: int64 excess carried into every month, shape (..., months)
+    """
+    usage = np.trunc(np.asarray(usage, dtype=np.float64)).astype(np.int64)
+    production = np.trunc(np.asarray(production, dtype=np.float64)).astype(np.int64)
+    surplus = production - usage
+    months = surplus.shape[-1]
+    
+    # months in front of the first bill since the last reset, the month right after reset_month needs none
+    offset = (start_month - reset_month - 1) % 12
+    segments = -(-(offset + months) // 12)
+    padded = np.zeros(surplus.shape[:-1] + (segments * 12,), dtype=np.int64)
+    padded[..., offset:offset + months] = surplus
+    padded = padded.reshape(surplus.shape[:-1] + (segments, 12))
+    
+    running = np.cumsum(padded, axis=-1)
+    after = running - np.minimum(np.minimum.accumulate(running, axis=-1), 0)
+    
+    # what's left after a month is carried into the next one, every segment starts with nothing
+    carried = np.zeros_like(after)
+    carried[..., 1:] = after[..., :-1]
+    
+    return carried.reshape(surplus.shape[:-1] + (-1,))[..., offset:offset + months]
+
+
+def _excess_cycle(usage, production):
+    """
+    excessFromPreviousMonth of every calendar month, for the first year and for every year after it.
+    
+    The excess is zeroed in March, so from April on the chain repeats itself every year,
+    only January to March of the first year start from nothing.
+    """
+    two_years = excess_chain(np.concatenate((usage, usage), axis=-1), np.concatenate((production, production), axis=-1))
+    return two_years[..., :12], two_years[..., 12:]
+
+
+def _kwh(values) -> np.ndarray:
+    # whole kWh, like the int() in Ubill and SolarBill
+    return np.trunc(np.asarray(values, dtype=np.float64)).astype(np.int64)
+
+
+def ubill_horizon(usage, higherTariffPercent=0.85, permittedPower=11.4, months=300, tariff=None, para=False):
+    """
+    The Ubill half of bill_horizon(), costs without solar only depend on the customer and not on the system.
+    
+    Returns:
+        np.ndarray: int64 costs, one per month of the horizon
+    """
+    usage = _kwh(usage)
+    higherTariffPercent = np.asarray(higherTariffPercent, dtype=np.float64)
+    permittedPower = np.asarray(permittedPower, dtype=np.float64)
+    
+    t = tariff or load_tariff()
+    escalation = _escalation(-(-months // 12))
+    ubill_total = _para_costs if para else _ubill_costs
+    
+    ubill_costs = ubill_total(_ubill_charges(usage, higherTariffPercent, permittedPower, escalation, t), t)
+    return ubill_costs.reshape(ubill_costs.shape[:-2] + (-1,))[..., :months]
+
+
+def solar_horizon(usage, production, higherTariffPercent=0.85, permittedPower=11.4, months=300, usedOnSpot=None, tariff=None, para=False):
+    """
+    The SolarBill half of bill_horizon(). usage broadcasts against production,
+    so one customer's usage with (systems, 12) production prices every system at once.
+    
+    Returns:
+        np.ndarray: int64 costs, one per month of the horizon
+    """
+    usage, production = np.broadcast_arrays(_kwh(usage), _kwh(production))
+    higherTariffPercent = np.asarray(higherTariffPercent, dtype=np.float64)
+    permittedPower = np.asarray(permittedPower, dtype=np.float64)
+    if usedOnSpot is not None:
+        usedOnSpot = np.asarray(usedOnSpot, dtype=np.float64)
+    
+    t = tariff or load_tariff()
+    escalation = _escalation(-(-months // 12))
+    solar_total = _para_costs if para else _solar_costs
+    
+    first, following = _excess_cycle(usage, production)
+    first_year = {key: value[..., None, :] for key, value in _solar_energy(usage, production, first, higherTariffPercent, usedOnSpot, t).items()}
+    later_years = {key: value[..., None, :] for key, value in _solar_energy(usage, production, following, higherTariffPercent, usedOnSpot, t).items()}
+    
+    solar_costs = np.concatenate((solar_total(_solar_charges(first_year, permittedPower, escalation[:1, None], t), t),
+                                  solar_total(_solar_charges(later_years, permittedPower, escalation[1:, None], t), t)), axis=-2)
+    return solar_costs.reshape(solar_costs.shape[:-2] + (-1,))[..., :months]
+
+
+def bill_horizon(usage, production, higherTariffPercent=0.85, permittedPower=11.4, months=300, usedOnSpot=None, tariff=None, para=False):
+    """
+    Costs of every Ubill and SolarBill over the horizon, without creating the objects.
+    
+    Same results as the month by month loop in main(), where bill i is month i % 12 of year (i - 1) // 12.
+    
+    Args:
+        usage: 12 monthly kWh values, January first
+        production: 12 monthly kWh values, e.g. Production.month values in month order
+        higherTariffPercent (float)
+        permittedPower (float)
+        months (int): length of the horizon, starting with a January
+        usedOnSpot: optional 12 monthly kWh values of solar used on the spot, as in SolarBill
+        tariff (TariffSchedule): defaults to load_tariff()
+        para (bool): exact costs in para, the 'ukupno' of every calculateLineItems(), instead of truncated float RSD
+    
+    Returns:
+        tuple: (ubill_costs, solar_costs) int64 arrays with one cost per month of the horizon
+    """
+    t = tariff or load_tariff()
+    return (ubill_horizon(usage, higherTariffPercent, permittedPower, months, t, para),
+            solar_horizon(usage, production, higherTariffPercent, permittedPower, months, usedOnSpot, t, para))
+
+
+def bill_batch(usage, production, higherTariffPercent=0.85, permittedPower=11.4, months=300, usedOnSpot=None, tariff=None, para=False):
+    """
+    bill_horizon for many customers at once, e.g. every lead in the CRM.
+    
+    Customers are rows and everything is broadcast, there is no python loop per customer.
+    
+    Args:
+        usage: (customers, 12) monthly kWh
+        production: (customers, 12) monthly kWh
+        higherTariffPercent: one value per customer, or a single value for all of them
+        permittedPower: one value per customer, or a single value for all of them
+        months (int): length of the horizon, starting with a January
+        usedOnSpot: optional (customers, 12) kWh of solar used on the spot
+        tariff (TariffSchedule): defaults to load_tariff()
+        para (bool): exact costs in para, see bill_horizon()
+    
+    Returns:
+        tuple: (ubill_costs, solar_costs) int64 matrices of shape (customers, months)
+    """
+    usage = np.atleast_2d(np.asarray(usage, dtype=np.float64))
+    production = np.atleast_2d(np.asarray(production, dtype=np.float64))
+    customers = usage.shape[0]
+    
+    if usage.shape != (customers, 12) or production.shape != (customers, 12):
+        raise ValueError(f"usage and production must both be (customers, 12), got {usage.shape} and {production.shape}")
+    
+    higherTariffPercent = np.broadcast_to(np.asarray(higherTariffPercent, dtype=np.float64), (customers,))
+    permittedPower = np.broadcast_to(np.asarray(permittedPower, dtype=np.float64), (customers,))
+    if usedOnSpot is not None:
+        usedOnSpot = np.broadcast_to(np.asarray(usedOnSpot, dtype=np.float64), (customers, 12))
+    
+    return bill_horizon(usage, production, higherTariffPercent, permittedPower, months, usedOnSpot, tariff, para)
+
+
+class PeriodicBills:
+    """
+    Closed form of the horizon: usage and production repeat every year, only the escalation changes.
+    
+    Every bill is a + b * (1 + PERCENT_COST_INCREASE) ** year, with a and b worked out once per calendar month
+    (and once more for January to March of the first year, before the excess cycle settles in).
+    Any horizon and its totals then cost O(12), however many years it spans.
+    
+    Amounts here are the bills before int() truncation, so they can differ from bill_horizon by
+    less than 1 RSD per bill.
+    """
+    
+    def __init__(self, usage, production, higherTariffPercent=0.85, permittedPower=11.4, usedOnSpot=None, tariff=None):
+        """Same arguments as bill_horizon, leading (customer) dimensions are supported too."""
+        t = tariff or load_tariff()
+        usage = np.trunc(np.asarray(usage, dtype=np.float64)).astype(np.int64)
+        production = np.trunc(np.asarray(production, dtype=np.float64)).astype(np.int64)
+        higherTariffPercent = np.asarray(higherTariffPercent, dtype=np.float64)
+        permittedPower = np.asarray(permittedPower, dtype=np.float64)
+        if usedOnSpot is not None:
+            usedOnSpot = np.asarray(usedOnSpot, dtype=np.float64)
+        
+        taxes = (1 + t.excise_tax_percent) * (1 + t.vat_tax_percent)
+        fixed = (permittedPower * t.permitted_power_cost_per_unit + t.guaranteed_supplier_cost)[..., None]
+        
+        # Ubill
+        h = higherTariffPercent[..., None]
+        zones = np.moveaxis(t.split(usage), -1, 0)
+        energy = sum(t.zone_charges([kwh * h for kwh in zones], [kwh * (1 - h) for kwh in zones], 1, _ubill_low_rates(t)).values())
+        fees = usage * (t.beneficial_supplier_subsidy_fee + t.energy_efficiency_fee)
+        
+        self.ubill_a = (fixed + fees) * taxes + t.tv_tax
+        self.ubill_b = energy * taxes
+        
+        # SolarBill, first year and every year after it
+        first, following = _excess_cycle(usage, production)
+        self.solar_first_a, self.solar_first_b = self._solar_terms(
+            _solar_energy(usage, production, first, higherTariffPercent, usedOnSpot, t), fixed, taxes, t)
+        self.solar_a, self.solar_b = self._solar_terms(
+            _solar_energy(usage, production, following, higherTariffPercent, usedOnSpot, t), fixed, taxes, t)
+    
+    @staticmethod
+    def _solar_terms(energy, fixed, taxes, t):
+        escalated = (sum(_net_zone_charges(energy, t).values())
+                     + (energy["kwhImported"] - energy["netHigherUsage"]) * t.distributed_system_charge_per_kwh)
+        fees = energy["kwhExported"] * (t.beneficial_supplier_subsidy_fee + t.energy_efficiency_fee)
+        return (fixed + fees) * taxes + t.tv_tax, escalated * taxes
+    
+    def costs(self, year: int):
+        """Ubill and SolarBill amounts of the 12 months of one year (0 being the first), as float arrays."""
+        f = (1 + PERCENT_COST_INCREASE) ** year
+        if year == 0:
+            return self.ubill_a + self.ubill_b * f, self.solar_first_a + self.solar_first_b * f
+        return self.ubill_a + self.ubill_b * f, self.solar_a + self.solar_b * f
+    
+    def totals(self, months: int = 300):
+        """
+        Cumulative Ubill and SolarBill amounts over a horizon starting with a January, in O(12).
+        
+        Returns:
+            tuple: (ubill_total, solar_total), floats or arrays over the leading dimensions
+        """
+        # how many times each calendar month shows up in the horizon
+        occurrences = months // 12 + (np.arange(12) < months % 12)
+        
+        def geometric(n):
+            # sum of f ** year for year in range(n)
+            f = 1 + PERCENT_COST_INCREASE
+            return n if f == 1 else (f ** n - 1) / (f - 1)
+        
+        ubill_total = occurrences * self.ubill_a + geometric(occurrences) * self.ubill_b
+        
+        first = occurrences > 0
+        solar_total = (np.where(first, self.solar_first_a + self.solar_first_b, 0)
+                       + np.maximum(occurrences - 1, 0) * self.solar_a + (geometric(occurrences) - first) * self.solar_b)
+        
+        return ubill_total.sum(axis=-1), solar_total.sum(axis=-1)
@@ -1,9 +1,13 @@
 # layout.py (includes surfaces as a dictionary
 
 import json
+import os
 import requests
 import time
 
+# point this at a local pvgis_stub.py server to run without the real API
+PVGIS_BASE_URL = os.environ.get("PVGIS_BASE_URL", "https://re.jrc.ec.europa.eu/api")
+
 class Layout:
 
     # surface required keys
@@ -72,7 +76,7 @@ class Layout:
     def __str__(self):
         return f"total power = {self.total_power}, surfaces: " + str(self.surfaces)
     
-    def calculate_production(self, lat=44.0, lon=20.0):
+    def calculate_production(self, lat=44.0, lon=20.0, base_url=None):
         #resetting the values
         self.monthly_production = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0, 6: 0, 7: 0, 8: 0, 9: 0, 10: 0, 11: 0, 12: 0}
         self.annual_production = 0
@@ -81,7 +85,9 @@ class Layout:
         self.lat = lat
         self.lon = lon
         
-        api_base_url = "https://re.jrc.ec.europa.eu/api/PVcalc?loss=10&outputformat=json" + f"&lat={self.lat}&lon={self.lon}"
+        # base_url can point at a local pvgis_stub.py server
+        base_url = (base_url or PVGIS_BASE_URL).rstrip("/")
+        api_base_url = f"{base_url}/PVcalc?loss=10&outputformat=json" + f"&lat={self.lat}&lon={self.lon}"
         
         for surface in self.surfaces:
 